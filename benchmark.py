@@ -1,111 +1,326 @@
+"""
+Benchmark EATS on the targets and configurations of a suite file, see benchmark.ini.
+
+    python benchmark.py run benchmark.ini --out results/new.json
+    python benchmark.py compare results/old.json results/new.json
+
+`run` runs every configuration `repeats` times on every target, each run in its own process
+and working directory, and writes the wall time per phase, CPU seconds, peak memory,
+coverage and mutation score of every run to a JSON file. `compare` compares the mean of
+every metric between two result files with a Welch t confidence interval.
+"""
+import argparse
+import collections
+import configparser
+import datetime
 import json
+import math
 import os
-import eats.main
-from eats.utility import module_find
-from eats.Config import Config
+import platform
+import shutil
+import subprocess
+import sys
+import time
+import typing
+
+# Two-sided t quantiles by confidence level for 1 to 30 degrees of freedom, then the normal quantile.
+T_QUANTILES = {
+    0.90: [6.314, 2.920, 2.353, 2.132, 2.015, 1.943, 1.895, 1.860, 1.833, 1.812,
+           1.796, 1.782, 1.771, 1.761, 1.753, 1.746, 1.740, 1.734, 1.729, 1.725,
+           1.721, 1.717, 1.714, 1.711, 1.708, 1.706, 1.703, 1.701, 1.699, 1.697, 1.645],
+    0.95: [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+           2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+           2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042, 1.960],
+    0.99: [63.657, 9.925, 5.841, 4.604, 4.032, 3.707, 3.499, 3.355, 3.250, 3.169,
+           3.106, 3.055, 3.012, 2.977, 2.947, 2.921, 2.898, 2.878, 2.861, 2.845,
+           2.831, 2.819, 2.807, 2.797, 2.787, 2.779, 2.771, 2.763, 2.756, 2.750, 2.576],
+}
+# Metrics where a lower value is an improvement; phase wall times are lower-is-better as well.
+LOWER_IS_BETTER = {'wall_time', 'cpu_seconds', 'container_cpu_seconds', 'peak_memory', 'host_peak_rss'}
 
-from lxml import etree
 
-def collect_report_data(path, report_folder):
-    data = {}
+def collect_report_data(path: str, report_folder: str) -> typing.Dict[str, typing.Optional[float]]:
+    """
+    Read the coverage and mutation score of a report, None for a missing report.
+    """
+    data = {'coverage': None, 'mutation_score': None}
     path_to_coverage = os.path.join(path, report_folder, "cov_report", "coverage.json")
-    data["coverage"] = json.load(open(path_to_coverage))["totals"]["percent_covered"]
+    if os.path.exists(path_to_coverage):
+        with open(path_to_coverage) as f:
+            data["coverage"] = json.load(f)["totals"]["percent_covered"]
 
     path_to_mutmut = os.path.join(path, report_folder, "mutmut_report.json")
-    data["mutation_score"] = json.load(open(path_to_mutmut))["arithmetic_mean_killed"]
+    if os.path.exists(path_to_mutmut):
+        with open(path_to_mutmut) as f:
+            data["mutation_score"] = json.load(f)["arithmetic_mean_killed"]
+    return data
+
 
+def collect_trace_data(trace_path: typing.Optional[str]) -> typing.Dict[str, typing.Any]:
+    """
+    Read the wall time of every phase and the CPU time and peak memory of the containers
+    from the trace of a run.
+
+    The wall time of a phase runs from the start of its first step to the end of its last,
+    so phases running next to each other overlap.
+    """
+    from eats.Trace import read_trace
+
+    data = {'phases': {}, 'container_cpu_seconds': None, 'peak_memory': None}
+    if not trace_path or not os.path.exists(trace_path):
+        return data
+    spans = read_trace(trace_path)
+    by_phase = collections.defaultdict(list)
+    for span in spans:
+        by_phase[span['phase']].append(span)
+    for phase, phase_spans in sorted(by_phase.items()):
+        data['phases'][phase] = round(max(s['end'] for s in phase_spans) - min(s['start'] for s in phase_spans), 3)
+    sampled = [s for s in spans if s.get('cpu_seconds') is not None]
+    if sampled:
+        data['container_cpu_seconds'] = round(sum(s['cpu_seconds'] for s in sampled), 3)
+        data['peak_memory'] = max(s['peak_mem'] for s in sampled)
     return data
 
-def collect_benchmark_data_flutils():
-    config = Config()
-    TARGET_PROGRAM_ROOT = "./targets/flutils"
-    config.TARGET_PROGRAM_ROOT = TARGET_PROGRAM_ROOT
-    config.MAX_WORKERS = 10
-    config.working_dir = "benchmark_flutils2"
-    modules_to_test = ["flutils/**/*.py"]
-    ignore_modules = ["**/__*.py"]
-    max_modules_to_test = 300
-    config.max_pynguin_search_time_first_search = 1200 # 300 + 300 + 600
-    config.max_pynguin_iterations_first_search = 1000000
-    config.imprve_with_fuzzing = False
-    config.max_pynguin_search_time_second_search = 300
-    config.max_pynguin_iterations_second_search = 1000000
-    config.max_mutmut_time = 1200
-    config.max_fuzz_time = 600
-    config.max_fuzz_iterations = 100000000
-
-    modules_to_test = [os.path.join(TARGET_PROGRAM_ROOT, x) for x in modules_to_test if x.strip()]
-    ignore_modules = [os.path.join(TARGET_PROGRAM_ROOT, x) for x in ignore_modules if x.strip()]
-    modules = module_find(TARGET_PROGRAM_ROOT, modules_to_test, ignore_modules)[:max_modules_to_test]
-    if len(modules) == 0:
-        print("No modules to test")
-        return
-    config.module_names = modules
-
-    if not config.working_dir.startswith("/"):
-        config.working_dir = os.path.abspath(config.working_dir)
-
-    eats.main.main(config=config)
-
-    config.max_pynguin_search_time_first_search = 300
-    config.max_pynguin_iterations_first_search = 1000000
-    config.imprve_with_fuzzing = True
-    config.working_dir = "benchmark_flutils_fuzzing2"
-    if not config.working_dir.startswith("/"):
-        config.working_dir = os.path.abspath(config.working_dir)
-    eats.main.main(config=config)
-
-    result = {"project": "flutils", "hash": "***"}
-    result["pynguin"] = collect_report_data("benchmark_flutils2", "report1")
-    result["pynguin+atheris"] = collect_report_data("benchmark_flutils_fuzzing2", "report2")
-
-    return result
-
-def collect_benchmark_data_httpie():
-    config = Config()
-    TARGET_PROGRAM_ROOT = "./targets/cli"
-    config.TARGET_PROGRAM_ROOT = TARGET_PROGRAM_ROOT
-    config.MAX_WORKERS = 10
-    config.working_dir = "benchmark_httpie"
-    modules_to_test = ["httpie/**/*.py"]
-    ignore_modules = ["**/__*.py"]
-    max_modules_to_test = 300
-    config.max_pynguin_search_time_first_search = 1200 # 300 + 300 + 600
-    config.max_pynguin_iterations_first_search = 1000000
-    config.imprve_with_fuzzing = False
-    config.max_pynguin_search_time_second_search = 300
-    config.max_pynguin_iterations_second_search = 1000000
-    config.max_mutmut_time = 1200
-    config.max_fuzz_time = 600
-    config.max_fuzz_iterations = 100000000
-
-    modules_to_test = [os.path.join(TARGET_PROGRAM_ROOT, x) for x in modules_to_test if x.strip()]
-    ignore_modules = [os.path.join(TARGET_PROGRAM_ROOT, x) for x in ignore_modules if x.strip()]
-    modules = module_find(TARGET_PROGRAM_ROOT, modules_to_test, ignore_modules)[:max_modules_to_test]
-    if len(modules) == 0:
-        print("No modules to test")
-        return
-    config.module_names = modules
-
-    if not config.working_dir.startswith("/"):
-        config.working_dir = os.path.abspath(config.working_dir)
-
-    eats.main.main(config=config)
-
-    config.max_pynguin_search_time_first_search = 300
-    config.max_pynguin_iterations_first_search = 1000000
-    config.imprve_with_fuzzing = True
-    config.working_dir = "benchmark_httpie_fuzzing"
-    if not config.working_dir.startswith("/"):
-        config.working_dir = os.path.abspath(config.working_dir)
-    eats.main.main(config=config)
-
-    result = {"project": "httpie", "hash": "***"}
-    result["pynguin"] = collect_report_data("benchmark_httpie", "report1")
-    result["pynguin+atheris"] = collect_report_data("benchmark_httpie_fuzzing", "report2")
-
-    return result
+
+def read_suite(path: str) -> typing.Tuple[int, typing.Dict[typing.Tuple[str, str], typing.Dict[str, str]]]:
+    """
+    Read a suite file.
+
+    Returns:
+        Tuple[int, Dict]: Number of repeats, and the options of every (target, configuration) pair.
+    """
+    suite = configparser.ConfigParser()
+    if not suite.read(path):
+        raise FileNotFoundError(path)
+    targets = {s.split(':', 1)[1]: s for s in suite.sections() if s.startswith('target:')}
+    configurations = {s.split(':', 1)[1]: s for s in suite.sections() if s.startswith('config:')}
+    if not targets or not configurations:
+        raise ValueError(f"{path} needs at least one [target:NAME] and one [config:NAME] section")
+    cases = {}
+    for target, target_section in targets.items():
+        for configuration, config_section in configurations.items():
+            options = dict(suite.defaults())
+            options.update({k: v for k, v in suite.items(target_section, raw=True)})
+            options.update({k: v for k, v in suite.items(config_section, raw=True)})
+            options.pop('repeats', None)
+            cases[(target, configuration)] = options
+    return suite['DEFAULT'].getint('repeats', 1), cases
+
+
+def _git_commit(path: str) -> typing.Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=path, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _write_results(results: typing.Dict[str, typing.Any], path: str) -> None:
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(results, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def run_once(options: typing.Dict[str, str], working_dir: str) -> typing.Dict[str, typing.Any]:
+    """
+    Run EATS once in a new process with the options of a case.
+
+    Returns:
+        Dict[str, Any]: Metrics of the run.
+    """
+    from eats.Trace import latest_trace
+
+    if os.path.exists(working_dir):
+        shutil.rmtree(working_dir)
+    os.makedirs(working_dir)
+    case_ini = os.path.join(working_dir, "benchmark_case.ini")
+    case = configparser.ConfigParser()
+    case.read_dict({'DEFAULT': dict(options, working_dir=working_dir)})
+    with open(case_ini, 'w') as f:
+        case.write(f)
+
+    start = time.time()
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), 'exec', case_ini])
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    wall_time = time.time() - start
+
+    host_cpu_seconds = usage.ru_utime + usage.ru_stime
+    report = "report2" if case['DEFAULT'].getboolean('improve_with_fuzzing', True) else "report1"
+    metrics = {
+        'exit_code': process.returncode,
+        'wall_time': round(wall_time, 3),
+        'host_cpu_seconds': round(host_cpu_seconds, 3),
+        'host_peak_rss': usage.ru_maxrss * 1024,
+    }
+    metrics.update(collect_trace_data(latest_trace(os.path.join(working_dir, "logs"))))
+    metrics['cpu_seconds'] = round(host_cpu_seconds + (metrics['container_cpu_seconds'] or 0), 3)
+    metrics.update(collect_report_data(working_dir, report))
+    return metrics
+
+
+def run_suite(suite_path: str, out_path: str, runs_dir: str, repeats: int=0) -> None:
+    """
+    Run every case of a suite `repeats` times and write the results to out_path after every run.
+    """
+    suite_repeats, cases = read_suite(suite_path)
+    repeats = repeats or suite_repeats
+    with open(suite_path) as f:
+        suite_text = f.read()
+    results = {
+        'suite': suite_text,
+        'started': datetime.datetime.now().isoformat(timespec='seconds'),
+        'eats_commit': _git_commit(os.path.dirname(os.path.abspath(__file__))),
+        'host': {'node': platform.node(), 'cpus': os.cpu_count(), 'python': platform.python_version()},
+        'repeats': repeats,
+        'targets': {},
+        'runs': [],
+    }
+    for (target, configuration), options in cases.items():
+        results['targets'][target] = _git_commit(options['target_program_root'])
+        for k in range(repeats):
+            working_dir = os.path.abspath(os.path.join(runs_dir, target, configuration, f"run_{k}"))
+            print(f"Running {configuration} on {target} ({k + 1}/{repeats})", flush=True)
+            metrics = run_once(options, working_dir)
+            results['runs'].append({'target': target, 'configuration': configuration, 'repeat': k,
+                                    'working_dir': working_dir, **metrics})
+            _write_results(results, out_path)
+            if metrics['exit_code'] != 0:
+                print(f"  exited with {metrics['exit_code']}", flush=True)
+
+
+def _metric_values(results: typing.Dict[str, typing.Any]) -> typing.Dict[typing.Tuple[str, str, str], typing.List[float]]:
+    values = collections.defaultdict(list)
+    for run in results['runs']:
+        if run['exit_code'] != 0:
+            continue
+        case = (run['target'], run['configuration'])
+        for metric in ('wall_time', 'cpu_seconds', 'peak_memory', 'coverage', 'mutation_score'):
+            if run.get(metric) is not None:
+                values[case + (metric,)].append(run[metric])
+        for phase, wall_time in run['phases'].items():
+            values[case + (f"phase:{phase}",)].append(wall_time)
+    return values
+
+
+def _mean_var(values: typing.List[float]) -> typing.Tuple[float, float]:
+    mean = sum(values) / len(values)
+    if len(values) < 2:
+        return mean, math.nan
+    return mean, sum((v - mean) ** 2 for v in values) / (len(values) - 1)
+
+
+def t_quantile(df: float, confidence: float) -> float:
+    table = T_QUANTILES[confidence]
+    if df > 120:
+        return table[-1]
+    return table[min(max(int(df), 1), 30) - 1]
+
+
+def welch_interval(a: typing.List[float], b: typing.List[float], confidence: float) \
+        -> typing.Tuple[float, typing.Optional[float], typing.Optional[float]]:
+    """
+    Confidence interval of mean(b) - mean(a) without assuming equal variances.
+
+    Returns:
+        Tuple[float, float, float]: Difference of the means, and the low and high end of the
+        interval, None if either side has fewer than two values.
+    """
+    mean_a, var_a = _mean_var(a)
+    mean_b, var_b = _mean_var(b)
+    diff = mean_b - mean_a
+    if len(a) < 2 or len(b) < 2:
+        return diff, None, None
+    se_a, se_b = var_a / len(a), var_b / len(b)
+    se = math.sqrt(se_a + se_b)
+    if se == 0:
+        return diff, diff, diff
+    df = (se_a + se_b) ** 2 / (se_a ** 2 / (len(a) - 1) + se_b ** 2 / (len(b) - 1))
+    margin = t_quantile(df, confidence) * se
+    return diff, diff - margin, diff + margin
+
+
+def compare(base_path: str, new_path: str, confidence: float=0.95) -> typing.List[typing.Dict[str, typing.Any]]:
+    """
+    Compare every metric of the cases in both result files.
+
+    Returns:
+        List[Dict[str, Any]]: One row per target, configuration and metric, with the means,
+        the interval of their difference and a verdict: 'better', 'worse' or 'same' when
+        the interval contains 0.
+    """
+    with open(base_path) as f:
+        base = _metric_values(json.load(f))
+    with open(new_path) as f:
+        new = _metric_values(json.load(f))
+    rows = []
+    for key in sorted(base.keys() & new.keys()):
+        target, configuration, metric = key
+        diff, low, high = welch_interval(base[key], new[key], confidence)
+        verdict = 'unknown'
+        if low is not None:
+            lower_is_better = metric in LOWER_IS_BETTER or metric.startswith('phase:')
+            if low > 0 or high < 0:
+                verdict = 'better' if (high < 0) == lower_is_better else 'worse'
+            else:
+                verdict = 'same'
+        rows.append({'target': target, 'configuration': configuration, 'metric': metric,
+                     'base_mean': _mean_var(base[key])[0], 'new_mean': _mean_var(new[key])[0],
+                     'base_runs': len(base[key]), 'new_runs': len(new[key]),
+                     'diff': diff, 'low': low, 'high': high, 'verdict': verdict})
+    return rows
+
+
+def format_comparison(rows: typing.List[typing.Dict[str, typing.Any]], confidence: float) -> str:
+    lines = [f"{'target':<12} {'configuration':<18} {'metric':<24} {'base':>12} {'new':>12} "
+             f"{'change':>8} {f'{confidence:.0%} interval':>26}  verdict"]
+    for row in rows:
+        change = row['diff'] / row['base_mean'] if row['base_mean'] else math.nan
+        interval = 'n/a' if row['low'] is None else f"[{row['low']:.4g}, {row['high']:.4g}]"
+        lines.append(f"{row['target'][:12]:<12} {row['configuration'][:18]:<18} {row['metric'][:24]:<24} "
+                     f"{row['base_mean']:>12.4g} {row['new_mean']:>12.4g} {change:>+8.1%} {interval:>26}  "
+                     f"{row['verdict']}")
+    return "\n".join(lines)
+
+
+def exec_case(case_ini: str) -> int:
+    """
+    Run EATS with the options of a case file written by run_once.
+    """
+    import eats.logging_config
+    import eats.main
+    from eats.Config import read_config
+
+    case = configparser.ConfigParser()
+    case.read(case_ini)
+    return eats.main.main(config=read_config(case['DEFAULT']))
+
 
 if __name__ == "__main__":
-    # print(collect_benchmark_data_flutils())
-    print(collect_benchmark_data_httpie())
+    parser = argparse.ArgumentParser(description="Benchmark EATS and compare benchmark results.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help="Run a benchmark suite")
+    run_parser.add_argument('suite', help="Suite file, see benchmark.ini")
+    run_parser.add_argument('--out', help="Results file to write",
+                            default=f"benchmark_results/{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    run_parser.add_argument('--runs-dir', help="Folder of the working directories of the runs", default="benchmark_runs")
+    run_parser.add_argument('--repeats', type=int, default=0, help="Override the repeats of the suite")
+    compare_parser = commands.add_parser('compare', help="Compare two results files")
+    compare_parser.add_argument('base', help="Results before the change")
+    compare_parser.add_argument('new', help="Results after the change")
+    compare_parser.add_argument('--confidence', type=float, choices=sorted(T_QUANTILES), default=0.95)
+    compare_parser.add_argument('--json', help="Also write the comparison to this file", default='')
+    exec_parser = commands.add_parser('exec', help=argparse.SUPPRESS)
+    exec_parser.add_argument('case')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        run_suite(args.suite, args.out, args.runs_dir, args.repeats)
+    elif args.command == 'compare':
+        rows = compare(args.base, args.new, args.confidence)
+        print(format_comparison(rows, args.confidence))
+        if args.json:
+            _write_results({'base': args.base, 'new': args.new, 'confidence': args.confidence, 'rows': rows}, args.json)
+    else:
+        sys.exit(exec_case(args.case))
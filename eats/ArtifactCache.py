@@ -0,0 +1,213 @@
+import ast
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import typing
+import uuid
+
+from eats.utility import hash_file, hash_paths
+
+
+class ArtifactCache:
+    """
+    Local content-addressed cache of phase outputs.
+
+    An entry is keyed by the source of the module, the sources of the target modules it
+    imports (transitively), the phase, the phase parameters, the hash of the phase inputs
+    and the image digest. On a hit the cached output is copied into the working directory
+    instead of running a container. Least recently used entries are evicted once the
+    cache exceeds max_bytes.
+
+    Attributes:
+        cache_dir (str): Directory of the cache.
+        max_bytes (int): Maximum size of the cache in bytes, 0 for no limit.
+        target_program_root (str): Path to the target program root.
+        image_id (str): Digest of the Docker image running the phases.
+        hits (int): Number of cache hits.
+        misses (int): Number of cache misses.
+    """
+
+    cache_dir: str
+    max_bytes: int
+    target_program_root: str
+    image_id: str
+    hits: int
+    misses: int
+
+    def __init__(self, cache_dir: str, max_bytes: int, target_program_root: str, image_id: str):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.target_program_root = target_program_root
+        self.image_id = image_id
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._closure_hashes: typing.Dict[str, str] = {}
+        os.makedirs(os.path.join(cache_dir, 'entries'), exist_ok=True)
+
+    def key(self, module: str, phase: str, params: typing.Dict[str, typing.Any],
+            inputs: typing.List[str]=()) -> str:
+        """
+        Compute the cache key of a phase of a module.
+
+        Args:
+            module (str): Name of the module.
+            phase (str): Name of the phase.
+            params (Dict[str, Any]): Parameters of the phase, e.g. seed, search time and iterations.
+            inputs (List[str], optional): Files or directories the phase reads. Defaults to ().
+
+        Returns:
+            str: Hex digest identifying the phase output.
+        """
+        hasher = hashlib.sha256()
+        hasher.update(json.dumps({
+            'module': module,
+            'phase': phase,
+            'params': params,
+            'image': self.image_id,
+            'closure': self._closure_hash(module),
+            'inputs': hash_paths(list(inputs)),
+        }, sort_keys=True).encode())
+        return hasher.hexdigest()
+
+    def restore(self, key: str, out_dir: str) -> bool:
+        """
+        Copy a cached phase output into the working directory.
+
+        Args:
+            key (str): Cache key.
+            out_dir (str): Output directory of the phase.
+
+        Returns:
+            bool: True on a cache hit.
+        """
+        entry = self._entry_dir(key)
+        if not os.path.exists(os.path.join(entry, 'meta.json')):
+            with self._lock:
+                self.misses += 1
+            return False
+        shutil.copytree(os.path.join(entry, 'data'), out_dir, dirs_exist_ok=True)
+        os.utime(entry)
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def store(self, key: str, out_dir: str) -> None:
+        """
+        Store the output of a phase and evict old entries if the cache is too large.
+
+        Args:
+            key (str): Cache key.
+            out_dir (str): Output directory of the phase.
+        """
+        if not os.path.isdir(out_dir):
+            return
+        entry = self._entry_dir(key)
+        tmp = os.path.join(self.cache_dir, 'tmp', uuid.uuid4().hex)
+        shutil.copytree(out_dir, os.path.join(tmp, 'data'))
+        size = sum(os.path.getsize(os.path.join(dirpath, f))
+                   for dirpath, _, files in os.walk(tmp) for f in files)
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump({'size': size, 'created': time.time()}, f)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        try:
+            os.replace(tmp, entry)
+        except OSError:
+            # Stored by another task in the meantime.
+            shutil.rmtree(tmp, ignore_errors=True)
+        self._evict()
+
+    def log_stats(self) -> None:
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0
+        logging.info(f"Artifact cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate)")
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, 'entries', key[:2], key)
+
+    def _evict(self) -> None:
+        if not self.max_bytes:
+            return
+        with self._lock:
+            entries = []
+            root = os.path.join(self.cache_dir, 'entries')
+            for prefix in os.listdir(root):
+                for key in os.listdir(os.path.join(root, prefix)):
+                    entry = os.path.join(root, prefix, key)
+                    try:
+                        with open(os.path.join(entry, 'meta.json')) as f:
+                            size = json.load(f)['size']
+                        entries.append((os.path.getmtime(entry), size, entry))
+                    except (OSError, ValueError, KeyError):
+                        continue
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+                logging.info(f"Artifact cache evicted {os.path.basename(entry)[:10]}")
+
+    def _closure_hash(self, module: str) -> str:
+        with self._lock:
+            if module in self._closure_hashes:
+                return self._closure_hashes[module]
+        hasher = hashlib.sha256()
+        for path in sorted(self._import_closure(module)):
+            hasher.update(os.path.relpath(path, self.target_program_root).encode())
+            hash_file(hasher, path)
+        digest = hasher.hexdigest()
+        with self._lock:
+            self._closure_hashes[module] = digest
+        return digest
+
+    def _import_closure(self, module: str) -> typing.Set[str]:
+        """
+        Find the source files of a module and of every target module it imports.
+
+        Args:
+            module (str): Name of the module.
+
+        Returns:
+            Set[str]: Paths to the source files.
+        """
+        seen = set()
+        pending = [module]
+        while pending:
+            name = pending.pop()
+            path = self._module_path(name)
+            if path is None or path in seen:
+                continue
+            seen.add(path)
+            if '.' in name:
+                pending.append(name.rpartition('.')[0])
+            try:
+                with open(path, 'rb') as f:
+                    tree = ast.parse(f.read())
+            except (OSError, SyntaxError, ValueError):
+                continue
+            package = name if path.endswith('__init__.py') else name.rpartition('.')[0]
+            for node in ast.walk(tree):
+                if isinstance(node, ast.Import):
+                    pending += [alias.name for alias in node.names]
+                elif isinstance(node, ast.ImportFrom):
+                    base = node.module or ''
+                    if node.level:
+                        parts = package.split('.') if package else []
+                        parts = parts[:len(parts) - node.level + 1]
+                        base = '.'.join(parts + ([base] if base else []))
+                    if base:
+                        pending.append(base)
+                    pending += [f"{base}.{alias.name}" if base else alias.name for alias in node.names]
+        return seen
+
+    def _module_path(self, module: str) -> typing.Optional[str]:
+        base = os.path.join(self.target_program_root, *module.split('.'))
+        for path in (base + '.py', os.path.join(base, '__init__.py')):
+            if os.path.isfile(path):
+                return path
+        return None
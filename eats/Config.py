@@ -1,5 +1,9 @@
+import configparser
+import os
 import typing
 
+from eats.ModuleIndex import ModuleIndex
+
 
 class Config:
     TARGET_PROGRAM_ROOT: str
@@ -7,6 +11,10 @@ class Config:
 
     working_dir: str
     module_names: typing.List[str]
+    # Kind of every matched module dropped for having nothing to test, by name.
+    skipped_modules: typing.Dict[str, str] = {}
+
+    skip_untestable_modules: bool = True
 
     max_pynguin_search_time_first_search: int
     max_pynguin_iterations_first_search: int
@@ -18,5 +26,138 @@ class Config:
 
     max_fuzz_time: int
     max_fuzz_iterations: int
+    fuzz_harnesses_per_container: int = 1
+    fuzz_plateau_time: int = 0
+    fuzz_budget: int = 0
+    fuzz_max_cases: int = 0
+    fuzz_decode_workers: int = 1
+
+    improve_with_fuzzing: bool = True
+
+    container_pool_size: int = 0
+    container_pool_max_jobs: int = 50
+
+    max_log_bytes: int = 0
+    log_backup_count: int = 0
+
+    docker_buildkit: bool = False
+
+    artifact_cache_dir: str = ''
+    artifact_cache_max_bytes: int = 0
+
+    mutmut_skip_uncovered: bool = False
+
+    coverage_shards: int = 1
+
+    batch_transform: bool = False
+
+    format_generated_code: bool = False
+
+    resource_admission: bool = False
+    resource_sampling: bool = False
+    resource_cpus: float = 0
+    resource_mem_bytes: int = 0
+    resource_limits: bool = False
+    resource_profile: str = ''
+
+    execution_backend: str = 'docker'
+    local_backend_dir: str = '.eats_local'
+    local_python: str = ''
+
+    coordinator_address: str = ''
+    coordinator_authkey: str = ''
+    worker_heartbeat_timeout: int = 60
+    worker_backend: str = 'docker'
+    worker_slots: int = 0
+    worker_dir: str = '.eats_worker'
+
+    resume: bool = False
+
+    task_type_limits: typing.Dict[str, int] = {}
+
+
+def read_config(section: configparser.SectionProxy) -> Config:
+    """
+    Read a configuration from a section of eats.ini or of a benchmark suite, and find the
+    modules to test.
+
+    Args:
+        section (configparser.SectionProxy): Section holding the options.
+
+    Returns:
+        Config: Configuration object.
+
+    Raises:
+        KeyError, ValueError: If a required option is missing or not a number.
+    """
+    config = Config()
+    config.TARGET_PROGRAM_ROOT = section['TARGET_PROGRAM_ROOT']
+    config.MAX_WORKERS = int(section['MAX_WORKERS'])
+    config.working_dir = section.get('working_dir', '')
+    modules_to_test = section.get('modules_to_test', '').split(',')
+    ignore_modules = section.get('ignore_modules', '').split(',')
+    max_modules_to_test = int(section['max_modules_to_test'])
+    config.skip_untestable_modules = section.getboolean('skip_untestable_modules', True)
+    config.max_pynguin_search_time_first_search = int(section['max_pynguin_search_time_first_search'])
+    config.max_pynguin_iterations_first_search = int(section['max_pynguin_iterations_first_search'])
+    config.max_pynguin_search_time_second_search = int(section['max_pynguin_search_time_second_search'])
+    config.max_pynguin_iterations_second_search = int(section['max_pynguin_iterations_second_search'])
+    config.max_mutmut_time = int(section['max_mutmut_time'])
+    config.max_fuzz_time = int(section['max_fuzz_time'])
+    config.max_fuzz_iterations = int(section['max_fuzz_iterations'])
+    config.fuzz_harnesses_per_container = section.getint('fuzz_harnesses_per_container', 1)
+    config.fuzz_plateau_time = section.getint('fuzz_plateau_time', 0)
+    config.fuzz_budget = section.getint('fuzz_budget', 0)
+    config.fuzz_max_cases = section.getint('fuzz_max_cases', 0)
+    config.fuzz_decode_workers = section.getint('fuzz_decode_workers', 1)
+    # imprve_with_fuzzing is the misspelt key read by older versions.
+    config.improve_with_fuzzing = section.getboolean('improve_with_fuzzing',
+                                                     section.getboolean('imprve_with_fuzzing', True))
+    config.container_pool_size = section.getint('container_pool_size', 0)
+    config.container_pool_max_jobs = section.getint('container_pool_max_jobs', 50)
+    config.max_log_bytes = section.getint('max_log_bytes', 0)
+    config.log_backup_count = section.getint('log_backup_count', 0)
+    config.docker_buildkit = section.getboolean('docker_buildkit', False)
+    config.artifact_cache_dir = section.get('artifact_cache_dir', '').strip()
+    config.artifact_cache_max_bytes = section.getint('artifact_cache_max_bytes', 0)
+    config.mutmut_skip_uncovered = section.getboolean('mutmut_skip_uncovered', False)
+    config.coverage_shards = section.getint('coverage_shards', 1)
+    config.batch_transform = section.getboolean('batch_transform', False)
+    config.format_generated_code = section.getboolean('format_generated_code', False)
+    config.resource_admission = section.getboolean('resource_admission', False)
+    config.resource_sampling = section.getboolean('resource_sampling', False)
+    config.resource_cpus = section.getfloat('resource_cpus', 0)
+    config.resource_mem_bytes = section.getint('resource_mem_bytes', 0)
+    config.resource_limits = section.getboolean('resource_limits', False)
+    config.resource_profile = section.get('resource_profile', '').strip()
+    config.execution_backend = section.get('execution_backend', 'docker').strip()
+    config.local_backend_dir = section.get('local_backend_dir', '.eats_local').strip()
+    config.local_python = section.get('local_python', '').strip()
+    config.coordinator_address = section.get('coordinator_address', '').strip()
+    config.coordinator_authkey = section.get('coordinator_authkey', '').strip()
+    config.worker_heartbeat_timeout = section.getint('worker_heartbeat_timeout', 60)
+    config.worker_backend = section.get('worker_backend', 'docker').strip()
+    config.worker_slots = section.getint('worker_slots', 0)
+    config.worker_dir = section.get('worker_dir', '.eats_worker').strip()
+    config.task_type_limits = {}
+    for entry in section.get('task_type_limits', '').split(','):
+        if entry.strip():
+            task_type, _, limit = entry.partition(':')
+            config.task_type_limits[task_type.strip()] = int(limit)
+    if config.execution_backend not in ('docker', 'local', 'remote'):
+        raise ValueError(f"Unknown execution_backend {config.execution_backend}, expected docker, local or remote")
+    if config.worker_backend not in ('docker', 'local'):
+        raise ValueError(f"Unknown worker_backend {config.worker_backend}, expected docker or local")
+    if config.execution_backend == 'remote' and not (config.coordinator_address and config.coordinator_authkey):
+        raise ValueError("execution_backend remote needs coordinator_address and coordinator_authkey")
 
-    imprve_with_fuzzing: bool
+    modules_to_test = [os.path.join(config.TARGET_PROGRAM_ROOT, x) for x in modules_to_test if x.strip()]
+    ignore_modules = [os.path.join(config.TARGET_PROGRAM_ROOT, x) for x in ignore_modules if x.strip()]
+    index = ModuleIndex(config.TARGET_PROGRAM_ROOT, modules_to_test, ignore_modules)
+    if config.skip_untestable_modules:
+        config.module_names = index.testable()[:max_modules_to_test]
+        config.skipped_modules = index.untestable()
+    else:
+        config.module_names = index.names()[:max_modules_to_test]
+        config.skipped_modules = {}
+    return config
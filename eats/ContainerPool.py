@@ -0,0 +1,240 @@
+import logging
+import os
+import shlex
+import threading
+import time
+import typing
+import uuid
+
+import docker
+
+from eats.DockerClient import get_docker_client
+from eats.DockerUtility import DockerContainerConfig
+from eats.ExecutionBackend import ExecutionBackend
+from eats.LogCapture import follow_file
+
+HOST_MOUNT = '/eats_host'
+
+
+class PooledJob:
+    """
+    A job running on a pooled worker container through `exec`.
+
+    Provides the subset of the docker Container interface used by `wait_for_container`.
+
+    Attributes:
+        id (str): ID of the job.
+        event_id (str): ID of the exec, reported by `exec_die` events.
+        status (str): 'running' while the job runs, 'exited' afterwards.
+        worker (docker.models.containers.Container): Worker container running the job.
+        scratch_dir (str): Host path of the scratch directory of the job.
+        dirty (bool): Whether the worker may have been left in an unclean state.
+    """
+
+    id: str
+    event_id: str
+    status: str
+    worker: docker.models.containers.Container
+    scratch_dir: str
+    dirty: bool
+
+    def __init__(self, pool: "ContainerPool", worker: docker.models.containers.Container,
+                 job_id: str, exec_id: str, scratch_dir: str):
+        self.id = job_id
+        self.status = 'running'
+        self.worker = worker
+        self.scratch_dir = scratch_dir
+        self.dirty = False
+        self._pool = pool
+        self.event_id = exec_id
+        self._exit_code = None
+        self._exited = threading.Event()
+
+    def reload(self) -> None:
+        info = self.worker.client.api.exec_inspect(self.event_id)
+        if not info['Running']:
+            self.status = 'exited'
+            self._exit_code = info['ExitCode']
+            self._exited.set()
+
+    def logs(self, stream: bool=False, follow: bool=False) -> typing.Union[bytes, typing.Iterator[bytes]]:
+        log_path = os.path.join(self.scratch_dir, 'output.log')
+        if stream:
+            return follow_file(log_path, self._exited, follow)
+        if not os.path.exists(log_path):
+            return b''
+        with open(log_path, 'rb') as f:
+            return f.read()
+
+    def wait(self) -> dict:
+        self.reload()
+        while self.status == 'running':
+            time.sleep(1)
+            self.reload()
+        return {'StatusCode': self._exit_code}
+
+    def stop(self) -> None:
+        # Kill every process of the worker except its init process.
+        self.worker.exec_run(['bash', '-c', 'kill -KILL -1'])
+        self.dirty = True
+
+    def remove(self) -> None:
+        self.worker.exec_run(['rm', '-rf', HOST_MOUNT + self.scratch_dir])
+        self._pool.release(self.worker, self.dirty or self._exit_code != 0)
+
+
+class ContainerPool(ExecutionBackend):
+    """
+    Pool of long-lived worker containers that run jobs through `exec_run` instead of
+    starting a new container for every task.
+
+    Every worker mounts the host roots under HOST_MOUNT. A job gets its own scratch
+    directory below scratch_root; /workplace is replaced by a symlink to it and each
+    volume of the job is symlinked into place, so the job sees the same layout as a
+    fresh container. Read-only volume modes are not enforced for pooled jobs.
+    A worker is recycled after max_jobs_per_worker jobs or once a job on it failed
+    or was stopped.
+
+    Attributes:
+        imageid (str): ID of the Docker image of the workers.
+        host_roots (List[str]): Host directories mounted into every worker.
+        scratch_root (str): Host directory for the scratch directories of the jobs.
+        max_jobs_per_worker (int): Number of jobs after which a worker is recycled.
+        max_idle_workers (int): Maximum number of idle workers kept alive.
+    """
+
+    imageid: str
+    host_roots: typing.List[str]
+    scratch_root: str
+    max_jobs_per_worker: int
+    max_idle_workers: int
+
+    def __init__(self, imageid: str, host_roots: typing.List[str], scratch_root: str,
+                 max_jobs_per_worker: int=50, max_idle_workers: int=16):
+        for root in host_roots:
+            assert root.startswith('/'), f"Host root {root} must be absolute path."
+        self.imageid = imageid
+        self.host_roots = [os.path.normpath(root) for root in host_roots]
+        self.scratch_root = os.path.normpath(scratch_root)
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_idle_workers = max_idle_workers
+        self._lock = threading.Lock()
+        self._idle: typing.List[docker.models.containers.Container] = []
+        self._jobs_done: typing.Dict[str, int] = {}
+        self._workers: typing.Dict[str, docker.models.containers.Container] = {}
+        os.makedirs(self.scratch_root, exist_ok=True)
+
+    def accepts(self, docker_config: DockerContainerConfig) -> bool:
+        """
+        Check whether a task can run on a pooled worker.
+
+        Args:
+            docker_config (DockerContainerConfig): Configuration of the task.
+
+        Returns:
+            bool: True if the task can run on a pooled worker.
+        """
+        if not docker_config.reusable or not docker_config.detach or docker_config.imageid != self.imageid:
+            return False
+        if not self._under_roots(self.scratch_root):
+            return False
+        return all(self._under_roots(path) and volume['bind'].startswith('/workplace/')
+                   for path, volume in docker_config.volumes.items())
+
+    def run(self, docker_config: DockerContainerConfig, limits=None) -> PooledJob:
+        """
+        Run a task on a pooled worker. Pooled jobs are not limited.
+
+        Args:
+            docker_config (DockerContainerConfig): Configuration of the task.
+            limits (ResourceRequest, optional): Ignored. Defaults to None.
+
+        Returns:
+            PooledJob: The running job.
+        """
+        worker = self._acquire()
+        job_id = uuid.uuid4().hex
+        scratch_dir = os.path.join(self.scratch_root, job_id)
+        exec_id = worker.client.api.exec_create(
+            worker.id,
+            ['bash', '-c', self._job_script(docker_config, scratch_dir)],
+            environment=docker_config.environment,
+        )['Id']
+        worker.client.api.exec_start(exec_id, detach=True)
+        return PooledJob(self, worker, job_id, exec_id, scratch_dir)
+
+    def release(self, worker: docker.models.containers.Container, dirty: bool) -> None:
+        """
+        Return a worker to the pool after a job.
+
+        Args:
+            worker (docker.models.containers.Container): Worker container.
+            dirty (bool): Whether the job may have left the worker in an unclean state.
+        """
+        with self._lock:
+            keep = False
+            if worker.id in self._jobs_done:
+                self._jobs_done[worker.id] += 1
+                keep = not dirty and self._jobs_done[worker.id] < self.max_jobs_per_worker \
+                    and len(self._idle) < self.max_idle_workers
+            if keep:
+                self._idle.append(worker)
+            else:
+                self._workers.pop(worker.id, None)
+                self._jobs_done.pop(worker.id, None)
+        if not keep:
+            logging.info(f"Recycling pool worker {worker.id[:10]}")
+            worker.remove(force=True)
+
+    def shutdown(self) -> None:
+        """
+        Remove every worker of the pool.
+        """
+        with self._lock:
+            workers = list(self._workers.values())
+            self._workers.clear()
+            self._idle.clear()
+            self._jobs_done.clear()
+        for worker in workers:
+            try:
+                worker.remove(force=True)
+            except docker.errors.APIError as e:
+                logging.warning(f"Failed to remove pool worker {worker.id[:10]}: {e}")
+
+    def _acquire(self) -> docker.models.containers.Container:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        worker = get_docker_client().containers.run(
+            self.imageid,
+            command=['sleep', 'infinity'],
+            volumes={root: {'bind': HOST_MOUNT + root, 'mode': 'rw'} for root in self.host_roots},
+            labels={'eats.pool': 'worker'},
+            detach=True,
+        )
+        logging.info(f"Started pool worker {worker.id[:10]}")
+        with self._lock:
+            self._workers[worker.id] = worker
+            self._jobs_done[worker.id] = 0
+        return worker
+
+    def _under_roots(self, path: str) -> bool:
+        path = os.path.normpath(path)
+        return any(path == root or path.startswith(root + '/') for root in self.host_roots)
+
+    @staticmethod
+    def _job_script(docker_config: DockerContainerConfig, scratch_dir: str) -> str:
+        workplace = HOST_MOUNT + scratch_dir + '/workplace'
+        lines = [
+            'rm -rf /workplace',
+            f'mkdir -p {shlex.quote(workplace)}',
+            f'ln -s {shlex.quote(workplace)} /workplace',
+        ]
+        for host_path, volume in docker_config.volumes.items():
+            source = shlex.quote(HOST_MOUNT + os.path.normpath(host_path))
+            target = shlex.quote(volume['bind'])
+            lines += [f'mkdir -p {source} "$(dirname {target})"',
+                      f'ln -sfn {source} {target}']
+        lines += ['cd /workplace',
+                  f'exec {docker_config.command} > {shlex.quote(HOST_MOUNT + scratch_dir)}/output.log 2>&1']
+        return '\n'.join(lines)
@@ -0,0 +1,223 @@
+import logging
+import threading
+import time
+import typing
+
+import docker
+
+MAX_POOL_SIZE = 32
+
+_client = None
+_event_watcher = None
+_timer_wheel = None
+_lock = threading.Lock()
+
+
+def get_docker_client() -> docker.DockerClient:
+    """
+    Get the process-wide Docker client.
+
+    The client keeps at most MAX_POOL_SIZE connections to the daemon.
+
+    Returns:
+        docker.DockerClient: Shared Docker client.
+    """
+    global _client
+    with _lock:
+        if _client is None:
+            _client = docker.from_env(max_pool_size=MAX_POOL_SIZE)
+        return _client
+
+
+def get_event_watcher() -> "ContainerEventWatcher":
+    """
+    Get the process-wide container event watcher, starting it on first use.
+
+    Returns:
+        ContainerEventWatcher: Shared event watcher.
+    """
+    global _event_watcher
+    with _lock:
+        if _event_watcher is None:
+            _event_watcher = ContainerEventWatcher()
+            _event_watcher.start()
+        return _event_watcher
+
+
+def get_timer_wheel() -> "TimerWheel":
+    """
+    Get the process-wide timer wheel, starting it on first use.
+
+    Returns:
+        TimerWheel: Shared timer wheel.
+    """
+    global _timer_wheel
+    with _lock:
+        if _timer_wheel is None:
+            _timer_wheel = TimerWheel()
+            _timer_wheel.start()
+        return _timer_wheel
+
+
+class ContainerEventWatcher:
+    """
+    Follow a single Docker `events()` stream and wake the tasks waiting for a
+    container or an exec to finish.
+
+    Waiters register the ID of a container (woken on `die`) or of an exec (woken on
+    `exec_die`). After the stream is reconnected every waiter is woken, so events
+    missed in between are picked up when the waiters reload their container.
+    """
+
+    def __init__(self):
+        self._waiters: typing.Dict[str, typing.List[threading.Event]] = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="docker-events", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def register(self, event_id: str, event=None) -> threading.Event:
+        """
+        Register a waiter for a container or exec.
+
+        Args:
+            event_id (str): ID of the container or exec.
+            event (optional): Object whose `set` method is called when the container or exec
+                dies, e.g. a waiter on an event loop. Defaults to a new threading.Event.
+
+        Returns:
+            threading.Event: Event set when the container or exec dies.
+        """
+        event = event or threading.Event()
+        with self._lock:
+            self._waiters.setdefault(event_id, []).append(event)
+        return event
+
+    def unregister(self, event_id: str, event: threading.Event) -> None:
+        with self._lock:
+            waiters = self._waiters.get(event_id, [])
+            if event in waiters:
+                waiters.remove(event)
+            if not waiters:
+                self._waiters.pop(event_id, None)
+
+    def _wake(self, event_id: str) -> None:
+        with self._lock:
+            waiters = list(self._waiters.get(event_id, []))
+        for event in waiters:
+            event.set()
+
+    def _wake_all(self) -> None:
+        with self._lock:
+            waiters = [event for events in self._waiters.values() for event in events]
+        for event in waiters:
+            event.set()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                events = get_docker_client().events(decode=True, filters={'event': ['die', 'exec_die']})
+                self._wake_all()
+                for event in events:
+                    action = event.get('Action', event.get('status', ''))
+                    actor = event.get('Actor', {})
+                    if action.startswith('exec_die'):
+                        self._wake(actor.get('Attributes', {}).get('execID', ''))
+                    elif action == 'die':
+                        self._wake(actor.get('ID', event.get('id', '')))
+            except Exception as e:
+                logging.warning(f"Docker event stream interrupted: {e}")
+            time.sleep(1)
+
+
+class TimerHandle:
+    """
+    Handle of a timer scheduled on a TimerWheel.
+
+    Attributes:
+        callback (Callable): Callable run when the timer expires.
+        rounds (int): Remaining full turns of the wheel before the timer expires.
+        cancelled (bool): Whether the timer was cancelled.
+    """
+
+    callback: typing.Callable[[], None]
+    rounds: int
+    cancelled: bool
+
+    def __init__(self, callback, rounds):
+        self.callback = callback
+        self.rounds = rounds
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel running the timeouts of every task on one thread.
+
+    Timers are placed into one of `slots` buckets; the wheel advances one bucket per
+    `tick` seconds, so a timer fires up to one tick late.
+
+    Attributes:
+        tick (float): Resolution of the wheel in seconds.
+        slots (int): Number of buckets of the wheel.
+    """
+
+    tick: float
+    slots: int
+
+    def __init__(self, tick: float=1.0, slots: int=512):
+        self.tick = tick
+        self.slots = slots
+        self._buckets: typing.List[typing.List[TimerHandle]] = [[] for _ in range(slots)]
+        self._position = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="timer-wheel", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def schedule(self, delay: float, callback: typing.Callable[[], None]) -> TimerHandle:
+        """
+        Run a callback on the wheel thread after a delay.
+
+        Args:
+            delay (float): Delay in seconds.
+            callback (Callable): Callable run when the timer expires. Must not block.
+
+        Returns:
+            TimerHandle: Handle to cancel the timer.
+        """
+        ticks = max(1, int(-(-delay // self.tick)))
+        with self._lock:
+            handle = TimerHandle(callback, (ticks - 1) // self.slots)
+            self._buckets[(self._position + ticks) % self.slots].append(handle)
+        return handle
+
+    def _run(self) -> None:
+        next_tick = time.monotonic() + self.tick
+        while True:
+            time.sleep(max(0.0, next_tick - time.monotonic()))
+            next_tick += self.tick
+            expired = []
+            with self._lock:
+                self._position = (self._position + 1) % self.slots
+                bucket = self._buckets[self._position]
+                remaining = []
+                for handle in bucket:
+                    if handle.cancelled:
+                        continue
+                    if handle.rounds > 0:
+                        handle.rounds -= 1
+                        remaining.append(handle)
+                    else:
+                        expired.append(handle)
+                self._buckets[self._position] = remaining
+            for handle in expired:
+                try:
+                    handle.callback()
+                except Exception as e:
+                    logging.warning(f"Timer callback failed: {e}")
@@ -1,11 +1,31 @@
+import asyncio
+import concurrent.futures
+import configparser
+import copy
+import hashlib
 import logging
 import os
+import shutil
+import subprocess
+import tempfile
+import threading
 import time
 import typing
 
 import docker
 
 from eats.constant import PROJECT_ROOT
+from eats.DockerClient import get_docker_client, get_event_watcher, get_timer_wheel
+from eats.ExecutionBackend import DockerBackend, ExecutionBackend
+from eats.LogCapture import RotatingLogWriter, follow_logs
+from eats.ResourceScheduler import ResourceRequest, ResourceScheduler
+from eats.Trace import get_tracer
+from eats.utility import hash_paths
+
+LOG_DRAIN_TIMEOUT = 30
+BUILD_DIR = '.eats_build'
+# max_workers of an executor that should start a thread for every call waiting at once.
+UNBOUNDED_THREADS = 2 ** 16
 
 
 class DockerContainerConfig:
@@ -18,6 +38,10 @@ class DockerContainerConfig:
         environment (list): List of environment variables for the container.
         command (str): Command to run in the container.
         detach (bool): Whether to run the container in detached mode.
+        reusable (bool): Whether the task may run on a pooled worker container.
+        task_type (str): Type of the task (pynguin, mutmut, coverage, fuzz, ...), selecting its resource request.
+        resources (ResourceRequest): Resource request overriding the one of the task type, or None.
+        labels (dict): Module and harness of the task, recorded in the trace.
     """
 
     imageid: str
@@ -25,41 +49,209 @@ class DockerContainerConfig:
     environment: typing.List[str]
     command: str
     detach: bool
+    reusable: bool
+    task_type: str
+    resources: typing.Optional[ResourceRequest]
+    labels: typing.Dict[str, str]
     working_dir: str
 
-    def __init__(self, imageid, volumes, environment, command, detach=True):
+    def __init__(self, imageid, volumes, environment, command, detach=True, reusable=True,
+                 task_type='default', resources=None, labels=None):
         self.imageid = imageid
         self.volumes = volumes
         self.environment = environment
         self.command = command
         self.detach = detach
+        self.reusable = reusable
+        self.task_type = task_type
+        self.resources = resources
+        self.labels = labels or {}
 
 
 class ContainerTimeoutError(Exception):
     pass
 
 
-def build_docker_image(target_program_root: str, tag: str, log_path: typing.Optional[str]=None, nocache=False) \
-        -> typing.Tuple[docker.models.images.Image, str]:
+_container_pool = None
+
+
+def set_container_pool(pool) -> None:
+    """
+    Set the pool of worker containers used by `create_docker_container`.
+
+    Args:
+        pool (eats.ContainerPool.ContainerPool): Container pool, or None to start a new container per task.
+    """
+    global _container_pool
+    _container_pool = pool
+
+
+_execution_backend: ExecutionBackend = DockerBackend()
+
+
+def set_execution_backend(backend: typing.Optional[ExecutionBackend]) -> None:
+    """
+    Set the backend running the tasks of `create_docker_container` that the container pool
+    does not take.
+
+    Args:
+        backend (ExecutionBackend): Execution backend, or None to start a Docker container per task.
+    """
+    global _execution_backend
+    _execution_backend = backend or DockerBackend()
+
+
+class TaskLimits:
+    """
+    Bound the containers started by `start_docker_container` that run at once, overall and
+    per task type. A task waiting for its limits is a coroutine waiting on a semaphore.
+
+    Attributes:
+        max_tasks (int): Containers running at once, 0 for no limit.
+        per_type (Dict[str, int]): Containers of a task type running at once; task types
+            not listed are only bound by max_tasks.
+        start_executor (concurrent.futures.ThreadPoolExecutor): Executor starting the
+            admitted containers, with a thread for every container that may run.
+        log_executor (concurrent.futures.ThreadPoolExecutor): Executor following the output
+            of the running containers, with a thread for every running container.
+    """
+
+    max_tasks: int
+    per_type: typing.Dict[str, int]
+    start_executor: concurrent.futures.ThreadPoolExecutor
+    log_executor: concurrent.futures.ThreadPoolExecutor
+
+    def __init__(self, max_tasks: int=0, per_type: typing.Optional[typing.Dict[str, int]]=None):
+        self.max_tasks = max_tasks
+        self.per_type = dict(per_type or {})
+        self.start_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_tasks or None,
+                                                                    thread_name_prefix="container-start")
+        # A follower holds its thread until the container exits, so without an overall limit the
+        # executor must not cap the followers. Threads are started on demand and reused once idle.
+        self.log_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_tasks or UNBOUNDED_THREADS,
+                                                                  thread_name_prefix="container-logs")
+        self._semaphores: typing.Dict[str, asyncio.Semaphore] = {}
+
+    async def acquire(self, task_type: str) -> None:
+        acquired = []
+        try:
+            # The task type first, so a task waiting for a free slot of its type takes no overall slot.
+            for semaphore in self._semaphores_of(task_type):
+                await semaphore.acquire()
+                acquired.append(semaphore)
+        except BaseException:
+            for semaphore in acquired:
+                semaphore.release()
+            raise
+
+    def release(self, task_type: str) -> None:
+        for semaphore in self._semaphores_of(task_type):
+            semaphore.release()
+
+    def shutdown(self) -> None:
+        self.start_executor.shutdown(wait=False)
+        self.log_executor.shutdown(wait=False)
+
+    def _semaphores_of(self, task_type: str) -> typing.List[asyncio.Semaphore]:
+        semaphores = []
+        for key, limit in ((task_type, self.per_type.get(task_type, 0)), ('', self.max_tasks)):
+            if limit > 0:
+                if key not in self._semaphores:
+                    self._semaphores[key] = asyncio.Semaphore(limit)
+                semaphores.append(self._semaphores[key])
+        return semaphores
+
+
+_task_limits = TaskLimits()
+
+
+def set_task_limits(limits: typing.Optional[TaskLimits]) -> None:
+    """
+    Set the limits of the containers started by `start_docker_container`.
+
+    Args:
+        limits (TaskLimits): Task limits, or None for no limits.
+    """
+    global _task_limits
+    _task_limits = limits or TaskLimits()
+
+
+_resource_scheduler = None
+_spans = {}
+_held_limits = {}
+_spans_lock = threading.Lock()
+
+
+def set_resource_scheduler(scheduler: typing.Optional[ResourceScheduler]) -> None:
+    """
+    Set the scheduler admitting the containers started by `create_docker_container`.
+
+    Args:
+        scheduler (ResourceScheduler): Resource scheduler, or None to start containers right away.
+    """
+    global _resource_scheduler
+    _resource_scheduler = scheduler
+
+
+def build_docker_image(target_program_root: str, tag: str, log_path: typing.Optional[str]=None, nocache=False,
+                       buildkit=False) -> typing.Tuple[docker.models.images.Image, str]:
     """
     Build a Docker image from a Dockerfile.
 
+    The image is tagged with a hash of the target program, the docker scripts and the
+    requirements. If an image with that tag already exists, the build is skipped and
+    the existing image is tagged with `tag`.
+
     Args:
         target_program_root (str): Path to the target program root.
         tag (str, optional): Tag for the Docker image. Defaults to 'eats:latest'.
         log_path (str, optional): Path to the log file. Defaults to None.
+        nocache (bool, optional): Build without cache. Defaults to False.
+        buildkit (bool, optional): Build with BuildKit and a pip cache mount through the
+            docker CLI. Defaults to False.
 
     Returns:
         Tuple[docker.models.images.Image, str]: Built image and logs.
     """
-    image, logs = docker.from_env().images.build(
-        path=PROJECT_ROOT,
-        tag=tag,
-        dockerfile=os.path.join(PROJECT_ROOT, 'eats', 'docker_scripts', 'Dockerfile'),
-        rm=True,
-        buildargs={'TARGET_PROGRAM_ROOT': os.path.relpath(target_program_root, PROJECT_ROOT)},
-        nocache=nocache
-    )
+    client = get_docker_client()
+    requirements_path = _write_target_requirements(target_program_root)
+    build_hash = hash_paths([
+        target_program_root,
+        os.path.join(PROJECT_ROOT, 'eats', 'docker_scripts'),
+        os.path.join(PROJECT_ROOT, 'eats', 'docker_scripts_fuzzer'),
+        requirements_path,
+    ])
+    repository, _, version = tag.partition(':')
+    version = version or 'latest'
+    cache_tag = f"{repository}:build-{build_hash[:16]}" + ('-bk' if buildkit else '')
+
+    if not nocache:
+        try:
+            image = client.images.get(cache_tag)
+            image.tag(repository, version)
+            logging.info(f"Reusing image {cache_tag} for {tag}")
+            if log_path:
+                with open(log_path, "w") as f:
+                    f.write(f"Reused image {cache_tag}\n")
+            return image, []
+        except docker.errors.ImageNotFound:
+            pass
+
+    buildargs = {'TARGET_PROGRAM_ROOT': os.path.relpath(target_program_root, PROJECT_ROOT),
+                 'TARGET_REQUIREMENTS': os.path.relpath(requirements_path, PROJECT_ROOT)}
+    dockerfile = os.path.join(PROJECT_ROOT, 'eats', 'docker_scripts', 'Dockerfile')
+    if buildkit:
+        image, logs = _build_with_buildkit(dockerfile, cache_tag, buildargs, nocache)
+    else:
+        image, logs = client.images.build(
+            path=PROJECT_ROOT,
+            tag=cache_tag,
+            dockerfile=dockerfile,
+            rm=True,
+            buildargs=buildargs,
+            nocache=nocache
+        )
+    image.tag(repository, version)
     if log_path:
         with open(log_path, "w") as f:
             for line in logs:
@@ -67,74 +259,328 @@ def build_docker_image(target_program_root: str, tag: str, log_path: typing.Opti
     return image, logs
 
 
-def wait_for_container(container: docker.models.containers.Container, timeout: int, log_file_path: typing.Optional[str]=None) -> typing.Tuple[int, str]:
+def _write_target_requirements(target_program_root: str) -> str:
+    """
+    Write the dependencies of the target program to BUILD_DIR/<hash>/target_requirements.txt,
+    so the Dockerfile can install them before the source of the target is copied.
+
+    The folder is named by the hash of the requirements, so concurrent builds of other targets
+    do not overwrite the file, and builds of the same target write the same content.
+
+    Args:
+        target_program_root (str): Path to the target program root.
+
+    Returns:
+        str: Path to the requirements file.
+    """
+    requirements = []
+    setup_cfg = os.path.join(target_program_root, 'setup.cfg')
+    requirements_txt = os.path.join(target_program_root, 'requirements.txt')
+    if os.path.exists(setup_cfg):
+        parser = configparser.ConfigParser()
+        parser.read(setup_cfg)
+        install_requires = parser.get('options', 'install_requires', fallback='')
+        requirements = [line.strip() for line in install_requires.splitlines()]
+    elif os.path.exists(requirements_txt):
+        with open(requirements_txt) as f:
+            requirements = [line.strip() for line in f]
+    # Options and local paths are only resolvable next to the source of the target.
+    requirements = [line for line in requirements
+                    if line and not line.startswith(('#', '-', '.', '/'))]
+    content = "\n".join(requirements) + "\n"
+    build_dir = os.path.join(PROJECT_ROOT, BUILD_DIR, hashlib.sha256(content.encode()).hexdigest()[:16])
+    os.makedirs(build_dir, exist_ok=True)
+    path = os.path.join(build_dir, 'target_requirements.txt')
+    # Replaced atomically, so a concurrent build never reads a partly written file.
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+    with open(temp_path, 'w') as f:
+        f.write(content)
+    os.replace(temp_path, path)
+    return path
+
+
+def _build_with_buildkit(dockerfile: str, tag: str, buildargs: typing.Dict[str, str], nocache: bool) \
+        -> typing.Tuple[docker.models.images.Image, typing.List[str]]:
+    """
+    Build an image with BuildKit through the docker CLI, using a cache mount for pip.
+
+    Args:
+        dockerfile (str): Path to the Dockerfile.
+        tag (str): Tag for the Docker image.
+        buildargs (Dict[str, str]): Build arguments.
+        nocache (bool): Build without cache.
+
+    Returns:
+        Tuple[docker.models.images.Image, List[str]]: Built image and logs.
+    """
+    lines = ['# syntax=docker/dockerfile:1']
+    with open(dockerfile) as f:
+        source = f.read().splitlines()
+    for i, line in enumerate(source):
+        if line.startswith('RUN '):
+            end = i
+            while source[end].endswith('\\') and end + 1 < len(source):
+                end += 1
+            if any('pip install' in l for l in source[i:end + 1]):
+                line = 'RUN --mount=type=cache,target=/root/.cache/pip ' + line[len('RUN '):]
+        lines.append(line.replace('pip install --no-cache-dir', 'pip install'))
+    # A folder of its own per build, so concurrent builds do not overwrite each other's Dockerfile.
+    build_dir = tempfile.mkdtemp(prefix='eats-build-')
+    try:
+        buildkit_dockerfile = os.path.join(build_dir, 'Dockerfile.buildkit')
+        with open(buildkit_dockerfile, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+
+        command = ['docker', 'build', '-f', buildkit_dockerfile, '-t', tag]
+        for key, value in buildargs.items():
+            command += ['--build-arg', f'{key}={value}']
+        if nocache:
+            command.append('--no-cache')
+        command.append(PROJECT_ROOT)
+        result = subprocess.run(command, env={**os.environ, 'DOCKER_BUILDKIT': '1'},
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+    logs = result.stdout.splitlines()
+    if result.returncode != 0:
+        raise docker.errors.BuildError(f"docker build exited with {result.returncode}", logs)
+    return get_docker_client().images.get(tag), logs
+
+
+async def start_docker_container(docker_config: DockerContainerConfig) -> docker.models.containers.Container:
+    """
+    Start a container once the task limits admit its task type, see `create_docker_container`.
+
+    The task waits for its limits as a coroutine. Starting the container, which blocks while
+    the resource scheduler or the execution backend holds it back, runs on the start executor
+    of the task limits.
+
+    Args:
+        docker_config (DockerContainerConfig): Configuration object for the Docker container.
+
+    Returns:
+        docker.models.containers.Container: Docker container instance.
+    """
+    limits = _task_limits
+    # The queue wait of the span includes the wait for the task limits.
+    queued_at = time.time()
+    await limits.acquire(docker_config.task_type)
+    try:
+        container = await asyncio.get_running_loop().run_in_executor(limits.start_executor, create_docker_container,
+                                                                     docker_config, queued_at)
+    except BaseException:
+        limits.release(docker_config.task_type)
+        raise
+    with _spans_lock:
+        _held_limits[container.id] = (limits, docker_config.task_type)
+    return container
+
+
+async def wait_for_container(container: docker.models.containers.Container, timeout: int, log_file_path: typing.Optional[str]=None) \
+        -> typing.Tuple[int, typing.Optional[str], float]:
     """
     Wait for a Docker container to finish execution or timeout.
 
+    The waiting coroutine sleeps until the shared event watcher, or the watcher of a job
+    of another backend, reports that the container died or the shared timer wheel
+    reports the timeout, so a running container holds no thread besides the one following
+    its output into the log file.
+
     Args:
         container (docker.models.containers.Container): Docker container instance.
         timeout (int): Maximum wait time in seconds.
         log_file (str, optional): Path to the log file. Defaults to None.
 
     Returns:
-        Tuple[int, str]: Exit code and logs of the container.
+        Tuple[int, Optional[str], float]: Exit code, path to the log file and time used.
     """
+    loop = asyncio.get_running_loop()
+    start_time = time.time()
+    event_id = getattr(container, 'event_id', container.id)
+    watcher = getattr(container, 'watcher', None) or get_event_watcher()
+    died = _LoopWaiter(loop)
+    watcher.register(event_id, died)
+    timer = get_timer_wheel().schedule(timeout, died.expire)
+    follower = None
     if log_file_path:
-        os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
+        follower = asyncio.ensure_future(follow_logs(container, RotatingLogWriter(log_file_path),
+                                                     _task_limits.log_executor))
+    exit_code, status = None, None
+    try:
+        try:
+            # The container may have died before the waiter was registered.
+            await _blocking(container.reload)
+            while container.status == 'running':
+                await died.wait()
+                if died.expired:
+                    raise ContainerTimeoutError(f"Container {container.id[:10]} timed out after {timeout} seconds")
+                await _blocking(container.reload)
+        except ContainerTimeoutError:
+            status = 'timeout'
+            logging.warning(f"Container {container.id[:10]}, stopped due to timeout")
+            await _stop_container(container)
+        except (Exception, asyncio.CancelledError) as e:
+            logging.warning(f"Container {container.id[:10]}, stopped due to {e!r}")
+            await _stop_container(container)
+            raise
+        finally:
+            timer.cancel()
+            watcher.unregister(event_id, died)
 
-    start_time = time.time()
+        exit_code = (await _blocking(container.wait))['StatusCode']
+        if follower is not None:
+            _, pending = await asyncio.wait({follower}, timeout=LOG_DRAIN_TIMEOUT)
+            if pending:
+                logging.warning(f"Log capture of {container.id[:10]} did not finish in time")
+        await _blocking(container.remove)
+    finally:
+        if follower is not None and not follower.done():
+            follower.cancel()
+        # Whatever failed above, the task limits and resources of the container are released.
+        _container_finished(container, exit_code, status or ('ok' if exit_code == 0 else 'failed'))
+    return exit_code, log_file_path, time.time() - start_time
+
+
+async def _stop_container(container) -> None:
+    """
+    Stop a container, logging instead of raising if it is already gone or the daemon refuses.
+    """
     try:
-        while True:
-            container.reload()
-            if container.status != 'running':
-                break
-            if time.time() - start_time > timeout:
-                raise ContainerTimeoutError(f"Container {container.id[:10]} timed out after {timeout} seconds")
-            if log_file_path:
-                logs = container.logs()
-                with open(log_file_path, "w") as f:
-                    f.write(logs.decode())
-            time.sleep(5)
-    except ContainerTimeoutError:
-        container.stop()
-        logging.warning(f"Container {container.id[:10]}, stopped due to timeout")
-    except KeyboardInterrupt:
-        container.stop()
-        logging.warning(f"Container {container.id[:10]}, stopped due to KeyboardInterrupt")
-        raise
+        await _blocking(container.stop)
     except Exception as e:
-        container.stop()
-        logging.warning(f"Container {container.id[:10]}, stopped due to {e}")
-        raise e
+        logging.warning(f"Stopping container {container.id[:10]} failed: {e!r}")
 
-    exit_code = container.wait()['StatusCode']
-    logs = container.logs()
-    if log_file_path:
-        with open(log_file_path, "w") as f:
-            f.write(logs.decode())
-    container.remove()
-    return exit_code, logs, time.time() - start_time
+
+class _LoopWaiter:
+    """
+    Waiter of a coroutine, registered with a container watcher in place of a threading.Event.
+    `set` and `expire` may be called from any thread.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.expired = False
+        self._loop = loop
+        self._event = asyncio.Event()
+
+    def set(self) -> None:
+        try:
+            self._loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            pass  # The loop is closed
+
+    def expire(self) -> None:
+        self.expired = True
+        self.set()
+
+    async def wait(self) -> None:
+        await self._event.wait()
+        self._event.clear()
+
+
+def _blocking(fn: typing.Callable, *args) -> asyncio.Future:
+    """
+    Run a short blocking call, like a request to the Docker daemon, on the default executor.
+    """
+    return asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+def _container_finished(container, exit_code: typing.Optional[int], status: str) -> None:
+    """
+    Release the resources and the task limits of a finished container and record its span in the trace.
+    """
+    usage = None
+    if _resource_scheduler is not None:
+        usage = _resource_scheduler.finished(container)
+    with _spans_lock:
+        span = _spans.pop(container.id, None)
+        limits, task_type = _held_limits.pop(container.id, (None, None))
+    if limits is not None:
+        limits.release(task_type)
+    if span is not None:
+        span.exit_code = exit_code
+        if usage is not None:
+            span.cpu_seconds = usage.cpu_seconds
+            span.peak_mem = usage.peak_mem
+        get_tracer().finish(span, status)
 
 
-def create_docker_container(docer_config: DockerContainerConfig) -> docker.models.containers.Container:
+def create_docker_container(docer_config: DockerContainerConfig, queued_at: typing.Optional[float]=None) \
+        -> docker.models.containers.Container:
     """
     Create and run a Docker container based on the provided configuration.
+    The task runs on a pooled worker container instead if a pool is set and accepts it.
+    If a resource scheduler is set, the call blocks until the resources of the task are free.
+    Tasks on the event loop use `start_docker_container` instead.
+
+    The task gets the CPUs it may use in the cpu_share variable: the CPUs of its request if
+    a resource scheduler admitted it, otherwise the host CPUs divided by the containers the
+    task limits let run at once.
 
     Args:
         docker_config (DockerContainerConfig): Configuration object for the Docker container.
+        queued_at (float, optional): Time the task started waiting to be started, recorded as
+            the queue wait of its span. Defaults to now.
 
     Returns:
         docker.models.containers.Container: Docker container instance.
     """
 
-    for k in docer_config.volumes:
-        assert k.startswith('/'), f"Volume {k} must be absolute path. Got {k}"
-        
-    common_params = {
-        'volumes': docer_config.volumes,
-        'environment': docer_config.environment,
-        'command': docer_config.command,
-        'detach': docer_config.detach,
-    }
-    container = docker.from_env().containers.run(docer_config.imageid, **common_params)
+    scheduler = _resource_scheduler
+    admitted_at = time.time()
+    queued_at = queued_at or admitted_at
+    if scheduler is None:
+        container = _run_container(_with_cpu_share(docer_config, cpu_share(docer_config.task_type)))
+    else:
+        request = docer_config.resources or scheduler.request_for(docer_config.task_type)
+        scheduler.acquire(request)
+        admitted_at = time.time()
+        try:
+            container = _run_container(_with_cpu_share(docer_config, request.cpus),
+                                       request if scheduler.enforce_limits else None)
+        except BaseException:
+            scheduler.release(request)
+            raise
+        scheduler.started(container, docer_config.task_type, request)
+    module = docer_config.labels.get('module')
+    span = get_tracer().start(f"{docer_config.task_type}:{module}" if module else docer_config.task_type,
+                              docer_config.task_type, module, docer_config.labels.get('harness'),
+                              queue_wait=admitted_at - queued_at)
+    span.container_id = container.id
+    with _spans_lock:
+        _spans[container.id] = span
     return container
+
+
+def cpu_share(task_type: str) -> int:
+    """
+    CPUs a task of a type may use: the CPUs of its request if a resource scheduler is set,
+    otherwise the host CPUs divided by the containers the task limits let run at once.
+
+    Args:
+        task_type (str): Type of the task.
+
+    Returns:
+        int: Number of CPUs, at least 1.
+    """
+    if _resource_scheduler is not None:
+        cpus = _resource_scheduler.request_for(task_type).cpus
+    elif _task_limits.max_tasks:
+        cpus = os.cpu_count() / _task_limits.max_tasks
+    else:
+        cpus = os.cpu_count()
+    return max(1, int(cpus))
+
+
+def _with_cpu_share(docer_config: DockerContainerConfig, cpus: float) -> DockerContainerConfig:
+    """
+    Copy of the configuration with the CPUs the task may use in the cpu_share variable.
+    """
+    docer_config = copy.copy(docer_config)
+    docer_config.environment = list(docer_config.environment) + [f'cpu_share={max(1, int(cpus))}']
+    return docer_config
+
+
+def _run_container(docer_config: DockerContainerConfig, limits: typing.Optional[ResourceRequest]=None):
+    if _container_pool is not None and _container_pool.accepts(docer_config):
+        return _container_pool.run(docer_config, limits)
+    return _execution_backend.run(docer_config, limits)
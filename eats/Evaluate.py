@@ -1,45 +1,119 @@
+import asyncio
+import glob
 import logging
+import os
 import typing
-import concurrent.futures
 
-from eats.DockerUtility import (DockerContainerConfig, create_docker_container,
-                                wait_for_container)
+from eats.DockerUtility import DockerContainerConfig, start_docker_container, wait_for_container
 
 
-def create_cov_report(working_dir: str, timeout: int, out_folder: str, paths_to_tests: typing.List[str]) -> int:
+async def create_cov_report(working_dir: str, timeout: int, out_folder: str, paths_to_tests: typing.List[str],
+                            shards: int=1) -> int:
     """
-    Create a coverage report by running a Docker container.
+    Create a coverage report by running the tests in parallel Docker containers and
+    combining their coverage data.
 
     Args:
         working_dir (str): Working directory path.
         timeout (int, optional): Timeout in seconds.
         out_folder (str): Output folder name.
         paths_to_tests (typing.List[str]): List of paths to the tests.
+        shards (int, optional): Number of containers the test directories are split over. Defaults to 1.
 
     Returns:
-        int: Exit code of the container.
+        int: Exit code of the container combining the coverage data.
     """
-    volumes={
+    # Failing tests and failure counts of an earlier run of the shards, see filter_coverage.py.
+    for path in glob.glob(f'{working_dir}/{out_folder}/cov_data/failed_count.*'):
+        os.remove(path)
+    os.makedirs(f'{working_dir}/{out_folder}/share_data', exist_ok=True)
+    open(f'{working_dir}/{out_folder}/share_data/failed_tests.txt', 'w').close()
+    shard_volumes = _split_tests_into_shards(paths_to_tests, shards)
+    await _gather([_create_cov_report_shard(working_dir, timeout, out_folder, i, volumes)
+                   for i, volumes in enumerate(shard_volumes)])
+
+    container = await start_docker_container(DockerContainerConfig(
+        imageid="eats:latest",
+        volumes={
             f'{working_dir}/{out_folder}/cov_report': {'bind': '/workplace/cov_report', 'mode': 'rw'},
+            f'{working_dir}/{out_folder}/cov_data': {'bind': '/workplace/cov_data', 'mode': 'rw'},
+            f'{working_dir}/{out_folder}/share_data': {'bind': '/workplace/share_data', 'mode': 'ro'},
+        },
+        environment=[],
+        command='bash /usr/src/scripts/combine_cov_report.sh',
+        detach=True,
+        task_type='coverage',
+        labels={'module': out_folder, 'harness': 'combine'},
+    ))
+    logging.info("Running combine_cov_report, container.id: %s", container.id[:10])
+    exit_code, log_path, time_used = await wait_for_container(container, timeout, f"{working_dir}/logs/{out_folder}/cov_report/cov_report.log")
+    logging.info("create_cov_report exited with %d", exit_code)
+    return exit_code, log_path, time_used
+
+
+async def _gather(coroutines: typing.List[typing.Awaitable]) -> list:
+    """
+    Run coroutines concurrently and wait for all of them, then raise the first exception.
+    """
+    results = await asyncio.gather(*coroutines, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+def _split_tests_into_shards(paths_to_tests: typing.List[str], shards: int) -> typing.List[typing.Dict[str, typing.Dict[str, str]]]:
+    """
+    Split the test directories into shards, keeping the tests of a module together.
+
+    Every entry of a test path (a module folder) is mounted at the same place it has when
+    the whole path is mounted, so test ids are the same in every shard.
+
+    Args:
+        paths_to_tests (typing.List[str]): List of paths to the tests.
+        shards (int): Number of shards.
+
+    Returns:
+        List[Dict[str, Dict[str, str]]]: Test volumes of each non-empty shard.
+    """
+    entries = {}
+    for i, path in enumerate(paths_to_tests):
+        if not os.path.isdir(path):
+            continue
+        for name in os.listdir(path):
+            entries.setdefault(name, []).append((i, path))
+    shard_volumes = [{} for _ in range(max(1, shards))]
+    for k, name in enumerate(sorted(entries)):
+        for i, path in entries[name]:
+            shard_volumes[k % len(shard_volumes)][os.path.join(path, name)] = {'bind': f'/workplace/tests/{i}/{name}', 'mode': 'ro'}
+    return [volumes for volumes in shard_volumes if volumes] or [{}]
+
+
+async def _create_cov_report_shard(working_dir: str, timeout: int, out_folder: str, shard: int,
+                             test_volumes: typing.Dict[str, typing.Dict[str, str]]) -> int:
+    volumes={
+            f'{working_dir}/{out_folder}/cov_data': {'bind': '/workplace/cov_data', 'mode': 'rw'},
             f'{working_dir}/{out_folder}/share_data': {'bind': '/workplace/share_data', 'mode': 'rw'},
         }
-    for i, path in enumerate(paths_to_tests):
-        volumes[path] = {'bind': f'/workplace/tests/{i}', 'mode': 'ro'}
+    volumes.update(test_volumes)
 
-    container = create_docker_container(DockerContainerConfig(
+    container = await start_docker_container(DockerContainerConfig(
         imageid="eats:latest",
         volumes=volumes,
         environment=[],
         command='bash /usr/src/scripts/create_cov_report.sh',
         detach=True,
+        task_type='coverage',
+        labels={'module': out_folder, 'harness': f'shard_{shard}'},
     ))
-    logging.info("Running create_cov_report, container.id: %s", container.id[:10])
-    exit_code, log, time_used = wait_for_container(container, timeout, f"{working_dir}/logs/{out_folder}/cov_report/cov_report.log")
-    logging.info("create_cov_report exited with %d", exit_code)
-    return exit_code, log, time_used
+    logging.info("Running create_cov_report shard %d, container.id: %s", shard, container.id[:10])
+    exit_code, log_path, time_used = await wait_for_container(container, timeout, f"{working_dir}/logs/{out_folder}/cov_report/shard_{shard}.log")
+    logging.info("create_cov_report shard %d exited with %d, time_used: %.2f seconds", shard, exit_code, time_used)
+    return exit_code, log_path, time_used
 
 
-def evaluate_with_mutmut(module: str, working_dir: str, timeout: int, out_folder: str, paths_to_tests: typing.List[str]) -> int:
+async def evaluate_with_mutmut(module: str, working_dir: str, timeout: int, out_folder: str, paths_to_tests: typing.List[str],
+                         state_dir: typing.Optional[str]=None, skip_uncovered: bool=False) -> int:
     """
     Evaluate the module with mutmut by running a Docker container.
 
@@ -49,6 +123,10 @@ def evaluate_with_mutmut(module: str, working_dir: str, timeout: int, out_folder
         timeout (int, optional): Timeout in seconds. Defaults to 600 seconds.
         out_folder (str): Output folder name.
         paths_to_tests (typing.List[str]): List of paths to the tests.
+        state_dir (str, optional): Directory keeping the mutant verdicts of the module between runs.
+            Defaults to None.
+        skip_uncovered (bool, optional): Count mutants on lines not covered by the tests as survived
+            without running them. Needs the coverage report of out_folder. Defaults to False.
         
     Returns:
         int: Exit code of the container.
@@ -56,24 +134,29 @@ def evaluate_with_mutmut(module: str, working_dir: str, timeout: int, out_folder
 
     volumes={
             f'{working_dir}/{out_folder}/share_data': {'bind': '/workplace/share_data', 'mode': 'ro'},
+            f'{working_dir}/{out_folder}/cov_report': {'bind': '/workplace/cov_report', 'mode': 'ro'},
             f'{working_dir}/{out_folder}/mutmut_cache/{module}/mutmut_report': {'bind': '/workplace/mutmut_report', 'mode': 'rw'},
         }
     for i, path in enumerate(paths_to_tests):
         volumes[path] = {'bind': f'/workplace/tests/{i}', 'mode': 'ro'}
+    if state_dir:
+        volumes[state_dir] = {'bind': '/workplace/mutmut_state', 'mode': 'rw'}
 
-    container = create_docker_container(DockerContainerConfig(
+    container = await start_docker_container(DockerContainerConfig(
         imageid="eats:latest",
         volumes=volumes,
-        environment=[f'module_name={module}'],
+        environment=[f'module_name={module}', f'skip_uncovered={int(skip_uncovered)}'],
         command='bash /usr/src/scripts/evaluate_with_mutmut.sh',
         detach=True,
+        task_type='mutmut',
+        labels={'module': module, 'harness': out_folder},
     ))
     logging.info("Running mutmut: %s, container.id: %s", module, container.id[:10])
-    exit_code, log, time_used = wait_for_container(container, timeout, f"{working_dir}/logs/{out_folder}/mutmut/{module}.log")
+    exit_code, log_path, time_used = await wait_for_container(container, timeout, f"{working_dir}/logs/{out_folder}/mutmut/{module}.log")
     logging.info("mutmut %s exited with %d, time_used: %.2f seconds", module, exit_code, time_used)
-    return exit_code, log, time_used
+    return exit_code, log_path, time_used
 
-def report_mutmut_results(working_dir: str, timeout: int, modules: typing.List[str], src_dir: str) -> dict:
+async def report_mutmut_results(working_dir: str, timeout: int, modules: typing.List[str], src_dir: str) -> dict:
     """
     Report the mutmut results.
 
@@ -87,7 +170,7 @@ def report_mutmut_results(working_dir: str, timeout: int, modules: typing.List[s
         dict: Exit code, logs, and time used.
     """
 
-    container = create_docker_container(DockerContainerConfig(
+    container = await start_docker_container(DockerContainerConfig(
         imageid="eats:latest",
         volumes={
             f'{working_dir}/{src_dir}/mutmut_cache': {'bind': '/workplace/mutmut_cache', 'mode': 'ro'},
@@ -96,35 +179,10 @@ def report_mutmut_results(working_dir: str, timeout: int, modules: typing.List[s
         environment=[f'module_names={",".join(modules)}'],
         command='python /usr/src/scripts/report.py',
         detach=True,
+        task_type='report',
+        labels={'module': src_dir},
     ))
     logging.info("Running report_mutmut_results, container.id: %s", container.id[:10])
-    exit_code, log, time_used = wait_for_container(container, timeout, f"{working_dir}/logs/{src_dir}/report_mutmut_results.log")
+    exit_code, log_path, time_used = await wait_for_container(container, timeout, f"{working_dir}/logs/{src_dir}/report_mutmut_results.log")
     logging.info("report_mutmut_results exited with %d, time_used: %.2f seconds", exit_code, time_used)
-    return exit_code, log, time_used
-
-def create_reports(working_dir: str, modules: typing.List[str], paths_to_tests: typing.List[str], out_folder: str, timeout: int, max_workers: int=1) -> dict:
-    """
-    Create coverage report and evaluate with mutmut.
-    
-    Args:
-        working_dir (str): Working directory path.
-        modules (typing.List[str]): List of modules.
-        paths_to_tests (typing.List[str]): List of paths to the tests.
-        out_folder (str): Output folder name.
-        timeout (int, optional): Timeout in seconds.
-        max_workers (int, optional): Maximum number of workers. Defaults to 1.
-        
-    Returns:
-        dict: Exit code, logs, and time used."""
-    
-    create_cov_report(working_dir, timeout, out_folder, paths_to_tests)
-    with concurrent.futures.ThreadPoolExecutor(max_workers=int(max_workers)) as executor:
-        futures = [executor.submit(evaluate_with_mutmut,
-                                   module, working_dir,
-                                   timeout,
-                                   out_folder,
-                                   paths_to_tests)
-                   for module in modules]
-        concurrent.futures.wait(futures)
-        results = [future.result() for future in futures]
-    report_mutmut_results(working_dir, timeout, modules, out_folder)
\ No newline at end of file
+    return exit_code, log_path, time_used
@@ -0,0 +1,65 @@
+import typing
+
+from eats.DockerClient import get_docker_client
+
+
+class ExecutionBackend:
+    """
+    Runs the tasks started by `create_docker_container`.
+
+    `run` returns a job providing the subset of the docker Container interface used by
+    `wait_for_container`: id, status, reload, logs, wait, stop and remove. A job that is not
+    reported by the Docker event stream has a `watcher` with the register and unregister
+    methods of ContainerEventWatcher, waking its waiter when it exits.
+    """
+
+    def accepts(self, docker_config) -> bool:
+        """
+        Check whether a task can run on this backend.
+
+        Args:
+            docker_config (DockerContainerConfig): Configuration of the task.
+
+        Returns:
+            bool: True if the task can run on this backend.
+        """
+        return True
+
+    def run(self, docker_config, limits=None):
+        """
+        Start a task.
+
+        Args:
+            docker_config (DockerContainerConfig): Configuration of the task.
+            limits (ResourceRequest, optional): CPU and memory limit of the task. Defaults to None.
+
+        Returns:
+            The running job.
+        """
+        raise NotImplementedError
+
+    def shutdown(self) -> None:
+        """
+        Stop the jobs and workers the backend still holds.
+        """
+
+
+class DockerBackend(ExecutionBackend):
+    """
+    Start a new Docker container for every task.
+    """
+
+    def run(self, docker_config, limits=None):
+        for k in docker_config.volumes:
+            assert k.startswith('/'), f"Volume {k} must be absolute path. Got {k}"
+
+        common_params: typing.Dict[str, typing.Any] = {
+            'volumes': docker_config.volumes,
+            'environment': docker_config.environment,
+            'command': docker_config.command,
+            'detach': docker_config.detach,
+        }
+        if limits is not None:
+            common_params['nano_cpus'] = int(limits.cpus * 1e9)
+            common_params['mem_limit'] = limits.mem_bytes
+        return get_docker_client().containers.run(docker_config.imageid, **common_params)
@@ -1,10 +1,13 @@
+import asyncio
 import logging
+import typing
 
-from eats.DockerUtility import (DockerContainerConfig, create_docker_container,
-                                wait_for_container)
+from eats.ArtifactCache import ArtifactCache
+from eats.DockerUtility import DockerContainerConfig, start_docker_container, wait_for_container
 
 
-def create_test_with_pynguin(module: str, working_dir: str, maximum_search_time: int, maximum_iterations: int) -> int:
+async def create_test_with_pynguin(module: str, working_dir: str, maximum_search_time: int, maximum_iterations: int,
+                             cache: typing.Optional[ArtifactCache]=None) -> int:
     """
     Create test cases for a module using Pynguin by running a Docker container.
 
@@ -13,20 +16,33 @@ def create_test_with_pynguin(module: str, working_dir: str, maximum_search_time:
         working_dir (str): Working directory path.
         maximum_search_time (int, optional): Maximum search time in seconds for Pynguin.
         maximum_iterations (int, optional): Maximum number of iterations for Pynguin.
+        cache (ArtifactCache, optional): Cache of phase outputs. Defaults to None.
 
     Returns:
         int: Exit code of the container.
     """
-    container = create_docker_container(DockerContainerConfig(
+    out_dir = f'{working_dir}/tests/pynguin_results/{module}'
+    if cache:
+        key = cache.key(module, "pynguin", {'seed': 1,
+                                            'maximum_search_time': maximum_search_time,
+                                            'maximum_iterations': maximum_iterations})
+        if await asyncio.to_thread(cache.restore, key, out_dir):
+            logging.info("pynguin %s restored from cache", module)
+            return 0
+    container = await start_docker_container(DockerContainerConfig(
         imageid="eats:latest",
-        volumes={f'{working_dir}/tests/pynguin_results/{module}': {'bind': '/workplace/pynguin-results', 'mode': 'rw'}},
+        volumes={out_dir: {'bind': '/workplace/pynguin-results', 'mode': 'rw'}},
         environment=[f'module_name={module}',
                      f'maximum_search_time={maximum_search_time}',
                      f'maximum_iterations={maximum_iterations}'],
         command='bash /usr/src/scripts/create_test_with_pynguin.sh',
         detach=True,
+        task_type='pynguin',
+        labels={'module': module},
     ))
     logging.info("Running pynguin: %s, container.id: %s", module, container.id[:10])
-    exit_code, log, time_used = wait_for_container(container, maximum_search_time + 300, f"{working_dir}/logs/pynguin/{module}.log")
+    exit_code, log_path, time_used = await wait_for_container(container, maximum_search_time + 300, f"{working_dir}/logs/pynguin/{module}.log")
     logging.info("pynguin %s exited with %s, time used: %.2f seconds", module, exit_code, time_used)
+    if cache and exit_code == 0:
+        await asyncio.to_thread(cache.store, key, out_dir)
     return exit_code
@@ -1,8 +1,12 @@
+import asyncio
+import json
 import logging
+import math
 import os
+import typing
 
-from eats.DockerUtility import (DockerContainerConfig, create_docker_container,
-                                wait_for_container)
+from eats.ArtifactCache import ArtifactCache
+from eats.DockerUtility import DockerContainerConfig, cpu_share, start_docker_container, wait_for_container
 
 
 class ImproveUseFuzzer:
@@ -18,13 +22,24 @@ class ImproveUseFuzzer:
         maximum_pynguin_iterations (int): The maximum number of Pynguin iterations.
         timeout (int): The timeout for the container.
         health (bool): The health of the module.
+        cache (ArtifactCache): Cache of phase outputs, or None.
+        format_code (bool): Whether the generated tests are formatted with black.
+        harnesses_per_container (int): Number of fuzz harnesses run by one container.
+        fuzz_plateau_time (int): Seconds without new coverage after which a harness is stopped, 0 to disable.
+        fuzz_budget (int): Harness seconds shared by all harnesses of the module, handed out by their
+            yield of new coverage. 0 runs every harness for max_fuzz_time.
+        fuzz_max_cases (int): Maximum number of fuzzed cases kept per test, 0 for no limit.
+        fuzz_decode_workers (int): Number of processes decoding the corpus of a harness.
         
     """
 
     def __init__(self, module: str, working_dir: str,
                      max_fuzz_time: int, max_fuzz_iterations: int,
                      maximum_pynguin_search_time: int, maximum_pynguin_iterations: int,
-                     timeout: int) -> None:
+                     timeout: int, cache: typing.Optional[ArtifactCache]=None,
+                     format_code: bool=False, harnesses_per_container: int=1,
+                     fuzz_plateau_time: int=0, fuzz_budget: int=0, fuzz_max_cases: int=0,
+                     fuzz_decode_workers: int=1) -> None:
         self.module = module
         self.working_dir = working_dir
         self.max_fuzz_time = max_fuzz_time
@@ -33,69 +48,185 @@ class ImproveUseFuzzer:
         self.maximum_pynguin_iterations = maximum_pynguin_iterations
         self.timeout = timeout
         self.health = True
+        self.cache = cache
+        self.format_code = format_code
+        self.harnesses_per_container = harnesses_per_container
+        self.fuzz_plateau_time = fuzz_plateau_time
+        self.fuzz_budget = fuzz_budget
+        self.fuzz_max_cases = fuzz_max_cases
+        self.fuzz_decode_workers = fuzz_decode_workers
+        self._fuzz_test_count = 0
 
-    def run_transform(self):
-        container = create_docker_container(DockerContainerConfig(
+    async def run_transform(self):
+        out_dir = f'{self.working_dir}/intermediate_steps/transform/{self.module}'
+        hit, key = await asyncio.to_thread(self._restore, "transform", {'format_code': self.format_code},
+                                           self._transform_inputs(), out_dir)
+        if hit:
+            return self._check_transform(0, None, 0)
+        container = await start_docker_container(DockerContainerConfig(
         imageid="eats:latest",
         volumes={f'{self.working_dir}/tests/pynguin_results/{self.module}': {'bind': '/workplace/tests', 'mode': 'ro'},
                  f'{self.working_dir}/intermediate_steps/transform/{self.module}': {'bind': '/workplace/tests_transformed', 'mode': 'rw'}},
-        environment=['PYTHONPATH=/usr/src'],
+        environment=['PYTHONPATH=/usr/src', f'format_code={int(self.format_code)}'],
         command='python /usr/src/scripts_fuzzer/transform.py',
+        task_type='transform',
+        labels={'module': self.module},
         ))
         logging.info(f"Running transform: {self.module}, container.id: {container.id[:10]}")
-        exit_code, log, time_used = wait_for_container(container, self.timeout, f"{self.working_dir}/logs/transform/{self.module}.log")
+        exit_code, log_path, time_used = await wait_for_container(container, self.timeout, f"{self.working_dir}/logs/transform/{self.module}.log")
         logging.info(f"transform {self.module} exited with {exit_code}")
+        await asyncio.to_thread(self._store, key, exit_code, out_dir)
+        return self._check_transform(exit_code, log_path, time_used)
+
+    def _transform_inputs(self) -> typing.List[str]:
+        return [f'{self.working_dir}/tests/pynguin_results/{self.module}']
+
+    def _check_transform(self, exit_code, log_path, time_used):
         if len(os.listdir(f'{self.working_dir}/intermediate_steps/transform/{self.module}')) == 0:
             logging.warning(f"No fuzz tests generated for {self.module}")
             self.health = False
-        return exit_code, log, time_used
+        return exit_code, log_path, time_used
+
+    def _restore(self, phase: str, params: dict, inputs: typing.List[str], out_dir: str) -> typing.Tuple[bool, str]:
+        """
+        Restore the output of a phase from the cache.
+
+        Args:
+            phase (str): Name of the phase.
+            params (dict): Parameters of the phase.
+            inputs (List[str]): Files or directories the phase reads.
+            out_dir (str): Output directory of the phase.
+
+        Returns:
+            Tuple[bool, str]: Whether the output was restored, and the cache key.
+        """
+        if not self.cache:
+            return False, ''
+        key = self.cache.key(self.module, phase, params, inputs)
+        if self.cache.restore(key, out_dir):
+            logging.info(f"{phase} {os.path.relpath(out_dir, self.working_dir)} restored from cache")
+            return True, key
+        return False, key
+
+    def _store(self, key: str, exit_code: int, out_dir: str) -> None:
+        if self.cache and exit_code == 0:
+            self.cache.store(key, out_dir)
     
-    def _fuzz_runner(self, fuzz_test):
-        def fuzz_runner():
-            container = create_docker_container(DockerContainerConfig(
+    def _fuzz_key(self, fuzz_test: str) -> typing.Tuple[bool, str]:
+        return self._restore("fuzz",
+                             {'test': fuzz_test,
+                              'max_fuzz_time': self.max_fuzz_time,
+                              'max_fuzz_iterations': self.max_fuzz_iterations,
+                              'fuzz_plateau_time': self.fuzz_plateau_time,
+                              'fuzz_budget': self.fuzz_budget,
+                              'fuzz_max_cases': self.fuzz_max_cases},
+                             [f'{self.working_dir}/intermediate_steps/transform/{self.module}/{fuzz_test}'],
+                             f'{self.working_dir}/intermediate_steps/fuzzed_results/{self.module}/{fuzz_test}')
+
+    def _fuzz_runner(self, fuzz_tests: typing.List[str], batch: int):
+        async def fuzz_runner():
+            pending = {}
+            for fuzz_test in fuzz_tests:
+                hit, key = await asyncio.to_thread(self._fuzz_key, fuzz_test)
+                if not hit:
+                    pending[fuzz_test] = key
+            if not pending:
+                return 0, None, 0
+            results_dir = f'{self.working_dir}/intermediate_steps/fuzzed_results/{self.module}'
+            os.makedirs(results_dir, exist_ok=True)
+            # The batch gets its share of the module budget.
+            budget = max(1, self.fuzz_budget * len(pending) // self._fuzz_test_count) if self.fuzz_budget else 0
+            # The harnesses run in rounds of `workers`; every harness may take 300 seconds to
+            # minimise and decode its corpus after fuzzing.
+            workers = min(len(pending), cpu_share('fuzz'))
+            rounds = math.ceil(len(pending) / workers)
+            timeout = budget + rounds * 300 if budget else rounds * (self.max_fuzz_time + 300)
+            container = await start_docker_container(DockerContainerConfig(
             imageid="eats:latest",
             volumes={f'{self.working_dir}/intermediate_steps/transform/{self.module}': {'bind': '/workplace/tests_transformed', 'mode': 'ro'},
-                    f'{self.working_dir}/intermediate_steps/fuzzed_results/{self.module}/{fuzz_test}': {'bind': '/workplace/fuzzed_results', 'mode': 'rw'}},
-            environment=['PYTHONPATH=/usr/src', f'atheris_runs={self.max_fuzz_iterations}', f'atheris_max_run_time={self.max_fuzz_time}', f'test_name={fuzz_test}'],
+                    results_dir: {'bind': '/workplace/fuzzed_results', 'mode': 'rw'}},
+            environment=['PYTHONPATH=/usr/src', f'atheris_runs={self.max_fuzz_iterations}', f'atheris_max_run_time={self.max_fuzz_time}',
+                         f'fuzz_plateau_time={self.fuzz_plateau_time}', f'fuzz_budget={budget}',
+                         f'fuzz_max_cases={self.fuzz_max_cases}', f'fuzz_decode_workers={self.fuzz_decode_workers}',
+                         f'fuzz_workers={workers}', f'test_names={",".join(pending)}'],
             command='python /usr/src/scripts_fuzzer/runfuzz.py',
+            task_type='fuzz',
+            labels={'module': self.module, 'harness': f'batch_{batch}'},
             ))
-            logging.info(f"Running fuzzed_results: {self.module}::{fuzz_test}, container.id: {container.id[:10]}")
-            exit_code, log, time_used = wait_for_container(container, self.max_fuzz_time  + 300, f"{self.working_dir}/logs/fuzzed_results/{self.module}/{fuzz_test}.log")
-            logging.info(f"fuzzed_results {self.module}::{fuzz_test} exited with {exit_code}")
-            return exit_code, log, time_used
+            logging.info(f"Running fuzzed_results: {self.module} batch {batch} ({len(pending)} harnesses), container.id: {container.id[:10]}")
+            exit_code, log_path, time_used = await wait_for_container(container, timeout, f"{self.working_dir}/logs/fuzzed_results/{self.module}/batch_{batch}.log")
+            logging.info(f"fuzzed_results {self.module} batch {batch} exited with {exit_code}")
+            reclaimed = 0
+            for fuzz_test, key in pending.items():
+                done = os.path.exists(os.path.join(results_dir, fuzz_test, f'{fuzz_test}.jsonl'))
+                await asyncio.to_thread(self._store, key, 0 if done else 1, os.path.join(results_dir, fuzz_test))
+                reclaimed += self._reclaimed_time(os.path.join(results_dir, fuzz_test, f'{fuzz_test}.stats.json'))
+            if reclaimed:
+                logging.info(f"fuzzed_results {self.module} batch {batch} stopped early on coverage plateaus, reclaimed {reclaimed:.0f} seconds")
+            return exit_code, log_path, time_used
         return fuzz_runner
         
+    @staticmethod
+    def _reclaimed_time(stats_path: str) -> float:
+        try:
+            with open(stats_path) as f:
+                return json.load(f).get('reclaimed', 0)
+        except (OSError, ValueError):
+            return 0
+
     def create_fuzz_runner(self) -> list:
         if not self.health:
             return []
-        fuzz_tests = [i for i in os.listdir(f'{self.working_dir}/intermediate_steps/transform/{self.module}') if i.endswith('.py')]
+        fuzz_tests = sorted(i for i in os.listdir(f'{self.working_dir}/intermediate_steps/transform/{self.module}') if i.endswith('.py'))
         if len(fuzz_tests) == 0:
             logging.warning(f"No fuzz tests found for {self.module}")
             self.health = False
             return []
-        return [self._fuzz_runner(fuzz_test) for fuzz_test in fuzz_tests]
+        self._fuzz_test_count = len(fuzz_tests)
+        size = max(1, self.harnesses_per_container)
+        return [self._fuzz_runner(fuzz_tests[i:i + size], i // size) for i in range(0, len(fuzz_tests), size)]
     
-    def run_recreation_results(self):
+    async def run_recreation_results(self):
         if not self.health:
             return 1, "No fuzz tests generated", 0
-        container = create_docker_container(DockerContainerConfig(
+        out_dir = f'{self.working_dir}/intermediate_steps/recreation_results/{self.module}'
+        hit, key = await asyncio.to_thread(self._restore, "recreation", {'format_code': self.format_code},
+                                           [f'{self.working_dir}/tests/pynguin_results/{self.module}',
+                                            f'{self.working_dir}/intermediate_steps/fuzzed_results/{self.module}'],
+                                           out_dir)
+        if hit:
+            return 0, None, 0
+        container = await start_docker_container(DockerContainerConfig(
             imageid="eats:latest",
             volumes={f'{self.working_dir}/tests/pynguin_results/{self.module}': {'bind': '/workplace/tests', 'mode': 'ro'},
                     f'{self.working_dir}/intermediate_steps/fuzzed_results/{self.module}': {'bind': '/workplace/tests_fuzzed_result', 'mode': 'ro'},
                     f'{self.working_dir}/intermediate_steps/recreation_results/{self.module}': {'bind': '/workplace/recreation_results', 'mode': 'rw'}},
             environment=[f'module_name={self.module}',  
-                        'PYTHONPATH=/usr/src'],
+                        'PYTHONPATH=/usr/src',
+                        f'format_code={int(self.format_code)}'],
             command='python /usr/src/scripts_fuzzer/RecreateTests.py',
+            task_type='recreation',
+            labels={'module': self.module},
         ))
         logging.info(f"Running recreation_results: {self.module}, container.id: {container.id[:10]}")
-        exit_code, log, time_used = wait_for_container(container, self.timeout, f"{self.working_dir}/logs/recreation_results/{self.module}.log")
+        exit_code, log_path, time_used = await wait_for_container(container, self.timeout, f"{self.working_dir}/logs/recreation_results/{self.module}.log")
         logging.info(f"recreation_results {self.module} exited with {exit_code}")
-        return exit_code, log, time_used
+        await asyncio.to_thread(self._store, key, exit_code, out_dir)
+        return exit_code, log_path, time_used
     
-    def run_pynguin(self):
+    async def run_pynguin(self):
         if not self.health:
             return 1, "No fuzz tests generated", 0
-        container = create_docker_container(DockerContainerConfig(
+        out_dir = f'{self.working_dir}/tests/finial_pynguin_results/{self.module}'
+        hit, key = await asyncio.to_thread(self._restore, "final_pynguin",
+                                           {'seed': 1,
+                                            'maximum_search_time': self.maximum_pynguin_search_time,
+                                            'maximum_iterations': self.maximum_pynguin_iterations},
+                                           [f'{self.working_dir}/intermediate_steps/recreation_results/{self.module}'],
+                                           out_dir)
+        if hit:
+            return 0, None, 0
+        container = await start_docker_container(DockerContainerConfig(
         imageid="eats:latest",
         volumes={f'{self.working_dir}/intermediate_steps/recreation_results/{self.module}': {'bind': '/workplace/recreation_results', 'mode': 'ro'},
                  f'{self.working_dir}/tests/finial_pynguin_results/{self.module}': {'bind': '/workplace/finial_pynguin_results', 'mode': 'rw'}},
@@ -104,8 +235,58 @@ class ImproveUseFuzzer:
                      f'maximum_iterations={self.maximum_pynguin_iterations}', 
                      'PYTHONPATH=/usr/src/project'],
         command='bash /usr/src/scripts_fuzzer/run_pynguin.sh',
+        task_type='pynguin',
+        labels={'module': self.module, 'harness': 'final'},
         ))
         logging.info(f"Running pynguin: {self.module}, container.id: {container.id[:10]}")
-        exit_code, log, time_used = wait_for_container(container, self.maximum_pynguin_search_time + 300, f"{self.working_dir}/logs/finial_pynguin_results/{self.module}.log")
+        exit_code, log_path, time_used = await wait_for_container(container, self.maximum_pynguin_search_time + 300, f"{self.working_dir}/logs/finial_pynguin_results/{self.module}.log")
         logging.info(f"finial_pynguin_results {self.module} exited with {exit_code}")
-        return exit_code, log, time_used
+        await asyncio.to_thread(self._store, key, exit_code, out_dir)
+        return exit_code, log_path, time_used
+
+
+async def run_transform_batch(fuzzers: typing.List[ImproveUseFuzzer], working_dir: str, timeout: int) -> tuple:
+    """
+    Run the transform step of several modules in a single Docker container.
+
+    The container parses every Pynguin test file once and spreads the files over a
+    process pool. Modules restored from the cache are left out of the container.
+
+    Args:
+        fuzzers (List[ImproveUseFuzzer]): Fuzzers of the modules.
+        working_dir (str): Working directory path.
+        timeout (int): Timeout in seconds.
+
+    Returns:
+        tuple: Exit code, log path and time used of the container.
+    """
+    pending = {}
+    for p in fuzzers:
+        hit, key = await asyncio.to_thread(p._restore, "transform", {'format_code': p.format_code}, p._transform_inputs(),
+                                           f'{working_dir}/intermediate_steps/transform/{p.module}')
+        if hit:
+            p._check_transform(0, None, 0)
+        else:
+            pending[p] = key
+    if not pending:
+        return 0, None, 0
+
+    os.makedirs(f'{working_dir}/intermediate_steps/transform', exist_ok=True)
+    container = await start_docker_container(DockerContainerConfig(
+        imageid="eats:latest",
+        volumes={f'{working_dir}/tests/pynguin_results': {'bind': '/workplace/tests', 'mode': 'ro'},
+                 f'{working_dir}/intermediate_steps/transform': {'bind': '/workplace/tests_transformed', 'mode': 'rw'}},
+        environment=['PYTHONPATH=/usr/src',
+                     f'module_names={",".join(p.module for p in pending)}',
+                     f'format_code={int(fuzzers[0].format_code)}'],
+        command='python /usr/src/scripts_fuzzer/transform.py',
+        task_type='transform',
+    ))
+    logging.info(f"Running transform of {len(pending)} modules, container.id: {container.id[:10]}")
+    exit_code, log_path, time_used = await wait_for_container(container, timeout, f"{working_dir}/logs/transform/batch.log")
+    logging.info(f"transform batch exited with {exit_code}, time_used: {time_used:.2f} seconds")
+    for p, key in pending.items():
+        os.makedirs(f'{working_dir}/intermediate_steps/transform/{p.module}', exist_ok=True)
+        await asyncio.to_thread(p._store, key, exit_code, f'{working_dir}/intermediate_steps/transform/{p.module}')
+        p._check_transform(exit_code, log_path, time_used)
+    return exit_code, log_path, time_used
@@ -0,0 +1,267 @@
+import hashlib
+import logging
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import typing
+import uuid
+
+from eats.constant import PROJECT_ROOT
+from eats.DockerUtility import DockerContainerConfig, _write_target_requirements
+from eats.ExecutionBackend import ExecutionBackend
+from eats.LogCapture import follow_file
+from eats.ResourceScheduler import ResourceRequest
+from eats.utility import hash_paths
+
+# ENV of the Dockerfile.
+CONTAINER_ENVIRONMENT = {
+    'PYTHONDONTWRITEBYTECODE': '1',
+    'PYTHONUNBUFFERED': '1',
+    'PYNGUIN_DANGER_AWARE': '1',
+    'PYTHONHASHSEED': '0',
+}
+MUTMUT_REQUIREMENT = 'git+https://github.com/garyforschool/mutmut.git'
+# Task types that modify the source of the target get their own copy of it.
+COPY_PROJECT_TASKS = {'mutmut'}
+CONTAINER_PATH_RE = re.compile(r'(?<![\w./-])/(usr/src|workplace)(?![\w.-])')
+VENV_MARKER = '.eats_build_hash'
+
+
+class LocalJob:
+    """
+    A task running as a local process group.
+
+    Provides the subset of the docker Container interface used by `wait_for_container`.
+
+    Attributes:
+        id (str): ID of the job.
+        status (str): 'running' while the job runs, 'exited' afterwards.
+        watcher (LocalBackend): Backend waking the waiters of the job when it exits.
+        scratch_dir (str): Scratch directory of the job.
+    """
+
+    id: str
+    status: str
+    scratch_dir: str
+
+    def __init__(self, backend: "LocalBackend", process: subprocess.Popen, job_id: str, scratch_dir: str):
+        self.id = job_id
+        self.status = 'running'
+        self.watcher = backend
+        self.scratch_dir = scratch_dir
+        self._process = process
+        self._exited = threading.Event()
+
+    def reload(self) -> None:
+        if self._process.poll() is not None:
+            self.status = 'exited'
+            self._exited.set()
+
+    def logs(self, stream: bool=False, follow: bool=False) -> typing.Union[bytes, typing.Iterator[bytes]]:
+        log_path = os.path.join(self.scratch_dir, 'output.log')
+        if stream:
+            return follow_file(log_path, self._exited, follow)
+        if not os.path.exists(log_path):
+            return b''
+        with open(log_path, 'rb') as f:
+            return f.read()
+
+    def wait(self) -> dict:
+        exit_code = self._process.wait()
+        self.reload()
+        return {'StatusCode': exit_code}
+
+    def stop(self) -> None:
+        try:
+            os.killpg(self._process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self._process.wait()
+        self.reload()
+
+    def remove(self) -> None:
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
+
+
+class LocalBackend(ExecutionBackend):
+    """
+    Run the tasks as local processes in a prepared virtualenv instead of Docker containers.
+
+    A task runs the same scripts as in the container. Its scratch directory takes the place
+    of the container file system: `workplace` stands in for /workplace and holds a symlink for
+    every volume, `src` stands in for /usr/src and links the docker scripts and the target
+    program. Paths below /workplace and /usr/src in the command and the environment of the
+    task are rewritten to the scratch directory, and the scripts read the workplace from the
+    WORKPLACE variable. The target program is put on the PYTHONPATH instead of being
+    installed, and task types in COPY_PROJECT_TASKS get their own copy of it.
+
+    Every task runs in its own process group, killed on timeout. Core dumps are disabled
+    and, if the task has limits, its address space is capped at its memory request.
+    Read-only volume modes and CPU limits are not enforced.
+
+    Attributes:
+        state_dir (str): Directory of the virtualenv and of the scratch directories.
+        target_program_root (str): Path to the target program root.
+        python (str): Interpreter the virtualenv is created with.
+    """
+
+    state_dir: str
+    target_program_root: str
+    python: str
+
+    def __init__(self, state_dir: str, target_program_root: str, python: str=''):
+        self.state_dir = os.path.abspath(state_dir)
+        self.target_program_root = os.path.abspath(target_program_root)
+        self.python = python or sys.executable
+        self.venv_dir = os.path.join(self.state_dir, 'venv')
+        self.scratch_root = os.path.join(self.state_dir, 'jobs')
+        self._lock = threading.Lock()
+        self._waiters: typing.Dict[str, typing.List[threading.Event]] = {}
+        self._jobs: typing.Dict[str, LocalJob] = {}
+        os.makedirs(self.scratch_root, exist_ok=True)
+
+    def prepare(self, log_path: typing.Optional[str]=None) -> str:
+        """
+        Create the virtualenv with the dependencies of the docker image, unless a virtualenv
+        with the same requirements exists.
+
+        Args:
+            log_path (str, optional): Path to the log file of the installation. Defaults to None.
+
+        Returns:
+            str: ID of the environment, changing with the requirements, the scripts and the target.
+        """
+        requirements = [os.path.join(PROJECT_ROOT, 'eats', 'docker_scripts', 'requirements.txt'),
+                        _write_target_requirements(self.target_program_root)]
+        if not os.path.exists(os.path.join(self.target_program_root, 'setup.cfg')) \
+                and os.path.exists(os.path.join(self.target_program_root, 'requirements.txt')):
+            requirements.append(os.path.join(self.target_program_root, 'requirements.txt'))
+        venv_hash = hashlib.sha256((hash_paths(requirements) + self.python).encode()).hexdigest()
+        environment_id = hash_paths([self.target_program_root,
+                                     os.path.join(PROJECT_ROOT, 'eats', 'docker_scripts'),
+                                     os.path.join(PROJECT_ROOT, 'eats', 'docker_scripts_fuzzer'),
+                                     ] + requirements)
+
+        marker = os.path.join(self.venv_dir, VENV_MARKER)
+        if os.path.exists(marker) and open(marker).read().strip() == venv_hash:
+            logging.info(f"Reusing virtualenv {self.venv_dir}")
+            return f"local-{environment_id}"
+
+        shutil.rmtree(self.venv_dir, ignore_errors=True)
+        commands = [[self.python, '-m', 'venv', self.venv_dir],
+                    [self._venv_python(), '-m', 'pip', 'install', MUTMUT_REQUIREMENT]]
+        commands += [[self._venv_python(), '-m', 'pip', 'install', '-r', path] for path in requirements]
+        log = open(log_path, 'w') if log_path else subprocess.DEVNULL
+        try:
+            for command in commands:
+                logging.info(f"Preparing virtualenv: {' '.join(command)}")
+                subprocess.run(command, stdout=log, stderr=subprocess.STDOUT, check=True)
+        finally:
+            if log_path:
+                log.close()
+        with open(marker, 'w') as f:
+            f.write(venv_hash + '\n')
+        return f"local-{environment_id}"
+
+    def run(self, docker_config: DockerContainerConfig, limits: typing.Optional[ResourceRequest]=None) -> LocalJob:
+        """
+        Start a task as a local process.
+
+        Args:
+            docker_config (DockerContainerConfig): Configuration of the task.
+            limits (ResourceRequest, optional): Memory limit of the task. Defaults to None.
+
+        Returns:
+            LocalJob: The running job.
+        """
+        job_id = uuid.uuid4().hex
+        scratch_dir = os.path.join(self.scratch_root, job_id)
+        workplace = os.path.join(scratch_dir, 'workplace')
+        src = os.path.join(scratch_dir, 'src')
+        os.makedirs(workplace)
+        os.makedirs(src)
+        os.symlink(os.path.join(PROJECT_ROOT, 'eats', 'docker_scripts'), os.path.join(src, 'scripts'))
+        os.symlink(os.path.join(PROJECT_ROOT, 'eats', 'docker_scripts_fuzzer'), os.path.join(src, 'scripts_fuzzer'))
+        if docker_config.task_type in COPY_PROJECT_TASKS:
+            shutil.copytree(self.target_program_root, os.path.join(src, 'project'), symlinks=True,
+                            ignore=shutil.ignore_patterns('.git'))
+        else:
+            os.symlink(self.target_program_root, os.path.join(src, 'project'))
+
+        for host_path, volume in docker_config.volumes.items():
+            assert host_path.startswith('/'), f"Volume {host_path} must be absolute path. Got {host_path}"
+            target = self._map_paths(volume['bind'], scratch_dir)
+            # Docker creates a missing bind source as a directory.
+            os.makedirs(host_path, exist_ok=True)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.symlink(host_path, target)
+
+        environment = dict(os.environ, **CONTAINER_ENVIRONMENT)
+        environment.pop('PYTHONPATH', None)
+        for entry in docker_config.environment:
+            key, _, value = entry.partition('=')
+            environment[key] = self._map_paths(value, scratch_dir)
+        environment['VIRTUAL_ENV'] = self.venv_dir
+        environment['PATH'] = os.path.join(self.venv_dir, 'bin') + os.pathsep + os.environ.get('PATH', '')
+        environment['PROJECT_ROOT'] = os.path.join(src, 'project')
+        environment['WORKPLACE'] = workplace
+        environment['PYTHONPATH'] = os.pathsep.join(
+            p for p in (environment.get('PYTHONPATH'), os.path.join(src, 'project')) if p)
+
+        script = ['ulimit -c 0']
+        if limits is not None:
+            script.append(f'ulimit -v {max(limits.mem_bytes // 1024, 1)}')
+        script.append(f'exec {self._map_paths(docker_config.command, scratch_dir)}')
+        with open(os.path.join(scratch_dir, 'output.log'), 'wb') as output:
+            process = subprocess.Popen(['bash', '-c', '\n'.join(script)], cwd=workplace, env=environment,
+                                       stdin=subprocess.DEVNULL, stdout=output, stderr=subprocess.STDOUT,
+                                       start_new_session=True)
+        job = LocalJob(self, process, job_id, scratch_dir)
+        with self._lock:
+            self._jobs[job_id] = job
+        threading.Thread(target=self._reap, args=(job,), name=f"local-{job_id[:10]}", daemon=True).start()
+        return job
+
+    def register(self, event_id: str, event=None) -> threading.Event:
+        event = event or threading.Event()
+        with self._lock:
+            self._waiters.setdefault(event_id, []).append(event)
+        return event
+
+    def unregister(self, event_id: str, event: threading.Event) -> None:
+        with self._lock:
+            waiters = self._waiters.get(event_id, [])
+            if event in waiters:
+                waiters.remove(event)
+            if not waiters:
+                self._waiters.pop(event_id, None)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.stop()
+            job.remove()
+
+    def _reap(self, job: LocalJob) -> None:
+        job.wait()
+        with self._lock:
+            self._jobs.pop(job.id, None)
+            waiters = list(self._waiters.get(job.id, []))
+        for event in waiters:
+            event.set()
+
+    def _venv_python(self) -> str:
+        return os.path.join(self.venv_dir, 'bin', 'python')
+
+    @staticmethod
+    def _map_paths(text: str, scratch_dir: str) -> str:
+        """
+        Rewrite the paths below /workplace and /usr/src of a command or a value to the scratch directory.
+        """
+        return CONTAINER_PATH_RE.sub(
+            lambda m: os.path.join(scratch_dir, 'workplace' if m.group(1) == 'workplace' else 'src'), text)
@@ -0,0 +1,133 @@
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import os
+import threading
+import typing
+
+LOG_POLL_INTERVAL = 0.5
+
+_max_bytes = 0
+_backup_count = 0
+
+
+def configure_log_capture(max_bytes: int=0, backup_count: int=0) -> None:
+    """
+    Set the size limits of the container log files.
+
+    Args:
+        max_bytes (int, optional): Maximum size of a log file in bytes, 0 for no limit. Defaults to 0.
+        backup_count (int, optional): Number of rotated log files to keep once max_bytes is reached.
+            With 0, output beyond max_bytes is dropped. Defaults to 0.
+    """
+    global _max_bytes, _backup_count
+    _max_bytes = max_bytes
+    _backup_count = backup_count
+
+
+class RotatingLogWriter:
+    """
+    Append-only log file with an optional size cap and rotation.
+
+    Attributes:
+        path (str): Path to the log file.
+        max_bytes (int): Maximum size of the log file in bytes, 0 for no limit.
+        backup_count (int): Number of rotated files (path.1, path.2, ...) to keep.
+            With 0, output beyond max_bytes is dropped.
+    """
+
+    path: str
+    max_bytes: int
+    backup_count: int
+
+    def __init__(self, path: str, max_bytes: typing.Optional[int]=None, backup_count: typing.Optional[int]=None):
+        self.path = path
+        self.max_bytes = _max_bytes if max_bytes is None else max_bytes
+        self.backup_count = _backup_count if backup_count is None else backup_count
+        self._truncated = False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, "wb")
+        self._size = 0
+
+    def write(self, chunk: bytes) -> None:
+        if self.max_bytes and self._size + len(chunk) > self.max_bytes:
+            if self.backup_count:
+                self._rotate()
+            else:
+                if not self._truncated:
+                    self._file.write(b"\n... log truncated ...\n")
+                    self._file.flush()
+                    self._truncated = True
+                return
+        self._file.write(chunk)
+        self._file.flush()
+        self._size += len(chunk)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def _rotate(self) -> None:
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, "wb")
+        self._size = 0
+
+
+def follow_file(path: str, exited: threading.Event, follow: bool=True) -> typing.Iterator[bytes]:
+    """
+    Read the output a job writes to a file, like `container.logs(stream=True)`.
+
+    Args:
+        path (str): Path to the output file of the job.
+        exited (threading.Event): Event set once the job has exited.
+        follow (bool, optional): Keep reading until the job has exited. Defaults to True.
+
+    Yields:
+        bytes: Chunks of the output.
+    """
+    while follow and not os.path.exists(path) and not exited.is_set():
+        exited.wait(LOG_POLL_INTERVAL)
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as f:
+        while True:
+            finished = not follow or exited.is_set()
+            chunk = f.read(65536)
+            if chunk:
+                yield chunk
+            elif finished:
+                break
+            else:
+                exited.wait(LOG_POLL_INTERVAL)
+
+
+async def follow_logs(container, writer: RotatingLogWriter, executor: concurrent.futures.Executor) -> None:
+    """
+    Append the output of a running container to a log file as it is written, until the
+    container exited.
+
+    Reading a chunk blocks until the container writes or exits, so the chunks are read on
+    an executor with a thread for every running container rather than on the default
+    executor of the loop.
+
+    Args:
+        container (docker.models.containers.Container): Container, or job of another backend.
+        writer (RotatingLogWriter): Destination of the output.
+        executor (concurrent.futures.Executor): Executor reading the chunks.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        stream = await loop.run_in_executor(executor, functools.partial(container.logs, stream=True, follow=True))
+        while True:
+            chunk = await loop.run_in_executor(executor, next, stream, None)
+            if chunk is None:
+                break
+            writer.write(chunk)
+    except Exception as e:
+        logging.warning(f"Log capture of {container.id[:10]} failed: {e}")
+    finally:
+        writer.close()
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import typing
+import uuid
+
+# Options that change how a run is executed but not what its tasks produce.
+RUNTIME_OPTIONS = {
+    'MAX_WORKERS', 'working_dir', 'module_names', 'resume',
+    'container_pool_size', 'container_pool_max_jobs', 'max_log_bytes', 'log_backup_count',
+    'docker_buildkit', 'artifact_cache_dir', 'artifact_cache_max_bytes', 'coverage_shards',
+    'batch_transform', 'fuzz_decode_workers',
+    'resource_admission', 'resource_sampling', 'resource_cpus', 'resource_mem_bytes',
+    'resource_limits', 'resource_profile',
+    'execution_backend', 'local_backend_dir', 'local_python',
+    'coordinator_address', 'coordinator_authkey', 'worker_heartbeat_timeout', 'worker_backend',
+    'worker_slots', 'worker_dir', 'task_type_limits', 'skipped_modules', 'skip_untestable_modules',
+}
+
+
+def config_fingerprint(config, environment_id: str) -> str:
+    """
+    Hash the options of a run that decide the outputs of its tasks.
+
+    Args:
+        config (Config): Configuration object.
+        environment_id (str): ID of the image or the local environment running the tasks.
+
+    Returns:
+        str: Hex digest.
+    """
+    options = {k: v for k, v in sorted(vars(config).items()) if k not in RUNTIME_OPTIONS}
+    return hashlib.sha256(json.dumps([options, environment_id], sort_keys=True, default=str).encode()).hexdigest()
+
+
+class Manifest:
+    """
+    Completion manifest of the tasks of a working directory, one JSON line per finished task.
+
+    The inputs hash of a task covers the options of the run and the completion IDs of the
+    tasks it depends on. A task that runs again gets a new completion ID, so the tasks
+    depending on it no longer match their recorded inputs hash and run again as well.
+    Entries are appended and fsynced, so a crash loses at most the line being written.
+
+    Attributes:
+        path (str): Path to the manifest file.
+        fingerprint (str): Fingerprint of the options of the run, see config_fingerprint.
+    """
+
+    path: str
+    fingerprint: str
+
+    def __init__(self, path: str, fingerprint: str):
+        self.path = path
+        self.fingerprint = fingerprint
+        self._lock = threading.Lock()
+        self._entries: typing.Dict[str, typing.Dict[str, typing.Any]] = self._load()
+
+    def inputs_hash(self, name: str, dep_completions: typing.Iterable[str]) -> str:
+        """
+        Compute the inputs hash of a task.
+
+        Args:
+            name (str): Name of the task.
+            dep_completions (Iterable[str]): Completion IDs of the tasks it depends on.
+
+        Returns:
+            str: Hex digest.
+        """
+        data = json.dumps([self.fingerprint, name, sorted(dep_completions)])
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def completed(self, name: str, inputs_hash: str) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        """
+        Get the entry of a task that completed with exit code 0 on the same inputs.
+
+        Args:
+            name (str): Name of the task.
+            inputs_hash (str): Inputs hash of the task in this run.
+
+        Returns:
+            Dict[str, Any]: Last entry of the task, or None if the task has to run.
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is None or entry['inputs_hash'] != inputs_hash or entry['status'] != 'ok' or entry['exit_code'] != 0:
+            return None
+        return entry
+
+    def record(self, name: str, inputs_hash: str, exit_code: typing.Optional[int], status: str) -> str:
+        """
+        Append the entry of a finished task.
+
+        Args:
+            name (str): Name of the task.
+            inputs_hash (str): Inputs hash of the task.
+            exit_code (int): Exit code of the task, None if it raised.
+            status (str): 'ok' or 'failed'.
+
+        Returns:
+            str: Completion ID of the task.
+        """
+        entry = {'task': name, 'inputs_hash': inputs_hash, 'exit_code': exit_code, 'status': status,
+                 'completion': uuid.uuid4().hex, 'time': time.time()}
+        line = json.dumps(entry) + '\n'
+        with self._lock:
+            self._entries[name] = entry
+            with open(self.path, 'a') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+        return entry['completion']
+
+    def _load(self) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+        entries = {}
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    logging.warning(f"Ignoring a truncated line of {self.path}")
+                    continue
+                entries[entry['task']] = entry
+        return entries
+
+
+def exit_code_of(result: typing.Any) -> int:
+    """
+    Exit code of a task from its result: an exit code, or a tuple starting with one.
+    """
+    if isinstance(result, tuple) and result and isinstance(result[0], int):
+        return result[0]
+    if isinstance(result, int) and not isinstance(result, bool):
+        return result
+    return 0
@@ -0,0 +1,158 @@
+import ast
+import typing
+
+from eats.utility import module_paths
+
+# Kinds of modules Pynguin can generate tests for.
+TESTABLE_KINDS = ('code', 'unparsed')
+
+
+class ModuleInfo:
+    """
+    What a module of the target program defines.
+
+    Attributes:
+        name (str): Name of the module.
+        path (str): Path to the file of the module.
+        callables (int): Number of functions, classes and methods defined by the module.
+        kind (str): 'code' if it defines callables, 'import-only' if it only imports,
+            'constants-only' if it only assigns names, 'empty' if it holds at most a docstring,
+            'script' if it only runs statements, 'unparsed' if it could not be parsed.
+    """
+
+    name: str
+    path: str
+    callables: int
+    kind: str
+
+    def __init__(self, name: str, path: str, callables: int, kind: str):
+        self.name = name
+        self.path = path
+        self.callables = callables
+        self.kind = kind
+
+    @property
+    def testable(self) -> bool:
+        # A module that fails to parse here is left to Pynguin to report.
+        return self.kind in TESTABLE_KINDS
+
+    def __repr__(self):
+        return f"ModuleInfo({self.name}, kind={self.kind}, callables={self.callables})"
+
+
+def _is_main_guard(node: ast.If) -> bool:
+    test = node.test
+    return isinstance(test, ast.Compare) and isinstance(test.left, ast.Name) and test.left.id == '__name__' \
+        and any(isinstance(c, ast.Constant) and c.value == '__main__' for c in test.comparators)
+
+
+def _top_level(body: typing.List[ast.stmt]) -> typing.Iterator[ast.stmt]:
+    """
+    Statements run on import, looking into if, try and with blocks but not into `if __name__ == '__main__'`.
+    """
+    for node in body:
+        if isinstance(node, ast.If):
+            if _is_main_guard(node):
+                continue
+            yield from _top_level(node.body)
+            yield from _top_level(node.orelse)
+        elif isinstance(node, ast.Try):
+            for block in (node.body, node.orelse, node.finalbody):
+                yield from _top_level(block)
+            for handler in node.handlers:
+                yield from _top_level(handler.body)
+        elif isinstance(node, (ast.With, ast.AsyncWith)):
+            yield from _top_level(node.body)
+        else:
+            yield node
+
+
+def _targets(node: ast.stmt) -> typing.List[ast.expr]:
+    if isinstance(node, ast.Assign):
+        return node.targets
+    return [node.target]
+
+
+def classify_module(name: str, path: str) -> ModuleInfo:
+    """
+    Classify a module by the statements it runs on import, without importing it.
+
+    Args:
+        name (str): Name of the module.
+        path (str): Path to the file of the module.
+
+    Returns:
+        ModuleInfo: Callables and kind of the module.
+    """
+    try:
+        with open(path, 'rb') as f:
+            tree = ast.parse(f.read(), filename=path)
+    except (SyntaxError, ValueError, OSError):
+        return ModuleInfo(name, path, 0, 'unparsed')
+
+    callables, imports, constants, statements = 0, 0, 0, 0
+    for node in _top_level(tree.body):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            callables += 1
+        elif isinstance(node, ast.ClassDef):
+            callables += 1 + sum(isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef)) for n in node.body)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            imports += 1
+        elif isinstance(node, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+            if isinstance(node.value, ast.Lambda):
+                callables += 1
+            elif not all(isinstance(t, ast.Name) and t.id.startswith('__') and t.id.endswith('__')
+                         for t in _targets(node)):
+                # __all__, __version__ and the like are metadata.
+                constants += 1
+        elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+            # Docstrings.
+            continue
+        elif not isinstance(node, ast.Pass):
+            statements += 1
+
+    if callables:
+        kind = 'code'
+    elif statements:
+        kind = 'script'
+    elif constants:
+        kind = 'constants-only'
+    elif imports:
+        kind = 'import-only'
+    else:
+        kind = 'empty'
+    return ModuleInfo(name, path, callables, kind)
+
+
+class ModuleIndex:
+    """
+    Index of the modules of the target program matching the include globs and none of the ignore globs.
+
+    The tree is walked once and every module is classified from its source, so modules without
+    anything to test can be dropped before a container starts.
+
+    Attributes:
+        root (str): Path to the target program root.
+        modules (Dict[str, ModuleInfo]): Information of every module by name, sorted by name.
+    """
+
+    root: str
+    modules: typing.Dict[str, ModuleInfo]
+
+    def __init__(self, root: str, includes: typing.List[str], ignores: typing.List[str]=None):
+        self.root = root
+        paths = module_paths(root, includes, ignores)
+        self.modules = {name: classify_module(name, paths[name]) for name in sorted(paths)}
+
+    def names(self) -> typing.List[str]:
+        return list(self.modules)
+
+    def testable(self) -> typing.List[str]:
+        return [name for name, info in self.modules.items() if info.testable]
+
+    def untestable(self) -> typing.Dict[str, str]:
+        """
+        Returns:
+            Dict[str, str]: Kind of every module without anything to test by name.
+        """
+        return {name: info.kind for name, info in self.modules.items() if not info.testable}
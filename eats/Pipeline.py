@@ -0,0 +1,216 @@
+import asyncio
+import concurrent.futures
+import inspect
+import logging
+import time
+import typing
+
+from eats.Manifest import Manifest, exit_code_of
+from eats.Trace import get_tracer
+
+
+class PipelineTask:
+    """
+    A node of the pipeline dependency graph.
+
+    Attributes:
+        name (str): Unique name of the task.
+        fn (Callable): Coroutine function, or callable run on the executor, executed by the task.
+        deps (List[PipelineTask]): Tasks that must succeed before this task starts.
+        resumable (bool): Whether the task is skipped on resume once it completed.
+        future (asyncio.Future): Future holding the result of the task.
+        completion (str): Completion ID of the task in the manifest, or None.
+    """
+
+    name: str
+    fn: typing.Callable[[], typing.Any]
+    deps: typing.List["PipelineTask"]
+    resumable: bool
+    future: asyncio.Future
+    completion: typing.Optional[str]
+
+    def __init__(self, name, fn, deps, future, resumable=True):
+        self.name = name
+        self.fn = fn
+        self.deps = deps
+        self.resumable = resumable
+        self.future = future
+        self.completion = None
+        self.inputs_hash = None
+        self.finished = False
+        self.ready_at = None
+        self.waiting = set()
+        self.dependents = []
+
+    def failed(self) -> bool:
+        return self.future.cancelled() or self.future.exception() is not None
+
+
+class PipelineScheduler:
+    """
+    Run tasks on the event loop as soon as the tasks they depend on have finished.
+
+    A task is a coroutine function, so a task waiting for its containers costs a
+    coroutine rather than a thread; plain callables are run on the executor. Tasks
+    may be added before or while the pipeline is running, e.g. from inside a running
+    task, but only from the event loop. Once a task fails no new task is started;
+    tasks already running are allowed to finish and the first exception is raised
+    from `run`.
+
+    With a manifest, every finished task is recorded in it. On resume, a task whose
+    entry shows it completed on the same inputs is not run again.
+
+    Attributes:
+        executor (concurrent.futures.Executor): Executor used for plain callables, or None
+            for the default executor of the loop.
+        manifest (Manifest): Completion manifest of the tasks, or None.
+        resume (bool): Whether tasks completed in the manifest are skipped.
+    """
+
+    executor: typing.Optional[concurrent.futures.Executor]
+    manifest: typing.Optional[Manifest]
+    resume: bool
+
+    def __init__(self, executor: typing.Optional[concurrent.futures.Executor]=None,
+                 manifest: typing.Optional[Manifest]=None, resume: bool=False):
+        self.executor = executor
+        self.manifest = manifest
+        self.resume = resume
+        self._tasks: typing.Dict[str, PipelineTask] = {}
+        self._running: typing.Set[asyncio.Task] = set()
+        self._unfinished = 0
+        self._all_done: typing.Optional[asyncio.Event] = None
+        self._errors: typing.List[BaseException] = []
+
+    def add_task(self, name: str, fn: typing.Callable[[], typing.Any],
+                 deps: typing.Iterable[PipelineTask]=(), resumable: bool=True) -> PipelineTask:
+        """
+        Add a task to the pipeline. Must be called from the event loop.
+
+        Args:
+            name (str): Unique name of the task.
+            fn (Callable): Coroutine function, or callable run on the executor.
+            deps (Iterable[PipelineTask], optional): Tasks that must succeed first. Defaults to ().
+            resumable (bool, optional): Skip the task on resume once it completed. Tasks adding
+                other tasks must always run. Defaults to True.
+
+        Returns:
+            PipelineTask: The added task.
+        """
+        if name in self._tasks:
+            raise ValueError(f"Task {name} already exists")
+        task = PipelineTask(name, fn, list(deps), asyncio.get_running_loop().create_future(), resumable)
+        self._tasks[name] = task
+        self._unfinished += 1
+        self._done_event().clear()
+        for dep in task.deps:
+            if not dep.finished:
+                task.waiting.add(dep)
+                dep.dependents.append(task)
+        if not task.waiting:
+            self._launch(task)
+        return task
+
+    def tasks(self) -> typing.List[PipelineTask]:
+        return list(self._tasks.values())
+
+    async def run(self) -> typing.Dict[str, typing.Any]:
+        """
+        Wait until every task has finished.
+
+        Returns:
+            Dict[str, Any]: Results of the tasks by name.
+
+        Raises:
+            BaseException: The first exception raised by a task.
+        """
+        await self._done_event().wait()
+        if self._errors:
+            raise self._errors[0]
+        return {name: task.future.result() for name, task in self._tasks.items()}
+
+    def _done_event(self) -> asyncio.Event:
+        # Created on first use, so the event belongs to the running loop.
+        if self._all_done is None:
+            self._all_done = asyncio.Event()
+            if not self._unfinished:
+                self._all_done.set()
+        return self._all_done
+
+    def _launch(self, task: PipelineTask) -> None:
+        skip = bool(self._errors) or any(dep.failed() for dep in task.deps)
+        task.ready_at = time.time()
+        entry = None
+        if self.manifest is not None and not skip:
+            task.inputs_hash = self.manifest.inputs_hash(task.name, [dep.completion for dep in task.deps])
+            if self.resume and task.resumable:
+                entry = self.manifest.completed(task.name, task.inputs_hash)
+        if skip:
+            task.future.cancel()
+            logging.warning(f"Task {task.name} skipped due to earlier failure")
+            get_tracer().finish(self._span(task), 'skipped')
+            self._finish(task)
+        elif entry is not None:
+            task.future.set_result(entry['exit_code'])
+            task.completion = entry['completion']
+            logging.info(f"Task {task.name} completed in an earlier run")
+            get_tracer().finish(self._span(task), 'resumed')
+            self._finish(task)
+        else:
+            running = asyncio.ensure_future(self._execute(task))
+            self._running.add(running)
+            running.add_done_callback(self._running.discard)
+
+    async def _execute(self, task: PipelineTask) -> None:
+        span = self._span(task)
+        try:
+            if inspect.iscoroutinefunction(task.fn):
+                result = await task.fn()
+            else:
+                result = await asyncio.get_running_loop().run_in_executor(self.executor, task.fn)
+            self._record(task, exit_code_of(result), 'ok')
+            task.future.set_result(result)
+            get_tracer().finish(span)
+        except BaseException as e:
+            logging.error(f"Task {task.name} failed: {e!r}")
+            self._record(task, None, 'failed')
+            get_tracer().finish(span, 'failed')
+            self._errors.append(e)
+            task.future.set_exception(e)
+            # The exception is raised from run.
+            task.future.exception()
+            if not isinstance(e, Exception):
+                # Cancelled by the loop, e.g. on KeyboardInterrupt.
+                self._finish(task)
+                raise
+        self._finish(task)
+
+    def _record(self, task: PipelineTask, exit_code: typing.Optional[int], status: str) -> None:
+        if self.manifest is None:
+            return
+        if task.resumable:
+            task.completion = self.manifest.record(task.name, task.inputs_hash, exit_code, status)
+        else:
+            # Tasks that always run pass on the completions of their dependencies.
+            task.completion = task.inputs_hash
+
+    @staticmethod
+    def _span(task: PipelineTask):
+        # Task names are "<phase>[:<module>[:<harness>]]".
+        phase, module, harness = (task.name.split(':', 2) + [None, None])[:3]
+        return get_tracer().start(task.name, phase, module, harness,
+                                  queue_wait=time.time() - task.ready_at,
+                                  deps=[dep.name for dep in task.deps])
+
+    def _finish(self, task: PipelineTask) -> None:
+        task.finished = True
+        self._unfinished -= 1
+        ready = []
+        for dependent in task.dependents:
+            dependent.waiting.discard(task)
+            if not dependent.waiting:
+                ready.append(dependent)
+        for dependent in ready:
+            self._launch(dependent)
+        if not self._unfinished:
+            self._done_event().set()
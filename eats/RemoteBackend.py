@@ -0,0 +1,505 @@
+import io
+import json
+import logging
+import os
+import tarfile
+import threading
+import time
+import typing
+import uuid
+from collections import deque
+from multiprocessing.connection import Client, Connection, Listener
+
+from eats.constant import PROJECT_ROOT
+from eats.DockerUtility import DockerContainerConfig, _write_target_requirements
+from eats.ExecutionBackend import ExecutionBackend
+from eats.LogCapture import follow_file
+from eats.ResourceScheduler import ResourceRequest
+from eats.utility import hash_paths
+
+# Seconds a worker waits for a task before pulling again, and between two messages of a running task.
+IDLE_POLL_INTERVAL = 5
+HEARTBEAT_INTERVAL = 5
+WAIT_LOG_INTERVAL = 60
+# Exit code of a task stopped before or while it ran, like a killed Docker container.
+STOPPED_EXIT_CODE = 137
+LOST_EXIT_CODE = -1
+
+
+class WorkerLostError(Exception):
+    pass
+
+
+def parse_address(address: str) -> typing.Tuple[str, int]:
+    """
+    Split a HOST:PORT address.
+    """
+    host, _, port = address.rpartition(':')
+    return host or '0.0.0.0', int(port)
+
+
+def source_id(target_program_root: str) -> str:
+    """
+    Hash of the target program, the docker scripts and the requirements, which every worker
+    of a run must share.
+
+    Args:
+        target_program_root (str): Path to the target program root.
+
+    Returns:
+        str: Hex digest.
+    """
+    return hash_paths([
+        target_program_root,
+        os.path.join(PROJECT_ROOT, 'eats', 'docker_scripts'),
+        os.path.join(PROJECT_ROOT, 'eats', 'docker_scripts_fuzzer'),
+        _write_target_requirements(target_program_root),
+    ])
+
+
+class Channel:
+    """
+    Message channel between the coordinator and a worker slot.
+
+    A message is a JSON header followed by the binary payloads it announces. Sending is
+    serialized, so a stop request may be sent while another thread receives.
+    """
+
+    def __init__(self, connection: Connection):
+        self.connection = connection
+        self._send_lock = threading.Lock()
+
+    def send(self, header: typing.Dict[str, typing.Any], payloads: typing.Sequence[bytes]=()) -> None:
+        with self._send_lock:
+            self.connection.send_bytes(json.dumps(dict(header, payloads=len(payloads))).encode())
+            for payload in payloads:
+                self.connection.send_bytes(payload)
+
+    def recv(self, timeout: typing.Optional[float]=None) -> typing.Tuple[typing.Dict[str, typing.Any], typing.List[bytes]]:
+        """
+        Receive a message.
+
+        Raises:
+            WorkerLostError: If no message arrives within the timeout.
+            EOFError, OSError: If the connection is closed.
+        """
+        if timeout is not None and not self.connection.poll(timeout):
+            raise WorkerLostError(f"No message for {timeout} seconds")
+        header = json.loads(self.connection.recv_bytes())
+        payloads = [self.connection.recv_bytes() for _ in range(header.get('payloads', 0))]
+        return header, payloads
+
+    def poll(self, timeout: float) -> bool:
+        return self.connection.poll(timeout)
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def connect(address: str, authkey: str) -> Channel:
+    return Channel(Client(parse_address(address), authkey=authkey.encode()))
+
+
+def snapshot(path: str) -> typing.Dict[str, typing.Tuple[int, int]]:
+    """
+    Size and modification time of every entry below a directory, or of a single file.
+    """
+    if not os.path.isdir(path):
+        return {os.path.basename(path): _signature(path)} if os.path.lexists(path) else {}
+    entries = {}
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in dirnames + filenames:
+            full = os.path.join(dirpath, name)
+            entries[os.path.relpath(full, path)] = _signature(full)
+    return entries
+
+
+def _signature(path: str) -> typing.Tuple[int, int]:
+    stat = os.lstat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def pack_volume(path: str, unchanged: typing.Optional[typing.Dict[str, typing.Tuple[int, int]]]=None) -> bytes:
+    """
+    Pack the contents of a volume into a gzipped tar archive.
+
+    A file volume is packed under its name, a directory volume relative to itself.
+
+    Args:
+        path (str): File or directory to pack; a missing path gives an empty archive.
+        unchanged (Dict[str, Tuple[int, int]], optional): Snapshot taken before the task ran;
+            only entries changed since are packed. Defaults to None.
+
+    Returns:
+        bytes: The archive.
+    """
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz', compresslevel=1) as tar:
+        for name, signature in snapshot(path).items():
+            if unchanged is not None and unchanged.get(name) == signature:
+                continue
+            full = path if not os.path.isdir(path) else os.path.join(path, name)
+            tar.add(full, arcname=name, recursive=False)
+    return buffer.getvalue()
+
+
+def unpack_volume(data: bytes, target_dir: str) -> None:
+    """
+    Extract an archive of `pack_volume` into a directory, overwriting existing files.
+
+    Raises:
+        ValueError: If a member would be extracted outside the directory.
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    with tarfile.open(fileobj=io.BytesIO(data), mode='r:gz') as tar:
+        if hasattr(tarfile, 'data_filter'):
+            tar.extractall(target_dir, filter='data')
+            return
+        root = os.path.realpath(target_dir)
+        for member in tar.getmembers():
+            destination = os.path.realpath(os.path.join(target_dir, member.name))
+            if os.path.commonpath([root, destination]) != root or member.islnk() or member.issym() and (
+                    os.path.isabs(member.linkname) or '..' in member.linkname.split('/')):
+                raise ValueError(f"Refusing to extract {member.name}")
+        tar.extractall(target_dir)
+
+
+class RemoteJob:
+    """
+    A task queued on the coordinator and run by a worker.
+
+    Provides the subset of the docker Container interface used by `wait_for_container`.
+
+    Attributes:
+        id (str): ID of the job.
+        status (str): 'running' while the job is queued or runs, 'exited' afterwards.
+        watcher (RemoteBackend): Backend waking the waiters of the job when it exits.
+        worker (str): Worker slot running the job, or None while it is queued.
+        attempts (int): Number of workers lost while running the job.
+    """
+
+    id: str
+    status: str
+    worker: typing.Optional[str]
+    attempts: int
+
+    def __init__(self, backend: "RemoteBackend", job_id: str, docker_config: DockerContainerConfig,
+                 limits: typing.Optional[ResourceRequest], log_path: str):
+        self.id = job_id
+        self.status = 'running'
+        self.watcher = backend
+        self.worker = None
+        self.attempts = 0
+        self.docker_config = docker_config
+        self.limits = limits
+        self.log_path = log_path
+        self.channel: typing.Optional[Channel] = None
+        self.stopping = False
+        self._backend = backend
+        self._exit_code = None
+        self._exited = threading.Event()
+
+    def reload(self) -> None:
+        if self._exited.is_set():
+            self.status = 'exited'
+
+    def logs(self, stream: bool=False, follow: bool=False) -> typing.Union[bytes, typing.Iterator[bytes]]:
+        if stream:
+            return follow_file(self.log_path, self._exited, follow)
+        if not os.path.exists(self.log_path):
+            return b''
+        with open(self.log_path, 'rb') as f:
+            return f.read()
+
+    def wait(self) -> dict:
+        self._exited.wait()
+        self.reload()
+        return {'StatusCode': self._exit_code}
+
+    def stop(self) -> None:
+        self._backend.stop(self)
+
+    def remove(self) -> None:
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+
+    def append_log(self, chunk: bytes) -> None:
+        with open(self.log_path, 'ab') as f:
+            f.write(chunk)
+
+    def finish(self, exit_code: int) -> bool:
+        """
+        Mark the job as exited. Returns False if it already was.
+        """
+        if self._exited.is_set():
+            return False
+        self._exit_code = exit_code
+        self._exited.set()
+        self._backend.wake(self.id)
+        return True
+
+
+class RemoteBackend(ExecutionBackend):
+    """
+    Coordinator queueing the tasks for workers on other machines, see `eats.Worker`.
+
+    Every worker slot holds one connection and pulls the next task once it is free, so
+    idle workers take the queued tasks and a fast worker never waits behind a slow one.
+    A task is sent with the contents of its volumes; the worker runs it with its own
+    backend, streams the output back while it runs and returns the files the task
+    created or changed in its writable volumes, which are extracted into the host paths
+    of the volumes. `run` blocks until a worker took the task, so the timeout of a task
+    starts when it runs.
+
+    A running task sends a message at least every HEARTBEAT_INTERVAL seconds. If no
+    message arrives within the heartbeat timeout, or the connection breaks, the worker
+    is considered lost and the task is queued again in front of the others, up to
+    max_attempts times.
+
+    Workers connect with the shared authkey and must have the same source_id, i.e. the
+    same target program, docker scripts and requirements as the coordinator.
+
+    Attributes:
+        address (str): HOST:PORT the coordinator listens on.
+        source_id (str): Source ID of the run, see source_id.
+        state_dir (str): Directory of the output files of the tasks.
+        heartbeat_timeout (float): Seconds without a message after which a worker is lost.
+        max_attempts (int): Number of workers a task is given before it fails.
+    """
+
+    address: str
+    source_id: str
+    state_dir: str
+    heartbeat_timeout: float
+    max_attempts: int
+
+    def __init__(self, address: str, authkey: str, source_id: str, state_dir: str,
+                 heartbeat_timeout: float=60, max_attempts: int=3):
+        self.address = address
+        self.source_id = source_id
+        self.state_dir = state_dir
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_attempts = max_attempts
+        self._authkey = authkey.encode()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._queue: typing.Deque[RemoteJob] = deque()
+        self._running: typing.Dict[str, RemoteJob] = {}
+        self._waiters: typing.Dict[str, typing.List[threading.Event]] = {}
+        self._slots = 0
+        self._closed = False
+        self._listener: typing.Optional[Listener] = None
+        os.makedirs(self.state_dir, exist_ok=True)
+
+    def start(self) -> None:
+        """
+        Listen for workers.
+        """
+        self._listener = Listener(parse_address(self.address), authkey=self._authkey)
+        logging.info(f"Coordinator listening on {self.address}")
+        threading.Thread(target=self._accept, name="coordinator", daemon=True).start()
+
+    def run(self, docker_config: DockerContainerConfig, limits: typing.Optional[ResourceRequest]=None) -> RemoteJob:
+        """
+        Queue a task and wait until a worker took it.
+
+        Args:
+            docker_config (DockerContainerConfig): Configuration of the task.
+            limits (ResourceRequest, optional): CPU and memory limit of the task. Defaults to None.
+
+        Returns:
+            RemoteJob: The running job.
+        """
+        job_id = uuid.uuid4().hex
+        job = RemoteJob(self, job_id, docker_config, limits, os.path.join(self.state_dir, f"{job_id}.log"))
+        with self._changed:
+            if self._closed:
+                raise RuntimeError("Coordinator is shut down")
+            self._queue.append(job)
+            self._changed.notify_all()
+            while job.worker is None and not job._exited.is_set():
+                if not self._changed.wait(WAIT_LOG_INTERVAL):
+                    logging.info(f"Task {docker_config.task_type} waiting for a worker, "
+                                 f"{self._slots} worker slots connected, {len(self._queue)} tasks queued")
+        return job
+
+    def stop(self, job: RemoteJob) -> None:
+        """
+        Stop a queued or running task and wait until it exited.
+        """
+        with self._lock:
+            job.stopping = True
+            if job in self._queue:
+                self._queue.remove(job)
+                job.finish(STOPPED_EXIT_CODE)
+                return
+            channel = job.channel
+        if channel is not None:
+            try:
+                channel.send({'type': 'stop', 'id': job.id})
+            except OSError:
+                pass
+        if not job._exited.wait(self.heartbeat_timeout):
+            job.finish(STOPPED_EXIT_CODE)
+
+    def register(self, event_id: str, event=None) -> threading.Event:
+        event = event or threading.Event()
+        with self._lock:
+            self._waiters.setdefault(event_id, []).append(event)
+        return event
+
+    def unregister(self, event_id: str, event: threading.Event) -> None:
+        with self._lock:
+            waiters = self._waiters.get(event_id, [])
+            if event in waiters:
+                waiters.remove(event)
+            if not waiters:
+                self._waiters.pop(event_id, None)
+
+    def wake(self, event_id: str) -> None:
+        with self._changed:
+            waiters = list(self._waiters.get(event_id, []))
+            self._changed.notify_all()
+        for event in waiters:
+            event.set()
+
+    def shutdown(self) -> None:
+        with self._changed:
+            self._closed = True
+            queued = list(self._queue)
+            self._queue.clear()
+            running = list(self._running.values())
+            self._changed.notify_all()
+        for job in queued:
+            job.finish(LOST_EXIT_CODE)
+        for job in running:
+            self.stop(job)
+        if self._listener is not None:
+            self._listener.close()
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                connection = self._listener.accept()
+            except OSError:
+                if self._closed:
+                    return
+                logging.exception("Accepting a worker failed")
+                continue
+            except Exception as e:
+                logging.warning(f"Rejected a worker connection: {e}")
+                continue
+            threading.Thread(target=self._serve, args=(Channel(connection),), daemon=True).start()
+
+    def _serve(self, channel: Channel) -> None:
+        worker = None
+        try:
+            header, _ = channel.recv(self.heartbeat_timeout)
+            if header.get('type') != 'hello':
+                return
+            worker = f"{header['worker']}/{header['slot']}"
+            if header.get('source_id') != self.source_id:
+                logging.error(f"Rejected worker {worker}: its target program or scripts differ from the coordinator's")
+                channel.send({'type': 'reject', 'reason': 'source_id differs from the coordinator'})
+                return
+            channel.send({'type': 'welcome'})
+            with self._lock:
+                self._slots += 1
+            logging.info(f"Worker {worker} connected")
+            while True:
+                header, _ = channel.recv(self.heartbeat_timeout)
+                if header.get('type') != 'pull':
+                    continue
+                job = self._take(IDLE_POLL_INTERVAL)
+                if job is not None:
+                    self._supervise(channel, worker, job)
+                elif self._closed:
+                    channel.send({'type': 'shutdown'})
+                    return
+                else:
+                    channel.send({'type': 'idle'})
+        except (WorkerLostError, EOFError, OSError) as e:
+            if worker is not None and not self._closed:
+                logging.warning(f"Lost worker {worker}: {str(e) or type(e).__name__}")
+        except Exception:
+            logging.exception(f"Dropped worker {worker}")
+        finally:
+            channel.close()
+            if worker is not None:
+                with self._lock:
+                    self._slots -= 1
+
+    def _take(self, timeout: float) -> typing.Optional[RemoteJob]:
+        deadline = time.time() + timeout
+        with self._changed:
+            while not self._queue and not self._closed:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self._changed.wait(remaining)
+            if self._closed:
+                return None
+            return self._queue.popleft()
+
+    def _supervise(self, channel: Channel, worker: str, job: RemoteJob) -> None:
+        config = job.docker_config
+        volumes, payloads = [], []
+        for host_path, volume in config.volumes.items():
+            volumes.append({'bind': volume['bind'], 'mode': volume.get('mode', 'rw'),
+                            'kind': 'file' if os.path.isfile(host_path) else 'dir',
+                            'name': os.path.basename(host_path)})
+            payloads.append(pack_volume(host_path))
+        with self._changed:
+            job.worker = worker
+            self._running[job.id] = job
+            self._changed.notify_all()
+        logging.debug(f"Task {job.id[:10]} ({config.task_type}) runs on {worker}")
+        try:
+            channel.send({'type': 'job', 'id': job.id, 'task_type': config.task_type,
+                          'command': config.command, 'environment': config.environment,
+                          'labels': config.labels, 'volumes': volumes,
+                          'limits': vars(job.limits) if job.limits is not None else None}, payloads)
+            with self._lock:
+                job.channel = channel
+                stopping = job.stopping
+            if stopping:
+                channel.send({'type': 'stop', 'id': job.id})
+            while True:
+                header, payloads = channel.recv(self.heartbeat_timeout)
+                if header.get('type') == 'log':
+                    for chunk in payloads:
+                        job.append_log(chunk)
+                elif header.get('type') == 'done':
+                    writable = [p for p, v in config.volumes.items() if v.get('mode', 'rw') != 'ro']
+                    for host_path, data in zip(writable, payloads):
+                        unpack_volume(data, host_path if not os.path.isfile(host_path) else os.path.dirname(host_path))
+                    job.finish(header['exit_code'])
+                    return
+        except BaseException as e:
+            self._requeue(job, worker, e)
+            raise
+        finally:
+            with self._lock:
+                self._running.pop(job.id, None)
+                job.channel = None
+
+    def _requeue(self, job: RemoteJob, worker: str, error: BaseException) -> None:
+        with self._changed:
+            if job._exited.is_set():
+                return
+            if job.stopping or self._closed:
+                requeue = False
+            else:
+                job.attempts += 1
+                requeue = job.attempts < self.max_attempts
+            if requeue:
+                job.worker = None
+                self._queue.appendleft(job)
+                self._changed.notify_all()
+        reason = f"worker {worker} lost ({str(error) or type(error).__name__})"
+        if requeue:
+            logging.warning(f"Task {job.id[:10]} queued again: {reason}")
+            job.append_log(f"\n... {reason}, task queued again ...\n".encode())
+        else:
+            job.append_log(f"\n... {reason} ...\n".encode())
+            job.finish(STOPPED_EXIT_CODE if job.stopping else LOST_EXIT_CODE)
@@ -0,0 +1,230 @@
+import concurrent.futures
+import json
+import logging
+import os
+import threading
+import time
+import typing
+
+import psutil
+
+GiB = 1024 ** 3
+SAMPLE_INTERVAL = 10
+# Headroom on top of the observed usage when it becomes the request of the next run.
+CPU_HEADROOM = 1.2
+MEM_HEADROOM = 1.25
+
+DEFAULT_REQUESTS = {
+    'pynguin': (1.0, 2 * GiB),
+    'mutmut': (1.0, 2 * GiB),
+    'coverage': (1.0, 1 * GiB),
+    'fuzz': (4.0, 2 * GiB),
+    'transform': (2.0, 1 * GiB),
+    'recreation': (1.0, 1 * GiB),
+    'default': (1.0, GiB // 2),
+}
+
+
+class ResourceRequest:
+    """
+    CPU and memory reserved for a task.
+
+    Attributes:
+        cpus (float): Number of CPUs.
+        mem_bytes (int): Memory in bytes.
+    """
+
+    cpus: float
+    mem_bytes: int
+
+    def __init__(self, cpus: float, mem_bytes: int):
+        self.cpus = cpus
+        self.mem_bytes = mem_bytes
+
+    def __repr__(self):
+        return f"ResourceRequest(cpus={self.cpus:.2f}, mem={self.mem_bytes / GiB:.2f}GiB)"
+
+
+class _Usage:
+    def __init__(self, task_type: str):
+        self.task_type = task_type
+        self.cpu_samples: typing.List[float] = []
+        self.cpu_seconds = 0.0
+        self.peak_mem = 0
+
+
+class ResourceScheduler:
+    """
+    Admit container tasks against the free CPUs and memory of the machine.
+
+    Every task type (pynguin, mutmut, coverage, fuzz, ...) has a resource request, taken
+    from the profile observed in earlier runs or from DEFAULT_REQUESTS. A task waits in
+    `acquire` until its request fits into the unreserved capacity; a task larger than the
+    machine is admitted once nothing else runs. The usage of running containers is sampled
+    with `container.stats()` and written back to the profile by `save_profile`. With
+    `admit` off, every task starts at once and only the usage is sampled.
+
+    Attributes:
+        total_cpus (float): CPUs available to the tasks.
+        total_mem (int): Memory available to the tasks in bytes.
+        profile_path (str): JSON file of the observed requests per task type, or ''.
+        enforce_limits (bool): Whether containers are started with their request as CPU and memory limit.
+        admit (bool): Whether tasks wait for their resources to be free.
+    """
+
+    total_cpus: float
+    total_mem: int
+    profile_path: str
+    enforce_limits: bool
+    admit: bool
+
+    def __init__(self, total_cpus: float=0, total_mem: int=0, profile_path: str='', enforce_limits: bool=False,
+                 admit: bool=True):
+        self.total_cpus = total_cpus or os.cpu_count()
+        self.total_mem = total_mem or psutil.virtual_memory().available
+        self.profile_path = profile_path
+        self.enforce_limits = enforce_limits
+        self.admit = admit
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._used_cpus = 0.0
+        self._used_mem = 0
+        self._grants: typing.Dict[str, ResourceRequest] = {}
+        self._monitored: typing.Dict[str, typing.Tuple[typing.Any, _Usage]] = {}
+        self._observed: typing.Dict[str, typing.List[_Usage]] = {}
+        self._profile = self._load_profile()
+        self._sampler = threading.Thread(target=self._sample_loop, name="resource-sampler", daemon=True)
+        self._sampler.start()
+        if admit:
+            logging.info(f"Resource admission: {self.total_cpus} CPUs, {self.total_mem / GiB:.1f}GiB memory")
+
+    def request_for(self, task_type: str) -> ResourceRequest:
+        """
+        Get the resource request of a task type.
+
+        Args:
+            task_type (str): Type of the task.
+
+        Returns:
+            ResourceRequest: Observed request of earlier runs, or the default request.
+        """
+        if task_type in self._profile:
+            entry = self._profile[task_type]
+            return ResourceRequest(entry['cpus'], entry['mem_bytes'])
+        cpus, mem_bytes = DEFAULT_REQUESTS.get(task_type, DEFAULT_REQUESTS['default'])
+        return ResourceRequest(cpus, mem_bytes)
+
+    def acquire(self, request: ResourceRequest) -> None:
+        """
+        Wait until the request fits into the free capacity and reserve it.
+
+        Args:
+            request (ResourceRequest): Resources of the task.
+        """
+        with self._changed:
+            while self.admit and self._grants_pending() and not self._fits(request):
+                self._changed.wait()
+            self._used_cpus += request.cpus
+            self._used_mem += request.mem_bytes
+
+    def release(self, request: ResourceRequest) -> None:
+        with self._changed:
+            self._used_cpus -= request.cpus
+            self._used_mem -= request.mem_bytes
+            self._changed.notify_all()
+
+    def started(self, container, task_type: str, request: ResourceRequest) -> None:
+        """
+        Track a container admitted with `acquire` until `finished` is called.
+
+        Args:
+            container: Docker container or pooled job of the task.
+            task_type (str): Type of the task.
+            request (ResourceRequest): Reserved resources.
+        """
+        with self._lock:
+            self._grants[container.id] = request
+            if hasattr(container, 'stats'):
+                self._monitored[container.id] = (container, _Usage(task_type))
+
+    def finished(self, container) -> typing.Optional[_Usage]:
+        """
+        Release the resources of a finished container and keep its observed usage.
+
+        Args:
+            container: Docker container or pooled job of the task.
+
+        Returns:
+            _Usage: Usage sampled while the container ran, or None if it was not sampled.
+        """
+        with self._lock:
+            request = self._grants.pop(container.id, None)
+            _, usage = self._monitored.pop(container.id, (None, None))
+            if usage is not None and usage.cpu_samples:
+                self._observed.setdefault(usage.task_type, []).append(usage)
+        if request is not None:
+            self.release(request)
+        return usage if usage is not None and usage.cpu_samples else None
+
+    def save_profile(self) -> None:
+        """
+        Write the usage observed in this run to the profile, as requests for the next run.
+        """
+        if not self.profile_path:
+            return
+        with self._lock:
+            observed = {task_type: list(usages) for task_type, usages in self._observed.items()}
+        profile = dict(self._profile)
+        for task_type, usages in observed.items():
+            cpus = max(max(sum(u.cpu_samples) / len(u.cpu_samples) for u in usages) * CPU_HEADROOM, 0.25)
+            mem_bytes = int(max(u.peak_mem for u in usages) * MEM_HEADROOM)
+            if task_type in profile:
+                # Average with the earlier runs, so one unusual run does not decide the request.
+                cpus = (cpus + profile[task_type]['cpus']) / 2
+                mem_bytes = (mem_bytes + profile[task_type]['mem_bytes']) // 2
+            profile[task_type] = {'cpus': round(cpus, 2), 'mem_bytes': mem_bytes}
+            logging.info(f"Observed resource request of {task_type}: {ResourceRequest(cpus, mem_bytes)}")
+        with open(self.profile_path, 'w') as f:
+            json.dump(profile, f, indent=2, sort_keys=True)
+
+    def _grants_pending(self) -> bool:
+        return self._used_cpus > 0 or self._used_mem > 0
+
+    def _fits(self, request: ResourceRequest) -> bool:
+        return self._used_cpus + request.cpus <= self.total_cpus + 1e-9 \
+            and self._used_mem + request.mem_bytes <= self.total_mem
+
+    def _load_profile(self) -> typing.Dict[str, typing.Dict[str, float]]:
+        if not self.profile_path or not os.path.exists(self.profile_path):
+            return {}
+        try:
+            with open(self.profile_path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring resource profile {self.profile_path}: {e}")
+            return {}
+
+    def _sample_loop(self) -> None:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="resource-stats") as executor:
+            while True:
+                time.sleep(SAMPLE_INTERVAL)
+                with self._lock:
+                    monitored = list(self._monitored.values())
+                list(executor.map(lambda item: self._sample(*item), monitored))
+
+    @staticmethod
+    def _sample(container, usage: _Usage) -> None:
+        try:
+            stats = container.stats(stream=False)
+        except Exception:
+            return
+        cpu, pre = stats.get('cpu_stats', {}), stats.get('precpu_stats', {})
+        cpu_delta = cpu.get('cpu_usage', {}).get('total_usage', 0) - pre.get('cpu_usage', {}).get('total_usage', 0)
+        system_delta = cpu.get('system_cpu_usage', 0) - pre.get('system_cpu_usage', 0)
+        usage.cpu_seconds = max(usage.cpu_seconds, cpu.get('cpu_usage', {}).get('total_usage', 0) / 1e9)
+        if system_delta > 0 and cpu_delta >= 0:
+            usage.cpu_samples.append(cpu_delta / system_delta * cpu.get('online_cpus', 1))
+        memory = stats.get('memory_stats', {})
+        page_cache = memory.get('stats', {}).get('inactive_file', memory.get('stats', {}).get('cache', 0))
+        usage.peak_mem = max(usage.peak_mem, memory.get('usage', 0) - page_cache)
+
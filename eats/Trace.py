@@ -0,0 +1,292 @@
+import collections
+import glob
+import json
+import os
+import threading
+import time
+import typing
+
+
+class Span:
+    """
+    A timed step of a run: a pipeline task or a container task.
+
+    Attributes:
+        name (str): Name of the step.
+        phase (str): Phase of the step, e.g. pynguin, fuzz or mutmut.
+        module (str): Module the step works on, or None.
+        harness (str): Fuzz harness or batch the step works on, or None.
+        queue_wait (float): Seconds the step waited for a worker or resources before it started.
+        start (float): Start time as a UNIX timestamp.
+        end (float): End time as a UNIX timestamp.
+        exit_code (int): Exit code of the container, or None.
+        container_id (str): ID of the container, or None.
+        deps (List[str]): Names of the pipeline tasks the step waited for.
+        status (str): 'ok', 'failed', 'skipped', 'timeout' or 'resumed'.
+        cpu_seconds (float): CPU time of the container sampled by the resource scheduler, or None.
+        peak_mem (int): Peak memory of the container in bytes sampled by the resource scheduler, or None.
+    """
+
+    name: str
+    phase: str
+    module: typing.Optional[str]
+    harness: typing.Optional[str]
+    queue_wait: float
+    start: float
+    end: typing.Optional[float]
+    exit_code: typing.Optional[int]
+    container_id: typing.Optional[str]
+    deps: typing.List[str]
+    status: str
+    cpu_seconds: typing.Optional[float]
+    peak_mem: typing.Optional[int]
+
+    def __init__(self, name: str, phase: str, module: typing.Optional[str]=None, harness: typing.Optional[str]=None,
+                 queue_wait: float=0.0, deps: typing.Iterable[str]=()):
+        self.name = name
+        self.phase = phase
+        self.module = module
+        self.harness = harness
+        self.queue_wait = queue_wait
+        self.start = time.time()
+        self.end = None
+        self.exit_code = None
+        self.container_id = None
+        self.deps = list(deps)
+        self.status = 'ok'
+        self.cpu_seconds = None
+        self.peak_mem = None
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        return {
+            'name': self.name,
+            'phase': self.phase,
+            'module': self.module,
+            'harness': self.harness,
+            'queue_wait': round(self.queue_wait, 3),
+            'start': self.start,
+            'end': self.end,
+            'duration': round(self.end - self.start, 3),
+            'exit_code': self.exit_code,
+            'container_id': self.container_id,
+            'deps': self.deps,
+            'status': self.status,
+            'cpu_seconds': self.cpu_seconds,
+            'peak_mem': self.peak_mem,
+        }
+
+
+class Tracer:
+    """
+    Append finished spans to a JSON Lines trace file.
+
+    Attributes:
+        path (str): Path to the trace file, or '' to drop the spans.
+    """
+
+    path: str
+
+    def __init__(self, path: str=''):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self._file = open(path, 'a')
+
+    def start(self, name: str, phase: str, module: typing.Optional[str]=None, harness: typing.Optional[str]=None,
+              queue_wait: float=0.0, deps: typing.Iterable[str]=()) -> Span:
+        return Span(name, phase, module, harness, queue_wait, deps)
+
+    def finish(self, span: Span, status: typing.Optional[str]=None) -> None:
+        span.end = time.time()
+        if status:
+            span.status = status
+        if self._file is None:
+            return
+        line = json.dumps(span.to_dict())
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_tracer = Tracer()
+
+
+def set_tracer(tracer: typing.Optional[Tracer]) -> None:
+    """
+    Set the tracer receiving the spans of the pipeline and the containers.
+
+    Args:
+        tracer (Tracer): Tracer, or None to drop the spans.
+    """
+    global _tracer
+    _tracer = tracer or Tracer()
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def new_trace_path(logs_dir: str) -> str:
+    """
+    Path of the trace of a run starting now. Every run, including a resumed one, gets its own
+    trace, so the spans of earlier runs do not end up in its summary and timeline.
+
+    Args:
+        logs_dir (str): Log folder of the working directory.
+
+    Returns:
+        str: Path to logs_dir/trace-<start time>.jsonl.
+    """
+    return os.path.join(logs_dir, f"trace-{time.strftime('%Y%m%d-%H%M%S')}.jsonl")
+
+
+def latest_trace(logs_dir: str) -> typing.Optional[str]:
+    """
+    Path of the trace of the last run in a log folder, or None.
+    """
+    paths = sorted(glob.glob(os.path.join(logs_dir, 'trace-*.jsonl')))
+    return paths[-1] if paths else None
+
+
+def read_trace(path: str) -> typing.List[typing.Dict[str, typing.Any]]:
+    spans = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                spans.append(json.loads(line))
+    return spans
+
+
+def _lanes(spans: typing.List[typing.Dict[str, typing.Any]]) -> typing.List[int]:
+    """
+    Assign every span, together with its queue wait, to the first lane free at its start, so
+    the spans of a lane do not overlap.
+
+    Returns:
+        List[int]: Lane of every span, starting at 1.
+    """
+    lanes = [0] * len(spans)
+    lane_ends: typing.List[float] = []
+    order = sorted(range(len(spans)), key=lambda i: spans[i]['start'] - spans[i]['queue_wait'])
+    for i in order:
+        begin = spans[i]['start'] - spans[i]['queue_wait']
+        for lane, end in enumerate(lane_ends):
+            if end <= begin:
+                break
+        else:
+            lane = len(lane_ends)
+            lane_ends.append(0)
+        lane_ends[lane] = spans[i]['end']
+        lanes[i] = lane + 1
+    return lanes
+
+
+def export_chrome_trace(trace_path: str, out_path: str) -> None:
+    """
+    Convert a trace to the Chrome trace event format, readable by chrome://tracing and Perfetto.
+
+    Pipeline tasks and containers are shown as two processes. Their spans are laid out on
+    rows that hold one span at a time; the queue wait of a span is drawn as a separate
+    event before it on the same row.
+
+    Args:
+        trace_path (str): Path to the JSON Lines trace.
+        out_path (str): Path to the Chrome trace JSON file.
+    """
+    spans = read_trace(trace_path)
+    origin = min((span['start'] - span['queue_wait'] for span in spans), default=0)
+    events = []
+    for pid, group in ((1, [span for span in spans if not span['container_id']]),
+                       (2, [span for span in spans if span['container_id']])):
+        lanes = _lanes(group)
+        for span, tid in zip(group, lanes):
+            ts = (span['start'] - origin) * 1e6
+            args = {k: span.get(k) for k in ('module', 'harness', 'exit_code', 'container_id', 'status', 'queue_wait',
+                                             'cpu_seconds', 'peak_mem')
+                    if span.get(k) is not None}
+            if span['queue_wait']:
+                events.append({'name': f"wait {span['name']}", 'cat': 'queue', 'ph': 'X', 'pid': pid, 'tid': tid,
+                               'ts': ts - span['queue_wait'] * 1e6, 'dur': span['queue_wait'] * 1e6})
+            events.append({'name': span['name'], 'cat': span['phase'], 'ph': 'X', 'pid': pid, 'tid': tid,
+                           'ts': ts, 'dur': span['duration'] * 1e6, 'args': args})
+        events += [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': f"lane {tid}"}}
+                   for tid in sorted(set(lanes))]
+    events += [{'name': 'process_name', 'ph': 'M', 'pid': 1, 'args': {'name': 'pipeline'}},
+               {'name': 'process_name', 'ph': 'M', 'pid': 2, 'args': {'name': 'containers'}}]
+    with open(out_path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+def critical_path(spans: typing.List[typing.Dict[str, typing.Any]]) -> typing.List[typing.Dict[str, typing.Any]]:
+    """
+    Find the chain of pipeline tasks that decided the end of the run: starting from the task
+    that finished last, follow the dependency that finished last.
+
+    Args:
+        spans (List[Dict[str, Any]]): Spans of the trace.
+
+    Returns:
+        List[Dict[str, Any]]: Spans of the critical path, first task first.
+    """
+    tasks = {span['name']: span for span in spans if not span['container_id']}
+    if not tasks:
+        return []
+    path = [max(tasks.values(), key=lambda span: span['end'])]
+    while True:
+        deps = [tasks[name] for name in path[-1]['deps'] if name in tasks]
+        if not deps:
+            break
+        path.append(max(deps, key=lambda span: span['end']))
+    return path[::-1]
+
+
+def summarize(trace_path: str, top: int=5) -> str:
+    """
+    Summarize a trace: the critical path and the slowest modules of every phase.
+
+    Args:
+        trace_path (str): Path to the JSON Lines trace.
+        top (int, optional): Number of modules listed per phase. Defaults to 5.
+
+    Returns:
+        str: Summary table.
+    """
+    spans = read_trace(trace_path)
+    if not spans:
+        return "Empty trace"
+    lines = ["Critical path:",
+             f"  {'task':<50} {'wait':>9} {'duration':>9}"]
+    for span in critical_path(spans):
+        lines.append(f"  {span['name'][:50]:<50} {span['queue_wait']:>8.1f}s {span['duration']:>8.1f}s")
+
+    by_phase = collections.defaultdict(lambda: collections.defaultdict(float))
+    waits = collections.defaultdict(float)
+    for span in spans:
+        if span['container_id']:
+            by_phase[span['phase']][span['module'] or '-'] += span['duration']
+            waits[span['phase']] += span['queue_wait']
+    lines.append("Slowest modules per phase (container time):")
+    for phase, modules in sorted(by_phase.items(), key=lambda item: -sum(item[1].values())):
+        lines.append(f"  {phase}: {sum(modules.values()):.1f}s total, {waits[phase]:.1f}s queued")
+        for module, duration in sorted(modules.items(), key=lambda item: -item[1])[:top]:
+            lines.append(f"    {module[:46]:<46} {duration:>8.1f}s")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Summarize an EATS trace and export it for chrome://tracing or Perfetto.")
+    parser.add_argument('trace', help="Path to trace.jsonl")
+    parser.add_argument('--chrome', help="Path of the Chrome trace to write", default='')
+    args = parser.parse_args()
+    if args.chrome:
+        export_chrome_trace(args.trace, args.chrome)
+    print(summarize(args.trace))
@@ -0,0 +1,172 @@
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+import typing
+
+from eats.DockerUtility import LOG_DRAIN_TIMEOUT, DockerContainerConfig
+from eats.ExecutionBackend import ExecutionBackend
+from eats.RemoteBackend import HEARTBEAT_INTERVAL, Channel, connect, pack_volume, snapshot, unpack_volume
+from eats.ResourceScheduler import ResourceRequest
+
+RECONNECT_INTERVAL = 5
+JOB_POLL_INTERVAL = 0.5
+LOG_CHUNK_BYTES = 1 << 20
+
+
+class Worker:
+    """
+    Pull the tasks of a coordinator (see `eats.RemoteBackend`) and run them with a local backend.
+
+    Every slot holds its own connection and runs one task at a time. The volumes of a task
+    are extracted below the job directory, the output is sent back while the task runs and
+    the files it created or changed in its writable volumes once it exited. A slot whose
+    connection breaks connects again; the worker exits once the coordinator shuts down
+    or rejects it.
+
+    Attributes:
+        address (str): HOST:PORT of the coordinator.
+        backend (ExecutionBackend): Backend running the tasks.
+        imageid (str): ID of the image the tasks run in, ignored by the local backend.
+        source_id (str): Source ID of the worker, see `eats.RemoteBackend.source_id`.
+        work_dir (str): Directory of the volumes of the running tasks.
+        slots (int): Number of tasks run in parallel.
+        name (str): Name of the worker in the logs of the coordinator.
+    """
+
+    address: str
+    backend: ExecutionBackend
+    imageid: str
+    source_id: str
+    work_dir: str
+    slots: int
+    name: str
+
+    def __init__(self, address: str, authkey: str, backend: ExecutionBackend, imageid: str, source_id: str,
+                 work_dir: str, slots: int, name: typing.Optional[str]=None):
+        self.address = address
+        self.backend = backend
+        self.imageid = imageid
+        self.source_id = source_id
+        self.work_dir = os.path.abspath(work_dir)
+        self.slots = slots
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self._authkey = authkey
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        """
+        Run the slots until the coordinator shuts down.
+        """
+        os.makedirs(self.work_dir, exist_ok=True)
+        threads = [threading.Thread(target=self._slot, args=(slot,), name=f"slot-{slot}", daemon=True)
+                   for slot in range(self.slots)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _slot(self, slot: int) -> None:
+        while not self._done.is_set():
+            try:
+                channel = connect(self.address, self._authkey)
+            except OSError as e:
+                logging.info(f"Slot {slot}: coordinator {self.address} not reachable ({e}), retrying")
+                self._done.wait(RECONNECT_INTERVAL)
+                continue
+            try:
+                if self._session(channel, slot):
+                    self._done.set()
+            except (EOFError, OSError) as e:
+                logging.warning(f"Slot {slot}: connection to the coordinator lost ({str(e) or type(e).__name__})")
+                self._done.wait(RECONNECT_INTERVAL)
+            finally:
+                channel.close()
+
+    def _session(self, channel: Channel, slot: int) -> bool:
+        """
+        Pull and run tasks over one connection.
+
+        Returns:
+            bool: True once the worker has to exit.
+        """
+        channel.send({'type': 'hello', 'worker': self.name, 'slot': slot, 'source_id': self.source_id})
+        header, _ = channel.recv()
+        if header['type'] == 'reject':
+            logging.error(f"Rejected by the coordinator: {header.get('reason')}")
+            return True
+        logging.info(f"Slot {slot}: connected to {self.address}")
+        while True:
+            channel.send({'type': 'pull'})
+            header, payloads = channel.recv()
+            if header['type'] == 'shutdown':
+                logging.info(f"Slot {slot}: coordinator finished")
+                return True
+            if header['type'] == 'job':
+                self._run_job(channel, header, payloads)
+
+    def _run_job(self, channel: Channel, header: typing.Dict[str, typing.Any], payloads: typing.List[bytes]) -> None:
+        job_dir = os.path.join(self.work_dir, header['id'])
+        shutil.rmtree(job_dir, ignore_errors=True)
+        volumes, writable = {}, []
+        for i, (volume, data) in enumerate(zip(header['volumes'], payloads)):
+            root = os.path.join(job_dir, f"v{i}")
+            unpack_volume(data, root)
+            host_path = os.path.join(root, volume['name']) if volume['kind'] == 'file' else root
+            volumes[host_path] = {'bind': volume['bind'], 'mode': volume['mode']}
+            if volume['mode'] != 'ro':
+                writable.append((host_path, snapshot(host_path)))
+
+        config = DockerContainerConfig(self.imageid, volumes, header['environment'], header['command'],
+                                       reusable=False, task_type=header['task_type'], labels=header.get('labels'))
+        limits = ResourceRequest(**header['limits']) if header.get('limits') else None
+        logging.info(f"Running task {header['id'][:10]} ({header['task_type']})")
+        job = self.backend.run(config, limits)
+
+        chunks, lock = [], threading.Lock()
+
+        def read_logs():
+            try:
+                for chunk in job.logs(stream=True, follow=True):
+                    with lock:
+                        chunks.append(chunk)
+            except Exception as e:
+                logging.warning(f"Log capture of task {header['id'][:10]} failed: {e}")
+
+        def flush_logs():
+            with lock:
+                data = b''.join(chunks)
+                chunks.clear()
+            channel.send({'type': 'log'}, [data] if data else [])
+
+        reader = threading.Thread(target=read_logs, daemon=True)
+        reader.start()
+        try:
+            last_sent = time.time()
+            job.reload()
+            while job.status in ('created', 'running'):
+                # Stop requests arrive while the task runs.
+                if channel.poll(JOB_POLL_INTERVAL):
+                    message, _ = channel.recv()
+                    if message['type'] == 'stop':
+                        logging.info(f"Stopping task {header['id'][:10]}")
+                        job.stop()
+                with lock:
+                    pending = sum(len(c) for c in chunks)
+                if time.time() - last_sent >= HEARTBEAT_INTERVAL or pending >= LOG_CHUNK_BYTES:
+                    flush_logs()
+                    last_sent = time.time()
+                job.reload()
+            exit_code = job.wait()['StatusCode']
+            reader.join(LOG_DRAIN_TIMEOUT)
+            flush_logs()
+            channel.send({'type': 'done', 'exit_code': exit_code},
+                         [pack_volume(path, unchanged) for path, unchanged in writable])
+        except BaseException:
+            job.stop()
+            raise
+        finally:
+            job.remove()
+            shutil.rmtree(job_dir, ignore_errors=True)
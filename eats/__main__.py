@@ -9,47 +9,55 @@ import psutil
 import multiprocessing
 import os
 import eats.main
-from eats.utility import module_find
-from eats.Config import Config
+from eats.Config import read_config
 
 
 if __name__ == "__main__":
+    import argparse
     import configparser
+    parser = argparse.ArgumentParser(prog="python -m eats", description="Enhancing Automated Test Suites")
+    parser.add_argument('--resume', nargs='?', const='', default=None, metavar='WORKING_DIR',
+                        help="Continue an interrupted run, skipping its completed tasks. Defaults to the "
+                             "working_dir of eats.ini, or the latest working_dir_# if it is DEFAULT.")
+    subparsers = parser.add_subparsers(dest='command')
+    worker_parser = subparsers.add_parser('worker', help="Run the tasks of a coordinator (execution_backend = remote)")
+    worker_parser.add_argument('--connect', default='', metavar='HOST:PORT',
+                               help="Address of the coordinator, defaults to coordinator_address of eats.ini")
+    worker_parser.add_argument('--slots', type=int, default=0,
+                               help="Tasks run in parallel, defaults to worker_slots of eats.ini")
+    args = parser.parse_args()
     eats_config = configparser.ConfigParser()
     eats_config.read('eats.ini')
-    config = Config()
     try:
-        TARGET_PROGRAM_ROOT = eats_config['DEFAULT']['TARGET_PROGRAM_ROOT']
-        config.TARGET_PROGRAM_ROOT = TARGET_PROGRAM_ROOT
-        config.MAX_WORKERS = int(eats_config['DEFAULT']['MAX_WORKERS'])
-        config.working_dir = eats_config['DEFAULT'].get('working_dir', '')
-        modules_to_test = eats_config['DEFAULT'].get('modules_to_test', '').split(',')
-        ignore_modules = eats_config['DEFAULT'].get('ignore_modules', '').split(',')
-        max_modules_to_test = int(eats_config['DEFAULT']['max_modules_to_test'])
-        config.max_pynguin_search_time_first_search = int(eats_config['DEFAULT']['max_pynguin_search_time_first_search'])
-        config.max_pynguin_iterations_first_search = int(eats_config['DEFAULT']['max_pynguin_iterations_first_search'])
-        config.max_pynguin_search_time_second_search = int(eats_config['DEFAULT']['max_pynguin_search_time_second_search'])
-        config.max_pynguin_iterations_second_search = int(eats_config['DEFAULT']['max_pynguin_iterations_second_search'])
-        config.max_mutmut_time = int(eats_config['DEFAULT']['max_mutmut_time'])
-        config.max_fuzz_time = int(eats_config['DEFAULT']['max_fuzz_time'])
-        config.max_fuzz_iterations = int(eats_config['DEFAULT']['max_fuzz_iterations'])
-        config.imprve_with_fuzzing = eats_config['DEFAULT'].getboolean('imprve_with_fuzzing', True)
+        config = read_config(eats_config['DEFAULT'])
     except Exception as e:
         
         logging.error(f"Error in reading eats.ini: {e}")
         print("Error in reading eats.ini")
         exit(1)
 
+    if args.command == 'worker':
+        exit(eats.main.run_worker(config, args.connect, args.slots))
+
+    if config.MAX_WORKERS < 1 and config.resource_admission:
+        # Containers wait for their resources in create_docker_container, so MAX_WORKERS only
+        # needs to exceed the containers that fit on the machine.
+        config.MAX_WORKERS = multiprocessing.cpu_count() * 2
     if config.MAX_WORKERS < 1:
         config.MAX_WORKERS = int((multiprocessing.cpu_count() - psutil.cpu_percent()) * 3/4)
         if config.MAX_WORKERS < 1:
             config.MAX_WORKERS = 1
 
-    modules_to_test = [os.path.join(TARGET_PROGRAM_ROOT, x) for x in modules_to_test if x.strip()]
-    ignore_modules = [os.path.join(TARGET_PROGRAM_ROOT, x) for x in ignore_modules if x.strip()]
-    modules = module_find(TARGET_PROGRAM_ROOT, modules_to_test, ignore_modules)[:max_modules_to_test]
-    config.module_names = modules
-
+    if args.resume is not None:
+        config.resume = True
+        if args.resume:
+            config.working_dir = args.resume
+        elif config.working_dir == "DEFAULT":
+            existing = [i for i in range(1, 1000) if os.path.exists(f"./working_dir_{i}")]
+            if existing:
+                config.working_dir = f"./working_dir_{existing[-1]}"
+        if not os.path.exists(os.path.join(config.working_dir, "manifest.jsonl")):
+            logging.warning(f"No manifest found in {config.working_dir}, every task runs")
     if config.working_dir == "DEFAULT":
         working_dir = "./working_dir_"
         for i in range(1, 1000):
@@ -61,8 +69,12 @@ if __name__ == "__main__":
     logging.info(f"PID: {os.getpid()}")
     logging.info(f"Target program root: {config.TARGET_PROGRAM_ROOT}")
     logging.info(f"Modules to test: {config.module_names}")
+    if config.skipped_modules:
+        logging.info(f"Modules skipped with nothing to test: {config.skipped_modules}")
     logging.info(f"Save to: {config.working_dir}")
     logging.info(f"Max workers: {config.MAX_WORKERS}")
+    if config.resume:
+        logging.info(f"Resuming the run in {config.working_dir}")
 
 
     if not config.working_dir.startswith("/"):
@@ -0,0 +1,7 @@
+cp "$(dirname "$0")/.coveragerc" .coveragerc
+export COVERAGE_FILE=${WORKPLACE:-/workplace}/cov_data/.coverage
+python -m coverage combine --rcfile=.coveragerc ${WORKPLACE:-/workplace}/cov_data
+# Reporting the coverage of failing tests would inflate the numbers, so stop instead.
+python "$(dirname "$0")/filter_coverage.py" ${WORKPLACE:-/workplace}/cov_data/.coverage || exit 1
+python -m coverage html --rcfile=.coveragerc -d cov_report
+python -m coverage json --rcfile=.coveragerc -o cov_report/coverage.json
\ No newline at end of file
@@ -1,7 +1,7 @@
 export PYTHONPATH="${PYTHONPATH}:${PROJECT_ROOT}"
-mv /usr/src/scripts/conftest.py.1 conftest.py
-python -m pytest /workplace/tests
-rm conftest.py
-mv /usr/src/scripts/conftest.py.2 conftest.py
-cp /usr/src/scripts/.coveragerc .coveragerc
-python -m pytest /workplace/tests --cov=/usr/src/project --cov-branch --cov-report=html:cov_report --cov-report=json:cov_report/coverage.json
\ No newline at end of file
+# A single run records the failing tests and measures the coverage of every test in its own context.
+cp "$(dirname "$0")/conftest.py.1" conftest.py
+cp "$(dirname "$0")/.coveragerc" .coveragerc
+# Each shard writes its own .coverage.<host>.<pid>.<random> file, combined by combine_cov_report.sh
+export COVERAGE_FILE=${WORKPLACE:-/workplace}/cov_data/.coverage
+python -m coverage run -p --branch --source=$PROJECT_ROOT --rcfile=.coveragerc -m pytest ${WORKPLACE:-/workplace}/tests
\ No newline at end of file
@@ -1,3 +1,3 @@
 export PYTHONPATH="${PYTHONPATH}:${PROJECT_ROOT}"
-mv /usr/src/scripts/conftest.py.2 conftest.py
-python /usr/src/scripts/run_mutmut.py
\ No newline at end of file
+cp "$(dirname "$0")/conftest.py.2" conftest.py
+python "$(dirname "$0")/run_mutmut.py"
\ No newline at end of file
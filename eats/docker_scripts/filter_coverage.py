@@ -0,0 +1,54 @@
+import glob
+import os
+import sqlite3
+import sys
+
+WORKPLACE = os.environ.get("WORKPLACE", "/workplace")
+FAILED_TESTS = os.path.join(WORKPLACE, "share_data", "failed_tests.txt")
+
+
+def recorded_failures(data_dir: str) -> int:
+    """
+    Number of failing tests the shards left in failed_count.* files next to their coverage data.
+    """
+    total = 0
+    for path in glob.glob(os.path.join(data_dir, "failed_count.*")):
+        with open(path) as f:
+            total += int(f.read().strip() or 0)
+    return total
+
+
+def drop_failed_tests(data_file: str, failed_tests_file: str = FAILED_TESTS) -> int:
+    """
+    Remove the coverage recorded in the contexts of failing tests from a coverage data file,
+    so the report only counts the passing tests.
+
+    Args:
+        data_file (str): Path to the combined coverage data file.
+        failed_tests_file (str, optional): File listing one failing test id per line.
+
+    Returns:
+        int: Number of dropped contexts.
+
+    Raises:
+        FileNotFoundError: If the shards recorded failing tests but failed_tests_file does not exist.
+    """
+    if not os.path.exists(failed_tests_file):
+        failures = recorded_failures(os.path.dirname(data_file))
+        if failures:
+            raise FileNotFoundError(f"{failures} failing tests were recorded but {failed_tests_file} is missing")
+        return 0
+    with open(failed_tests_file) as f:
+        failed = {line.strip() for line in f if line.strip()}
+    connection = sqlite3.connect(data_file)
+    with connection:
+        ids = [(context_id,) for context_id, context in connection.execute("select id, context from context")
+               if context in failed]
+        connection.executemany("delete from arc where context_id = ?", ids)
+        connection.executemany("delete from line_bits where context_id = ?", ids)
+    connection.close()
+    return len(ids)
+
+
+if __name__ == "__main__":
+    print(f"Dropped coverage of {drop_failed_tests(sys.argv[1])} failing tests")
@@ -5,6 +5,8 @@ from distutils.dir_util import copy_tree
 
 from lxml import etree
 
+WORKPLACE = os.environ.get("WORKPLACE", "/workplace")
+
 
 def report_results() -> dict:
     """
@@ -22,7 +24,7 @@ def report_results() -> dict:
         print("No modules found")
 
     result = _collect_results(modules)
-    json.dump(result, open(os.path.join("/workplace/mutmut_report/mutmut_report.json"), "w"))
+    json.dump(result, open(os.path.join(WORKPLACE, "mutmut_report", "mutmut_report.json"), "w"))
     _create_html(modules, result)
     return result
 
@@ -39,7 +41,7 @@ def _collect_results(modules: typing.List[str]) -> dict:
     """
     data = []
     for module in modules:
-        src = os.path.join("/workplace/mutmut_cache", module, "mutmut_report", "report.json")
+        src = os.path.join(WORKPLACE, "mutmut_cache", module, "mutmut_report", "report.json")
         if not os.path.exists(src):
             print(f"Result for {module} does not exist")
             continue
@@ -50,6 +52,7 @@ def _collect_results(modules: typing.List[str]) -> dict:
     survived = 0
     suspicious = 0
     timeout = 0
+    not_covered = 0
     arithmetic_mean = 0
     for d in data:
         total += d['total']
@@ -58,6 +61,7 @@ def _collect_results(modules: typing.List[str]) -> dict:
         survived += d['survived']
         suspicious += d['suspicious']
         timeout += d['timeout']
+        not_covered += d.get('not_covered', 0)
         if total == 0:
             killed_percent = 0
         else:
@@ -71,7 +75,7 @@ def _collect_results(modules: typing.List[str]) -> dict:
         killed_percent = killed / total * 100
     arithmetic_mean = arithmetic_mean/len(data)
     return {"total": total, "killed": killed, "survived": survived, 
-            "skipped": skipped, "timeout": timeout, "killed_percent": killed_percent, 
+            "skipped": skipped, "timeout": timeout, "not_covered": not_covered, "killed_percent": killed_percent, 
             "arithmetic_mean_killed": arithmetic_mean}
 
 
@@ -87,16 +91,17 @@ def _create_html(modules: typing.List[str], result: dict) -> None:
     body = etree.SubElement(root, "body")
     header = etree.SubElement(body, "h1")
     header.text = f"{result['killed']} / {result['total']} killed, \
+        {result['not_covered']} not covered, \
         arithmetic_mean: {result['arithmetic_mean_killed']:.1f}"
     merged_table = etree.SubElement(body, "table", id="merged_table")
     have_header = False
     for module in modules:
-        file_name = os.path.join("/workplace/mutmut_cache", module, "mutmut_report", "index.html")
+        file_name = os.path.join(WORKPLACE, "mutmut_cache", module, "mutmut_report", "index.html")
         if not os.path.exists(file_name):
             continue
-        code_src = os.path.join("/workplace/mutmut_cache", module, "mutmut_report", "project")
+        code_src = os.path.join(WORKPLACE, "mutmut_cache", module, "mutmut_report", "project")
         if os.path.exists(code_src):
-            copy_tree(code_src, os.path.join("/workplace/mutmut_report", "project"))
+            copy_tree(code_src, os.path.join(WORKPLACE, "mutmut_report", "project"))
         with open(file_name, "rb") as file:
             parser = etree.HTMLParser()
             tree = etree.parse(file, parser)
@@ -112,7 +117,7 @@ def _create_html(modules: typing.List[str], result: dict) -> None:
             for row in rows:
                 merged_table.append(row)
 
-    with open(os.path.join("/workplace/mutmut_report/mutmut_report.html"), "wb") as merged_file:
+    with open(os.path.join(WORKPLACE, "mutmut_report", "mutmut_report.html"), "wb") as merged_file:
         merged_file.write(etree.tostring(root, pretty_print=True))
     return
 
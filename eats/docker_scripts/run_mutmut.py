@@ -1,15 +1,212 @@
+import hashlib
 import importlib
 import inspect
 import json
 import os
+import re
+import shutil
+import sqlite3
 import sys
+import tokenize
 
 from mutmut import mutmut
 
+WORKPLACE = os.environ.get("WORKPLACE", "/workplace")
+STATE_DIR = os.path.join(WORKPLACE, "mutmut_state")
+TESTS_DIR = os.path.join(WORKPLACE, "tests")
+FAILED_TESTS = os.path.join(WORKPLACE, "share_data", "failed_tests.txt")
+CACHE_FILE = ".mutmut-cache"
+COVERAGE_JSON = os.path.join(WORKPLACE, "cov_report", "coverage.json")
+NO_MUTATE = "# pragma: no mutate"
+
+
+def relevant_tests_hash(module_name):
+    """
+    Hash the test files that could reach a module, i.e. the test files that import it,
+    together with the list of failing tests that are skipped during mutation testing.
+
+    Parameters:
+    module_name (str): Name of the module under test.
+
+    Returns:
+    str: Hex digest of the relevant test files.
+    """
+    package, _, name = module_name.rpartition(".")
+    patterns = [re.compile(rf"\b{re.escape(module_name)}\b")]
+    if package:
+        patterns.append(re.compile(rf"from\s+{re.escape(package)}\s+import\s+[^\n]*\b{re.escape(name)}\b"))
+    m = hashlib.sha256()
+    for root, dirs, files in os.walk(TESTS_DIR, followlinks=True):
+        dirs.sort()
+        for filename in sorted(files):
+            if not filename.endswith(".py"):
+                continue
+            path = os.path.join(root, filename)
+            with open(path, "rb") as f:
+                source = f.read()
+            if any(p.search(source.decode(errors="ignore")) for p in patterns):
+                m.update(os.path.relpath(path, TESTS_DIR).encode())
+                m.update(source)
+    if os.path.exists(FAILED_TESTS):
+        with open(FAILED_TESTS, "rb") as f:
+            m.update(f.read())
+    return m.hexdigest()
+
+
+def restore_verdicts(tests_hash):
+    """
+    Restore the mutmut cache of the previous run if the tests that could reach the module are
+    unchanged. mutmut keeps the verdict of every mutant keyed by its source line, so only mutants
+    on changed lines are mutated again, and the reused verdicts are bound to the current test suite.
+    If the relevant tests changed, the cache is not restored: mutmut never retests a killed
+    mutant, so its verdict could outlive the test that killed it.
+
+    Parameters:
+    tests_hash (str): Hash of the relevant test files of this run.
+
+    Returns:
+    None
+    """
+    cache = os.path.join(STATE_DIR, CACHE_FILE)
+    if not os.path.exists(cache):
+        return
+    previous_hash = None
+    if os.path.exists(os.path.join(STATE_DIR, "relevant_tests.sha256")):
+        previous_hash = open(os.path.join(STATE_DIR, "relevant_tests.sha256")).read().strip()
+    if previous_hash != tests_hash:
+        print("Relevant tests changed, every mutant is tested again")
+        return
+    try:
+        from mutmut.cache import hash_of_tests
+    except ImportError as e:
+        print(f"WARNING: mutant verdicts are not reused, mutmut.cache.hash_of_tests is missing: {e}",
+              file=sys.stderr)
+        return
+    shutil.copy(cache, CACHE_FILE)
+    connection = sqlite3.connect(CACHE_FILE)
+    with connection:
+        reused = connection.execute("UPDATE Mutant SET tested_against_hash = ? WHERE status != 'untested'",
+                                    (hash_of_tests(["tests"]),)).rowcount
+    connection.close()
+    print(f"Reusing {reused} mutant verdicts")
+
+
+def save_verdicts(tests_hash):
+    if not os.path.isdir(STATE_DIR) or not os.path.exists(CACHE_FILE):
+        return
+    shutil.copy(CACHE_FILE, os.path.join(STATE_DIR, CACHE_FILE))
+    with open(os.path.join(STATE_DIR, "relevant_tests.sha256"), "w") as f:
+        f.write(tests_hash)
+
+
+def uncovered_lines(path):
+    """
+    Find the statements of a file that no test executed, using the coverage report.
+
+    Parameters:
+    path (str): Path to the source file.
+
+    Returns:
+    set: Line numbers of the statements that were not executed, empty if the file has no coverage data.
+    """
+    if not os.path.exists(COVERAGE_JSON):
+        return set()
+    with open(COVERAGE_JSON) as f:
+        files = json.load(f).get("files", {})
+    for name, data in files.items():
+        if os.path.abspath(name) == path or path.endswith(os.sep + name):
+            return set(data.get("missing_lines", []))
+    return set()
+
+
+class SkipUncovered:
+    """
+    Context manager that marks uncovered lines with "# pragma: no mutate" while mutmut runs,
+    so mutants on them are not executed, and restores the source afterwards.
+
+    Attributes:
+    path (str): Path to the source file.
+    lines (set): Line numbers to skip.
+    not_covered (int): Number of mutants on the skipped lines.
+    """
+    def __init__(self, path, lines):
+        self.path = path
+        self.lines = lines
+        self.not_covered = 0
+        self._source = None
+
+    def __enter__(self):
+        with open(self.path, encoding="utf-8") as f:
+            self._source = f.read()
+        lines = self._source.splitlines(keepends=True)
+        # Coverage reports the first line of a statement, while mutmut reads the pragma on the
+        # line a mutant starts on. Tag every line of an uncovered statement where a comment can
+        # be appended: the lines ending in NL inside it and the line of its NEWLINE.
+        taggable = set()
+        first, statement = None, []
+        skipped_tokens = (tokenize.ENCODING, tokenize.INDENT, tokenize.DEDENT, tokenize.COMMENT, tokenize.ENDMARKER)
+        with open(self.path, "rb") as f:
+            for token in tokenize.tokenize(f.readline):
+                if token.type in (tokenize.NEWLINE, tokenize.NL):
+                    if first is None:
+                        continue
+                    statement.append(token.start[0])
+                    if token.type == tokenize.NEWLINE:
+                        if first in self.lines:
+                            taggable.update(statement)
+                        first, statement = None, []
+                elif first is None and token.type not in skipped_tokens:
+                    first = token.start[0]
+        self.lines = {n for n in taggable if n <= len(lines) and NO_MUTATE not in lines[n - 1]}
+        self.not_covered = self._count_mutants()
+        for n in self.lines:
+            line = lines[n - 1]
+            ending = line[len(line.rstrip("\r\n")):]
+            lines[n - 1] = line.rstrip("\r\n") + "  " + NO_MUTATE + ending
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write("".join(lines))
+        print(f"Skipping {self.not_covered} mutants on {len(self.lines)} uncovered lines")
+        return self
+
+    def __exit__(self, *args):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(self._source)
+        return False
+
+    def _count_mutants(self):
+        try:
+            from mutmut import Context, list_mutations
+        except ImportError:
+            print("mutmut does not provide list_mutations, not covered mutants are not counted")
+            return 0
+        context = Context(source=self._source, filename=self.path)
+        return sum(1 for mutation_id in list_mutations(context) if mutation_id.line_number + 1 in self.lines)
+
+
+def add_not_covered(report, not_covered):
+    """
+    Count the skipped mutants as survived, and separately as not covered, in the report.
+
+    Parameters:
+    report (list): Report created by mutmut.
+    not_covered (int): Number of mutants on uncovered lines.
+
+    Returns:
+    list: The updated report.
+    """
+    if not report:
+        report.append({"total": 0, "skipped": 0, "killed": 0, "survived": 0, "suspicious": 0, "timeout": 0})
+    report[0]["not_covered"] = not_covered
+    report[0]["total"] += not_covered
+    report[0]["survived"] += not_covered
+    return report
+
 
 def main(html_report="mutmut_report", json_report="mutmut_report/report.json"):
-    """  # noqa: E501
+    """
     Runs mutation testing on a specified module and generates both an HTML and a JSON report.
+    Verdicts of a previous run are reused if $WORKPLACE/mutmut_state holds its cache.
+    If skip_uncovered is set, mutants on lines no test executes are counted as survived without running them.
 
     Parameters:
     html_report (str): The file path where the HTML report will be saved. Default is "mutmut_report".
@@ -20,9 +217,16 @@ def main(html_report="mutmut_report", json_report="mutmut_report/report.json"):
     """
     sys.path.append(os.environ['PROJECT_ROOT'])
     module = importlib.import_module(os.environ['module_name'])
-    mutmut.run([inspect.getfile(module)])
+    tests_hash = relevant_tests_hash(os.environ['module_name'])
+    restore_verdicts(tests_hash)
+    path = os.path.abspath(inspect.getfile(module))
+    lines = uncovered_lines(path) if os.getenv("skip_uncovered") == "1" else set()
+    with SkipUncovered(path, lines) as skip:
+        mutmut.run([path])
+    save_verdicts(tests_hash)
     mutmut.html(["Struct", "NamedStruct"], html_report)
-    json.dump(mutmut.create_report(), open(json_report, "w", encoding="utf-8"))
+    report = add_not_covered(mutmut.create_report(), skip.not_covered)
+    json.dump(report, open(json_report, "w", encoding="utf-8"))
 
 
 if __name__ == "__main__":
@@ -1 +1 @@
-python -m pytest -x --timeout 5 /workplace/tests/**
\ No newline at end of file
+python -m pytest -x --timeout 5 ${WORKPLACE:-/workplace}/tests/**
\ No newline at end of file
@@ -1,11 +1,12 @@
 import ast
+import copy
 import json
 import os
 import typing
 
-import astor
-import autoflake
-import black
+from codegen import emit
+
+WORKPLACE = os.environ.get("WORKPLACE", "/workplace")
 
 
 def has_decorator(func: ast.FunctionDef, decorator_name: str) -> bool:
@@ -149,57 +150,85 @@ class AssertRemover(ast.NodeTransformer):
         return self.generic_visit(node)
     
 
-def RecreateTests(test_name: str, test_source: str, 
-                  test_data: typing.List[typing.Dict], path_to_out: str):
-    if len(test_data) == 0:
-        return 1
-    collector = ImportCollector()
-    collector.visit(test_source)
-    new_code = astor.to_source(collector.get_imports())
+def iter_test_data(path: str) -> typing.Iterator[typing.Dict]:
+    """
+    Reads the fuzzed values of a test lazily from a JSON Lines file.
+
+    Parameters:
+    path (str): Path to the file, one dict of values per line.
+
+    Returns:
+    Iterator[dict]: The fuzzed values.
+    """
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
 
+
+def RecreateTests(test_name: str, test_source: ast.AST,
+                  test_data: typing.Iterable[typing.Dict]) -> typing.Optional[typing.List[ast.FunctionDef]]:
+    """
+    Recreates a test once for every set of fuzzed values.
+
+    Parameters:
+    test_name (str): The name of the test function.
+    test_source (ast.AST): The parsed test file.
+    test_data (Iterable[dict]): The fuzzed values of the test, one dict per recreated test.
+
+    Returns:
+    list: The recreated test functions, or None if there is nothing to recreate.
+    """
     finder = FunctionFinder(test_name)
     finder.visit(test_source)
     if len(finder.functions) == 0:
-        return 1
-    function = finder.functions[0]
+        return None
+    function = copy.deepcopy(finder.functions[0])
 
     remover = AssertRemover()
     function = remover.visit(function)
+    functions = []
     for data in test_data:
         value_changer = ValueChanger(data)
-        new_function = value_changer.visit(function)
-        new_code += astor.to_source(new_function)
-    formatted_code = black.format_file_contents(new_code, mode=black.FileMode(), fast=False)
-    with open(path_to_out, 'w') as f:
-        f.write(formatted_code)
-    autoflake._main(['autoflake', '--in-place', '--remove-all-unused-imports', path_to_out], None, None)
-    return 0
+        function = value_changer.visit(function)
+        functions.append(copy.deepcopy(function))
+    return functions or None
 
 
-if __name__ == "__main__":
-    test_file_name = os.listdir("/workplace/tests")[0]
-    code = open(os.path.join('/workplace/tests', test_file_name)).read()
+def recreate_file(test_file_name):
+    """
+    Recreate the tests of one test file with the inputs found by fuzzing its harnesses,
+    writing them to recreation_results under the same name.
+
+    Parameters:
+    test_file_name (str): Name of the test file in the tests folder.
+
+    Returns:
+    int: Number of recreated test functions.
+    """
+    code = open(os.path.join(WORKPLACE, 'tests', test_file_name)).read()
     code = ast.parse(code)
     tests = discover_tests(code)
-    os.makedirs("/tmp/tests", exist_ok=True)
-    outs = []
+    functions = []
     for test in tests:
-        path_to_test_data = f"/workplace/tests_fuzzed_result/{test_file_name[:-3]}_{test}.py/{test_file_name[:-3]}_{test}.py.json"
+        path_to_test_data = f"{WORKPLACE}/tests_fuzzed_result/{test_file_name[:-3]}_{test}.py/{test_file_name[:-3]}_{test}.py.jsonl"
         if not os.path.exists(path_to_test_data):
             continue
-        test_data = json.load(open(path_to_test_data))
-        out_path_ = f"/tmp/tests/test_flutils_validators_{test}.py"
-        ret = RecreateTests(test, code, test_data, out_path_)
-        if ret == 0:
-            outs.append(out_path_)
-    if len(outs) == 0:
-        print("No tests to recreate")
-        exit(1)
-    final_out = f"/workplace/recreation_results/{test_file_name}"
+        functions += RecreateTests(test, code, iter_test_data(path_to_test_data)) or []
+    if len(functions) == 0:
+        return 0
+    collector = ImportCollector()
+    collector.visit(code)
+    final_out = f"{WORKPLACE}/recreation_results/{test_file_name}"
     with open(final_out, 'w') as f:
-        for out in outs:
-            f.write(open(out).read())
-            f.write("\n")
-    
+        f.write(emit(collector.get_imports(), *functions))
+    return len(functions)
 
 
+if __name__ == "__main__":
+    # Every test file, as enumerated by transform.py.
+    test_file_names = sorted(name for name in os.listdir(os.path.join(WORKPLACE, "tests")) if name.endswith('.py'))
+    recreated = sum(recreate_file(test_file_name) for test_file_name in test_file_names)
+    if recreated == 0:
+        print("No tests to recreate")
+        exit(1)
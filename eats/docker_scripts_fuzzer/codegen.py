@@ -0,0 +1,98 @@
+import ast
+import os
+import typing
+
+
+def format_enabled() -> bool:
+    """
+    Checks whether generated files should be formatted with black, set with the format_code
+    environment variable.
+    """
+    return os.getenv('format_code', '0').lower() in ('1', 'true', 'yes')
+
+
+def _used_names(nodes: typing.Iterable[ast.AST]) -> typing.Set[str]:
+    names = set()
+    for node in nodes:
+        for child in ast.walk(node):
+            if isinstance(child, ast.Name):
+                names.add(child.id)
+    return names
+
+
+def _bound_name(alias: ast.alias, from_import: bool) -> str:
+    if alias.asname:
+        return alias.asname
+    return alias.name if from_import else alias.name.split('.')[0]
+
+
+class UnusedImportRemover(ast.NodeTransformer):
+    """
+    Removes the imported names that are not used anywhere in the code.
+
+    Attributes:
+    used (set): Names used in the code.
+    """
+    def __init__(self, used: typing.Set[str]):
+        self.used = used
+
+    def visit_Import(self, node):
+        node.names = [alias for alias in node.names if _bound_name(alias, False) in self.used]
+        return node if node.names else None
+
+    def visit_ImportFrom(self, node):
+        if node.module == '__future__':
+            return node
+        node.names = [alias for alias in node.names
+                      if alias.name == '*' or _bound_name(alias, True) in self.used]
+        return node if node.names else None
+
+    def generic_visit(self, node):
+        node = super().generic_visit(node)
+        # A block left without statements needs a pass, e.g. `with atheris.instrument_imports():`
+        if not isinstance(node, ast.Module) and isinstance(getattr(node, 'body', None), list) and not node.body:
+            node.body = [ast.Pass()]
+        return node
+
+
+def remove_unused_imports(*nodes: ast.AST) -> None:
+    """
+    Removes, in place, the imports of the given nodes that none of the nodes use.
+
+    Parameters:
+    nodes (ast.AST): Nodes making up one output file.
+    """
+    remover = UnusedImportRemover(_used_names(nodes))
+    for node in nodes:
+        remover.visit(node)
+
+
+def emit(*nodes: ast.AST, format_code: typing.Optional[bool] = None) -> str:
+    """
+    Generates the source code of a file from its nodes, without unused imports.
+
+    Parameters:
+    nodes (ast.AST): Nodes making up the file.
+    format_code (bool, optional): Whether to format the code with black. Defaults to format_enabled().
+
+    Returns:
+    str: The source code.
+    """
+    remove_unused_imports(*nodes)
+    code = "\n\n".join(ast.unparse(ast.fix_missing_locations(node)) for node in nodes) + "\n"
+    return format_source(code, format_code)
+
+
+def format_source(code: str, format_code: typing.Optional[bool] = None) -> str:
+    """
+    Formats the source code of a file with black if enabled.
+    """
+    if format_code is None:
+        format_code = format_enabled()
+    if not format_code:
+        return code
+    import black
+    try:
+        return black.format_file_contents(code, mode=black.FileMode(), fast=True)
+    except black.NothingChanged:
+        return code
@@ -1,6 +1,8 @@
 import os
 
-directory = '/workplace/finial_pynguin_results'
+WORKPLACE = os.environ.get('WORKPLACE', '/workplace')
+
+directory = os.path.join(WORKPLACE, 'finial_pynguin_results')
 for filename in os.listdir(directory):
     if filename.endswith('.py'):
         file_root, file_extension = os.path.splitext(filename)
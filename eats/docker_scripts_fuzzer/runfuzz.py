@@ -1,67 +1,467 @@
+import concurrent.futures
+import hashlib
 import importlib
+import importlib.util
 import json
+import math
+import multiprocessing
 import os
+import re
 import shutil
 import subprocess
 import sys
+import threading
 import time
 
 import psutil
 
+WORKPLACE = os.environ.get('WORKPLACE', '/workplace')
+PROGRESS_RE = re.compile(r'\b(cov|ft|corp): (\d+)')
+# A fuzzer below IDLE_CPU_PERCENT of a CPU without new coverage for IDLE_CHECK_INTERVAL seconds is hung.
+IDLE_CHECK_INTERVAL = 10
+IDLE_CPU_PERCENT = 3
 
-def early_stop_process(process, timeout):
+
+class FuzzProgress:
+    """
+    Tracks the progress of a libFuzzer run from the cov:, ft: and corp: counters it prints
+    to stderr and from the number of files in its corpus directory.
+    """
+    def __init__(self, corpus_dir):
+        self.corpus_dir = corpus_dir
+        self.counters = {}
+        self.corpus_files = 0
+        self.last_new = time.time()
+        self._lock = threading.Lock()
+
+    def follow(self, stream):
+        for line in iter(stream.readline, b''):
+            sys.stderr.buffer.write(line)
+            sys.stderr.flush()
+            counters = {k: int(v) for k, v in PROGRESS_RE.findall(line.decode(errors='replace'))}
+            with self._lock:
+                if any(v > self.counters.get(k, 0) for k, v in counters.items()):
+                    self.last_new = time.time()
+                self.counters.update(counters)
+        stream.close()
+
+    def check_corpus(self):
+        try:
+            corpus_files = len(os.listdir(self.corpus_dir))
+        except OSError:
+            return
+        with self._lock:
+            if corpus_files > self.corpus_files:
+                self.corpus_files = corpus_files
+                self.last_new = time.time()
+
+    def idle_time(self):
+        with self._lock:
+            return time.time() - self.last_new
+
+
+def _cpu_seconds(process):
+    try:
+        times = psutil.Process(process.pid).cpu_times()
+    except psutil.Error:
+        return 0.0
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def early_stop_process(process, timeout, progress, plateau_time):
+    """
+    Waits for a fuzzer, stopping it at the timeout or once it found no new coverage,
+    features or corpus entries for plateau_time seconds (0 to never stop early).
+    Whatever plateau_time is, a fuzzer that found nothing new and used next to no CPU
+    for IDLE_CHECK_INTERVAL seconds is hung and stopped as idle.
+
+    Returns the reason the fuzzer stopped.
+    """
+    next_idle_check = time.time() + IDLE_CHECK_INTERVAL
+    cpu_seconds = _cpu_seconds(process)
     while time.time() < timeout:
         if process.poll() is not None:
-            return process.returncode
-        p = psutil.Process(process.pid)
-        cpu_usage = p.cpu_percent(interval=1)
-        # print(f"CPU usage of the {process.args}: {cpu_usage}%")
-        if cpu_usage < 3:
+            return 'finished'
+        progress.check_corpus()
+        if plateau_time and progress.idle_time() > plateau_time:
             process.terminate()
-            return
-        time.sleep(10)
+            process.wait()
+            return 'plateau'
+        if time.time() >= next_idle_check:
+            now = _cpu_seconds(process)
+            used, cpu_seconds = now - cpu_seconds, now
+            next_idle_check = time.time() + IDLE_CHECK_INTERVAL
+            if progress.idle_time() > IDLE_CHECK_INTERVAL and used / IDLE_CHECK_INTERVAL * 100 < IDLE_CPU_PERCENT:
+                process.terminate()
+                process.wait()
+                return 'idle'
+        time.sleep(1)
     process.terminate()
+    process.wait()
+    return 'timeout'
+
+
+def fuzz(test_path, out_path, atheris_runs, max_run_time, plateau_time=0):
+    """
+    Runs a fuzz harness on the corpus directory out_path, resuming from the inputs already in it.
+
+    Returns the stats of the run.
+    """
+    os.makedirs(out_path, exist_ok=True)
+    start = time.time()
+    process = subprocess.Popen(['python', test_path, f'-atheris_runs={atheris_runs}', out_path], stderr=subprocess.PIPE)
+    progress = FuzzProgress(out_path)
+    reader = threading.Thread(target=progress.follow, args=(process.stderr,), daemon=True)
+    reader.start()
+    reason = early_stop_process(process, start + max_run_time, progress, plateau_time)
+    reader.join(5)
+    progress.check_corpus()
+    elapsed = time.time() - start
+    return {
+        'stop_reason': reason,
+        'elapsed': round(elapsed, 1),
+        'reclaimed': round(max(0, max_run_time - elapsed), 1) if reason != 'timeout' else 0,
+        'cov': progress.counters.get('cov', 0),
+        'ft': progress.counters.get('ft', 0),
+        'corpus': progress.corpus_files,
+    }
+
+
+def _harness_module(test_path):
+    # Loaded by file path: a dotted name built from the path breaks on directories like .eats_local.
+    module_name = f"_harness_{hashlib.sha256(os.path.abspath(test_path).encode()).hexdigest()[:16]}"
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.spec_from_file_location(module_name, test_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+_decoder = None
+
+
+def _init_decoder(test_path):
+    global _decoder
+    sys.path.append("/")
+    _decoder = _harness_module(test_path).fuzz_reader
+
+
+def _decode_file(path):
+    with open(path, 'br') as f:
+        return _decoder(f.read())
+
+
+def iter_inputs(test_path, corpus_dir, workers=1):
+    """
+    Decodes the inputs of the corpus directory one by one with the fuzz_reader of the harness,
+    on a pool of workers processes if workers > 1.
+    """
+    paths = (entry.path for entry in os.scandir(corpus_dir) if entry.is_file())
+    if workers > 1:
+        with multiprocessing.Pool(workers, initializer=_init_decoder, initargs=(test_path,)) as pool:
+            yield from pool.imap(_decode_file, paths, chunksize=64)
+        return
+    fuzz_reader = _harness_module(test_path).fuzz_reader
+    for path in paths:
+        with open(path, 'br') as f:
+            yield fuzz_reader(f.read())
+
+
+def write_inputs(inputs, path):
+    """
+    Streams decoded inputs to a JSON Lines file, one input per line.
+
+    Returns the number of written inputs.
+    """
+    count = 0
+    with open(path + '.tmp', 'w') as f:
+        for d in inputs:
+            f.write(json.dumps(d, default=repr))
+            f.write('\n')
+            count += 1
+    os.replace(path + '.tmp', path)
+    return count
+
+
+def minimise_corpus(test_path, corpus_dir, timeout=300):
+    """
+    Keeps only the inputs of the corpus that add coverage, with libFuzzer's -merge=1.
+
+    Returns the directory of the minimised corpus, or corpus_dir if the merge failed.
+    """
+    merged_dir = corpus_dir + '.min'
+    shutil.rmtree(merged_dir, ignore_errors=True)
+    os.makedirs(merged_dir)
+    try:
+        subprocess.run(['python', test_path, '-merge=1', merged_dir, corpus_dir],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=timeout, check=True)
+    except (subprocess.SubprocessError, OSError) as e:
+        print(f"Corpus merge of {test_path} failed, keeping the full corpus: {e}")
+        return corpus_dir
+    if not os.listdir(merged_dir) and os.listdir(corpus_dir):
+        return corpus_dir
+    return merged_dir
+
+
+def dedupe_inputs(inputs, max_cases=0):
+    """
+    Drops decoded inputs with the same values and stops after max_cases of them (0 for no limit).
+    """
+    seen = set()
+    for d in inputs:
+        key = hashlib.sha1(json.dumps(d, sort_keys=True, default=repr).encode()).digest()
+        if key in seen:
+            continue
+        seen.add(key)
+        yield d
+        if max_cases and len(seen) >= max_cases:
+            return
+
+
+def collect_inputs(test_path, corpus_dir, inputs_path):
+    """
+    Streams the distinct test values of the minimised corpus of a harness to inputs_path,
+    capped by fuzz_max_cases.
 
+    Returns the number of written cases.
+    """
+    n_files = len(os.listdir(corpus_dir))
+    min_dir = minimise_corpus(test_path, corpus_dir) if n_files else corpus_dir
+    inputs = iter_inputs(test_path, min_dir, int(os.getenv('fuzz_decode_workers', 1)))
+    count = write_inputs(dedupe_inputs(inputs, int(os.getenv('fuzz_max_cases', 0))), inputs_path)
+    print(f"{os.path.basename(test_path)}: {n_files} inputs, {len(os.listdir(min_dir))} after merge, {count} cases kept")
+    return count
 
-def run_fuzz_test(test_path, out_path, atheris_runs, delete_tmp=True):
+
+def run_fuzz_test(test_path, out_path, atheris_runs, inputs_path, delete_tmp=True):
     max_run_time = 300
     if os.getenv('atheris_max_run_time'):
         max_run_time = int(os.getenv('atheris_max_run_time'))
-    os.makedirs(out_path, exist_ok=True)
-    process = subprocess.Popen(['python', test_path, f'-atheris_runs={atheris_runs}', out_path])
-    early_stop_process(process, time.time() + max_run_time)
-    module_name = test_path.replace('/', '.').replace('.py', '')
-    if module_name.startswith('.'):
-        module_name = module_name[1:]
-    module = importlib.import_module(module_name)
-    inputs = []
-    for file in os.listdir(out_path):
-        with open(os.path.join(out_path, file), 'br') as f:
-            data = f.read()
-        d = module.fuzz_reader(data)
-        inputs.append(d)
+    plateau_time = int(os.getenv('fuzz_plateau_time', 0))
+    stats = fuzz(test_path, out_path, atheris_runs, max_run_time, plateau_time)
+    count = collect_inputs(test_path, out_path, inputs_path)
     if delete_tmp:
         shutil.rmtree(out_path, ignore_errors=True)
-    return inputs
+        shutil.rmtree(out_path + '.min', ignore_errors=True)
+    return count, stats
+
+
+def get_atheris_runs():
+    try:
+        return int(os.getenv('atheris_runs'))
+    except Exception:
+        return 100000
 
 
 def run(test_name, out_path):
     try:
-        try:
-            atheris_runs = os.getenv('atheris_runs')
-            atheris_runs = int(atheris_runs)
-        except Exception:
-            atheris_runs = 100000
+        atheris_runs = get_atheris_runs()
         print(f"Running {test_name}, atheris_runs={atheris_runs}")
-        inputs = run_fuzz_test(os.path.join("/workplace/tests_transformed", test_name), os.path.join(out_path, f"tmp/{test_name}"), atheris_runs, delete_tmp=False)
-        json.dump(inputs, open(os.path.join(out_path, f'{test_name}.json'), 'w'), indent=4)
-        print(f"Finished {test_name}")
+        _, stats = run_fuzz_test(os.path.join(WORKPLACE, "tests_transformed", test_name), os.path.join(out_path, f"tmp/{test_name}"), atheris_runs,
+                                 os.path.join(out_path, f'{test_name}.jsonl'), delete_tmp=False)
+        json.dump(stats, open(os.path.join(out_path, f'{test_name}.stats.json'), 'w'))
+        print(f"Finished {test_name}: {stats['stop_reason']} after {stats['elapsed']}s, reclaimed {stats['reclaimed']}s")
+    except Exception as e:
+        print(f"Error in {test_name}: {e}")
+        return 1
+
+
+def cpu_allocation():
+    """
+    Number of CPUs the container may use: its share of the host given in cpu_share,
+    bounded by the cgroup CPU quota and the CPU affinity.
+    """
+    cpus = len(os.sched_getaffinity(0))
+    if int(os.getenv('cpu_share', 0)) > 0:
+        cpus = min(cpus, int(os.environ['cpu_share']))
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def _run_harness(test_name, out_root):
+    sys.path.append("/")
+    return run(test_name, os.path.join(out_root, test_name))
+
+
+def run_harnesses(test_names, out_root, workers=None):
+    """
+    Fuzz several harnesses in parallel, writing the results of each harness to out_root/<test_name>.
+
+    Returns the names of the failed harnesses.
+    """
+    workers = max(1, min(len(test_names), workers or cpu_allocation()))
+    print(f"Running {len(test_names)} harnesses on {workers} workers")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {test_name: executor.submit(_run_harness, test_name, out_root) for test_name in test_names}
+    return [test_name for test_name, future in futures.items() if future.exception() or future.result() == 1]
+
+
+class Arm:
+    """
+    A harness competing for the fuzz budget.
+
+    Attributes:
+    test_name (str): Name of the harness.
+    slices (int): Number of time slices the harness ran.
+    elapsed (float): Seconds the harness ran in total.
+    reward (float): Sum of the yields of its slices, in new features and corpus entries per second.
+    ft (int): Highest feature count reached.
+    corpus (int): Number of corpus entries.
+    retired (bool): Whether the harness stopped finding new inputs.
+    stats (dict): Stats of the last slice.
+    """
+    def __init__(self, test_name):
+        self.test_name = test_name
+        self.slices = 0
+        self.elapsed = 0.0
+        self.reward = 0.0
+        self.ft = 0
+        self.corpus = 0
+        self.retired = False
+        self.stats = {}
+
+    def update(self, stats):
+        gain = max(0, stats['ft'] - self.ft) + max(0, stats['corpus'] - self.corpus)
+        self.slices += 1
+        self.elapsed += stats['elapsed']
+        self.reward += gain / max(stats['elapsed'], 1)
+        self.ft = max(self.ft, stats['ft'])
+        self.corpus = max(self.corpus, stats['corpus'])
+        self.stats = stats
+        # A harness whose slice found nothing new, or that finished its runs or hung, gets no more time.
+        if gain == 0 or stats['stop_reason'] in ('finished', 'idle'):
+            self.retired = True
+
+
+class BudgetAllocator:
+    """
+    Hands out time slices of a total fuzz budget to harnesses, UCB1 style: every harness
+    gets one slice, then the slices go to the harnesses with the best recent yield of new
+    features and corpus entries. Harnesses whose slice found nothing new are retired.
+
+    Attributes:
+    arms (dict): The harnesses by name.
+    budget (float): Total harness seconds to hand out.
+    slice_time (int): Length of a slice in seconds.
+    used (float): Harness seconds handed out so far.
+    """
+    def __init__(self, test_names, budget, slice_time):
+        self.arms = {test_name: Arm(test_name) for test_name in test_names}
+        self.budget = budget
+        self.slice_time = slice_time
+        self.used = 0.0
+        self._lock = threading.Lock()
+
+    def next_slice(self, running):
+        """
+        Picks the harness to run next and reserves its slice.
+
+        Returns the harness name and the slice length, or None if the budget is spent or no harness is left.
+        """
+        with self._lock:
+            remaining = self.budget - self.used
+            candidates = [arm for arm in self.arms.values() if not arm.retired and arm.test_name not in running]
+            if remaining < 1 or not candidates:
+                return None
+            total = sum(arm.slices for arm in self.arms.values())
+            scale = max([arm.reward / arm.slices for arm in self.arms.values() if arm.slices] + [1e-9])
+
+            def score(arm):
+                if arm.slices == 0:
+                    return float('inf')
+                return arm.reward / arm.slices + scale * math.sqrt(2 * math.log(max(total, 1)) / arm.slices)
+
+            arm = max(candidates, key=score)
+            length = min(self.slice_time, remaining)
+            self.used += length
+            return arm.test_name, length
+
+    def report(self, test_name, length, stats):
+        with self._lock:
+            # Return the unused part of the slice to the budget.
+            self.used -= max(0, length - stats['elapsed'])
+            self.arms[test_name].update(stats)
+
+
+def _decode_harness(test_name, out_root, stats):
+    sys.path.append("/")
+    out_path = os.path.join(out_root, test_name)
+    try:
+        collect_inputs(os.path.join(WORKPLACE, "tests_transformed", test_name), os.path.join(out_path, f"tmp/{test_name}"),
+                       os.path.join(out_path, f'{test_name}.jsonl'))
+        json.dump(stats, open(os.path.join(out_path, f'{test_name}.stats.json'), 'w'))
+        print(f"Finished {test_name}: {stats['slices']} slices, {stats['elapsed']}s")
     except Exception as e:
         print(f"Error in {test_name}: {e}")
         return 1
 
 
+def run_harnesses_with_budget(test_names, out_root, budget, slice_time, workers=None):
+    """
+    Fuzz several harnesses in parallel within a total budget of harness seconds, handing the
+    time out by a BudgetAllocator. Writes the results of each harness to out_root/<test_name>.
+
+    Returns the names of the failed harnesses.
+    """
+    workers = max(1, min(len(test_names), workers or cpu_allocation()))
+    allocator = BudgetAllocator(test_names, budget, slice_time)
+    atheris_runs = get_atheris_runs()
+    plateau_time = int(os.getenv('fuzz_plateau_time', 0))
+    print(f"Fuzzing {len(test_names)} harnesses on {workers} workers within {budget}s")
+
+    def fuzz_slice(test_name, length):
+        out_path = os.path.join(out_root, test_name, f"tmp/{test_name}")
+        return fuzz(os.path.join(WORKPLACE, "tests_transformed", test_name), out_path, atheris_runs, length, plateau_time)
+
+    running = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            while len(running) < workers:
+                picked = allocator.next_slice({name for name, _ in running.values()})
+                if picked is None:
+                    break
+                running[executor.submit(fuzz_slice, *picked)] = picked
+            if not running:
+                break
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                test_name, length = running.pop(future)
+                try:
+                    stats = future.result()
+                except Exception as e:
+                    print(f"Error in {test_name}: {e}")
+                    stats = {'stop_reason': 'error', 'elapsed': length, 'reclaimed': 0, 'cov': 0, 'ft': 0, 'corpus': 0}
+                allocator.report(test_name, length, stats)
+
+    for arm in allocator.arms.values():
+        state = 'retired' if arm.retired else 'budget spent'
+        print(f"{arm.test_name}: {arm.slices} slices, {arm.elapsed:.0f}s, ft={arm.ft}, corpus={arm.corpus}, {state}")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {arm.test_name: executor.submit(_decode_harness, arm.test_name, out_root,
+                                                  dict(arm.stats, slices=arm.slices, elapsed=round(arm.elapsed, 1),
+                                                       reclaimed=0, retired=arm.retired))
+                   for arm in allocator.arms.values() if arm.slices}
+    return [test_name for test_name, future in futures.items() if future.exception() or future.result() == 1]
+
+
 if __name__ == '__main__':
     sys.path.append("/")
-    run(os.environ['test_name'], '/workplace/fuzzed_results')
+    if os.getenv('test_names'):
+        test_names = os.environ['test_names'].split(',')
+        workers = int(os.getenv('fuzz_workers', 0))
+        if int(os.getenv('fuzz_budget', 0)):
+            failed = run_harnesses_with_budget(test_names, os.path.join(WORKPLACE, 'fuzzed_results'), int(os.environ['fuzz_budget']),
+                                               int(os.getenv('fuzz_slice_time', 30)), workers)
+        else:
+            failed = run_harnesses(test_names, os.path.join(WORKPLACE, 'fuzzed_results'), workers)
+        sys.exit(1 if failed else 0)
+    run(os.environ['test_name'], os.path.join(WORKPLACE, 'fuzzed_results'))
 
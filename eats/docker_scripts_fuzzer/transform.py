@@ -1,11 +1,15 @@
 import ast
+import concurrent.futures
+import copy
 import os
+import sys
+import traceback
 import typing
 from ast import Load
 
-import astor
-import autoflake
-import black
+from codegen import emit
+
+WORKPLACE = os.environ.get("WORKPLACE", "/workplace")
 
 
 def has_decorator(func, decorator_name):
@@ -123,6 +127,7 @@ class TestTransformer(ast.NodeTransformer):
         func_def = ast.FunctionDef(
             name="fuzz_reader",
             args=ast.arguments(
+                posonlyargs=[],
                 args=[ast.arg(arg="data", annotation=None)],
                 vararg=None,
                 kwonlyargs=[],
@@ -154,7 +159,7 @@ class TestTransformer(ast.NodeTransformer):
 
             except_handler = ast.ExceptHandler(
                 type=ast.Name(id='Exception', ctx=ast.Load()),
-                name=ast.Name(id='e', ctx=ast.Store()),
+                name='e',
                 body=[ast.Pass()]
             )
             node.body = [ast.Try(
@@ -201,48 +206,88 @@ if __name__ == "__main__":
     return tree
 
 
+def create_test_harness(tree, test):
+    """
+    Build the fuzz harness of one test from the parsed test file.
+
+    Only the nodes kept in the harness are copied, so the tree of the file is parsed once
+    and shared by every test of the file.
+
+    Returns the harness module and the fuzz_reader and main functions, or None if the test
+    has no constants to fuzz.
+    """
+    parsed_code = ast.Module(
+        body=[copy.deepcopy(node) for node in tree.body if not isinstance(node, ast.FunctionDef) or node.name == test],
+        type_ignores=[])
+
+    import_statement = ast.Import(names=[ast.alias(name='sys', asname=None)])
+    parsed_code.body.insert(0, import_statement)
+
+    imports = transform_import(parsed_code)
+
+    import_statement = ast.Import(names=[ast.alias(name='atheris', asname=None)])
+    parsed_code.body.insert(0, import_statement)
+
+    transformer = AssertRemover()
+    parsed_code = transformer.visit(parsed_code)
+
+    transformer = TestTransformer()
+    parsed_code = transformer.visit(parsed_code)
+    if transformer.should_ignore:
+        return None
+    fuzz_reader = transformer.create_fuzz_reader()
+
+    transformer = FunctionTransformer()
+    parsed_code = transformer.visit(parsed_code)
+    return parsed_code, fuzz_reader, create_main_function(test, imports)
+
+
 def transform_code(in_path, out_path):
     out_paths = []
     code = open(in_path, 'br').read()
     parsed_code = ast.parse(code)
     tests = discover_tests(parsed_code)
     for test in tests:
-        parsed_code = ast.parse(code)
-        new_body = [node for node in parsed_code.body if not isinstance(node, ast.FunctionDef) or node.name == test]
-        parsed_code.body = new_body
-
-        import_statement = ast.Import(names=[ast.alias(name='sys', asname=None)])
-        parsed_code.body.insert(0, import_statement)
-
-        imports = transform_import(parsed_code)
-
-        import_statement = ast.Import(names=[ast.alias(name='atheris', asname=None)])
-        parsed_code.body.insert(0, import_statement)
-
-        transformer = AssertRemover()
-        parsed_code = transformer.visit(parsed_code)
-
-        transformer = TestTransformer()
-        parsed_code = transformer.visit(parsed_code)
-        if transformer.should_ignore:
+        harness = create_test_harness(parsed_code, test)
+        if harness is None:
             continue
-        fuzz_reader = transformer.create_fuzz_reader()
-
-        transformer = FunctionTransformer()
-        parsed_code = transformer.visit(parsed_code)
-        new_code = astor.to_source(parsed_code)
-        new_code += astor.to_source(fuzz_reader)
-        new_code += astor.to_source(create_main_function(test, imports))
-        formatted_code = black.format_file_contents(new_code, mode=black.FileMode(), fast=False)
         out_path_ = os.path.join(out_path, os.path.basename(in_path)[:-3] + "_" + test + ".py")
         with open(out_path_, 'w') as f:
-            f.write(formatted_code)
-        autoflake._main(['autoflake', '--in-place', '--remove-all-unused-imports', out_path_], None, None)
+            f.write(emit(*harness))
         out_paths.append(out_path_)
     return out_paths
 
 
+def transform_dir(in_dir, out_dir, executor):
+    """
+    Transform every test file of a directory, one file per task of the executor.
+
+    Returns the futures of the files.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    return {os.path.join(in_dir, name): executor.submit(transform_code, os.path.join(in_dir, name), out_dir)
+            for name in sorted(os.listdir(in_dir)) if name.endswith('.py')}
+
+
 if __name__ == "__main__":
-    in_path = os.path.join("/workplace/tests", os.listdir("/workplace/tests")[0])
-    out_path = "/workplace/tests_transformed"
-    print("\n".join(transform_code(in_path, out_path)))
+    in_root = os.path.join(WORKPLACE, "tests")
+    out_root = os.path.join(WORKPLACE, "tests_transformed")
+    # Batch mode: in_root and out_root hold one folder per module of module_names.
+    module_names = [m for m in os.environ.get('module_names', '').split(',') if m]
+    jobs = {m: (os.path.join(in_root, m), os.path.join(out_root, m)) for m in module_names} or {'': (in_root, out_root)}
+    failed = False
+    with concurrent.futures.ProcessPoolExecutor(max_workers=int(os.environ.get('transform_workers', 0)) or None) as executor:
+        futures = {}
+        for module, (in_dir, out_dir) in jobs.items():
+            if not os.path.isdir(in_dir):
+                print(f"No tests found for {module}", file=sys.stderr)
+                continue
+            futures.update(transform_dir(in_dir, out_dir, executor))
+        for in_path, future in futures.items():
+            try:
+                print("\n".join(future.result()))
+            except Exception:
+                print(f"Failed to transform {in_path}", file=sys.stderr)
+                traceback.print_exc()
+                failed = True
+    sys.exit(1 if failed else 0)
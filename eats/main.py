@@ -1,14 +1,29 @@
 import eats.logging_config
 
-import concurrent.futures
+import asyncio
+import functools
 import logging
+import multiprocessing
 import os
+import typing
 
+from eats.ArtifactCache import ArtifactCache
 from eats.Config import Config
-from eats.DockerUtility import build_docker_image
-from eats.Evaluate import create_reports
+from eats.ContainerPool import ContainerPool
+from eats.DockerUtility import (TaskLimits, build_docker_image, set_container_pool, set_execution_backend,
+                                set_resource_scheduler, set_task_limits)
+from eats.Evaluate import create_cov_report, evaluate_with_mutmut, report_mutmut_results
+from eats.ExecutionBackend import DockerBackend
 from eats.GenerateTestWithPynguin import create_test_with_pynguin
-from eats.ImproveUseFuzzer import ImproveUseFuzzer
+from eats.ImproveUseFuzzer import ImproveUseFuzzer, run_transform_batch
+from eats.LocalBackend import LocalBackend
+from eats.LogCapture import configure_log_capture
+from eats.Manifest import Manifest, config_fingerprint
+from eats.Pipeline import PipelineScheduler, PipelineTask
+from eats.RemoteBackend import RemoteBackend, source_id
+from eats.ResourceScheduler import ResourceScheduler
+from eats.Trace import Tracer, export_chrome_trace, get_tracer, new_trace_path, set_tracer, summarize
+from eats.Worker import Worker
 
 
 def main(config: Config) -> int:
@@ -32,59 +47,277 @@ def main(config: Config) -> int:
     if not os.path.exists(os.path.join(config.working_dir, "logs")):
         os.makedirs(os.path.join(config.working_dir, "logs"))
     
-    image, logs = build_docker_image(config.TARGET_PROGRAM_ROOT, 
-                                     "eats:latest",
-                                     f"{config.working_dir}/logs/build.log")
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=config.MAX_WORKERS) as executor:
-        futures = [executor.submit(create_test_with_pynguin,
-                                   module,
-                                   config.working_dir,
-                                   config.max_pynguin_search_time_first_search,
-                                   config.max_pynguin_iterations_first_search)
-                   for module in config.module_names]
-        concurrent.futures.wait(futures)
-        [future.result() for future in futures]  # Check for exceptions
-        
-        create_reports(config.working_dir, 
-                       config.module_names, 
-                       [f'{config.working_dir}/tests/pynguin_results'], 
-                       "report1", 
-                       config.max_mutmut_time + 300, 
-                       config.MAX_WORKERS)
-        if not config.imprve_with_fuzzing:
-            return 0
-        pendings = [ImproveUseFuzzer(module,
-                                    config.working_dir, 
+    configure_log_capture(config.max_log_bytes, config.log_backup_count)
+    trace_path = new_trace_path(os.path.join(config.working_dir, "logs"))
+    set_tracer(Tracer(trace_path))
+    span = get_tracer().start("build", "build")
+    backend = None
+    if config.execution_backend == 'local':
+        backend = LocalBackend(config.local_backend_dir, config.TARGET_PROGRAM_ROOT, config.local_python)
+        environment_id = backend.prepare(f"{config.working_dir}/logs/build.log")
+        set_execution_backend(backend)
+    elif config.execution_backend == 'remote':
+        backend = RemoteBackend(config.coordinator_address,
+                                config.coordinator_authkey,
+                                source_id(config.TARGET_PROGRAM_ROOT),
+                                f"{config.working_dir}/.remote_jobs",
+                                config.worker_heartbeat_timeout)
+        backend.start()
+        environment_id = f"remote-{backend.source_id}"
+        set_execution_backend(backend)
+    else:
+        image, logs = build_docker_image(config.TARGET_PROGRAM_ROOT, 
+                                         "eats:latest",
+                                         f"{config.working_dir}/logs/build.log",
+                                         buildkit=config.docker_buildkit)
+        environment_id = image.id
+    get_tracer().finish(span)
+
+    cache = None
+    if config.artifact_cache_dir:
+        cache = ArtifactCache(os.path.abspath(config.artifact_cache_dir),
+                              config.artifact_cache_max_bytes,
+                              config.TARGET_PROGRAM_ROOT,
+                              environment_id)
+
+    pool = None
+    if config.container_pool_size > 0 and backend is None:
+        host_roots = [config.working_dir]
+        if _mutmut_state_dir(config):
+            host_roots.append(_mutmut_state_dir(config))
+        pool = ContainerPool("eats:latest",
+                             host_roots,
+                             f"{config.working_dir}/.container_pool",
+                             max_jobs_per_worker=config.container_pool_max_jobs,
+                             max_idle_workers=config.container_pool_size)
+        set_container_pool(pool)
+
+    resources = None
+    # The containers of the remote backend run on the workers, not on this machine.
+    if (config.resource_admission or config.resource_sampling) and config.execution_backend != 'remote':
+        resources = ResourceScheduler(config.resource_cpus,
+                                      config.resource_mem_bytes,
+                                      config.resource_profile,
+                                      config.resource_limits,
+                                      admit=config.resource_admission)
+        set_resource_scheduler(resources)
+    limits = TaskLimits(config.MAX_WORKERS, config.task_type_limits)
+    set_task_limits(limits)
+    manifest = Manifest(os.path.join(config.working_dir, "manifest.jsonl"),
+                        config_fingerprint(config, environment_id))
+    try:
+        return asyncio.run(_run_pipeline(config, cache, manifest))
+    finally:
+        set_task_limits(None)
+        limits.shutdown()
+        if resources is not None:
+            set_resource_scheduler(None)
+            resources.save_profile()
+        if cache is not None:
+            cache.log_stats()
+        _write_trace_report(trace_path)
+        if pool is not None:
+            set_container_pool(None)
+            pool.shutdown()
+        if backend is not None:
+            set_execution_backend(None)
+            backend.shutdown()
+
+
+def run_worker(config: Config, address: str='', slots: int=0) -> int:
+    """
+    Run the tasks of a coordinator with the worker_backend of the configuration.
+
+    Args:
+        config (Config): Configuration object.
+        address (str, optional): HOST:PORT of the coordinator, overriding coordinator_address. Defaults to ''.
+        slots (int, optional): Number of tasks run in parallel, overriding worker_slots. Defaults to 0.
+
+    Returns:
+        int: Exit code.
+    """
+    address = address or config.coordinator_address
+    if not address or not config.coordinator_authkey:
+        logging.error("A worker needs coordinator_address and coordinator_authkey")
+        return 1
+    os.makedirs(config.worker_dir, exist_ok=True)
+    if config.worker_backend == 'local':
+        backend = LocalBackend(config.local_backend_dir, config.TARGET_PROGRAM_ROOT, config.local_python)
+        imageid = backend.prepare(f"{config.worker_dir}/build.log")
+    else:
+        image, logs = build_docker_image(config.TARGET_PROGRAM_ROOT,
+                                         "eats:latest",
+                                         f"{config.worker_dir}/build.log",
+                                         buildkit=config.docker_buildkit)
+        imageid = image.id
+        backend = DockerBackend()
+    worker = Worker(address,
+                    config.coordinator_authkey,
+                    backend,
+                    imageid,
+                    source_id(config.TARGET_PROGRAM_ROOT),
+                    f"{config.worker_dir}/jobs",
+                    slots or config.worker_slots or multiprocessing.cpu_count())
+    try:
+        worker.run()
+    finally:
+        backend.shutdown()
+    return 0
+
+
+async def _run_pipeline(config: Config, cache: typing.Optional[ArtifactCache]=None,
+                        manifest: typing.Optional[Manifest]=None) -> int:
+    """
+    Run the Pynguin, fuzzing and report steps of every module as tasks on the event loop.
+
+    Args:
+        config (Config): Configuration object.
+        cache (ArtifactCache, optional): Cache of phase outputs. Defaults to None.
+        manifest (Manifest, optional): Completion manifest of the tasks; with config.resume,
+            completed tasks are skipped. Defaults to None.
+
+    Returns:
+        int: Exit code.
+    """
+    scheduler = PipelineScheduler(manifest=manifest, resume=config.resume)
+    pynguin_tasks = {module: scheduler.add_task(f"pynguin:{module}",
+                                                functools.partial(create_test_with_pynguin,
+                                                                  module,
+                                                                  config.working_dir,
+                                                                  config.max_pynguin_search_time_first_search,
+                                                                  config.max_pynguin_iterations_first_search,
+                                                                  cache))
+                     for module in config.module_names}
+
+    # report1 only needs the first Pynguin run, so it runs next to the fuzzing work.
+    _add_report_tasks(scheduler, config, "report1", [f'{config.working_dir}/tests/pynguin_results'],
+                      pynguin_tasks.values())
+
+    if config.improve_with_fuzzing:
+        fuzzers = [ImproveUseFuzzer(module,
+                                    config.working_dir,
                                     config.max_fuzz_time,
                                     config.max_fuzz_iterations,
                                     config.max_pynguin_search_time_second_search,
                                     config.max_pynguin_iterations_second_search,
-                                    config.max_mutmut_time) 
-                    for module in config.module_names]
-    
-        futures = [executor.submit(p.run_transform) for p in pendings]
-        concurrent.futures.wait(futures)
-        [future.result() for future in futures]  # Check for exceptions
-
-        fuzzs = []
-        for p in pendings:
-            fuzzs += p.create_fuzz_runner()
-        futures = [executor.submit(f) for f in fuzzs]
-        concurrent.futures.wait(futures)
-        [future.result() for future in futures]  # Check for exceptions
-
-        futures = [executor.submit(p.run_recreation_results) for p in pendings]
-        concurrent.futures.wait(futures)
-        [future.result() for future in futures]  # Check for exceptions
-        futures = [executor.submit(p.run_pynguin) for p in pendings]
-        concurrent.futures.wait(futures)
-        [future.result() for future in futures]  # Check for exceptions
-        create_reports(config.working_dir, 
-                       config.module_names, 
-                       [f'{config.working_dir}/tests/pynguin_results', f'{config.working_dir}/tests/finial_pynguin_results'], 
-                       "report2", 
-                       config.max_mutmut_time + 300, 
-                       config.MAX_WORKERS)
-        logging.info("Finished creating reports")
+                                    config.max_mutmut_time,
+                                    cache,
+                                    config.format_generated_code,
+                                    config.fuzz_harnesses_per_container,
+                                    config.fuzz_plateau_time,
+                                    config.fuzz_budget,
+                                    config.fuzz_max_cases,
+                                    config.fuzz_decode_workers)
+                   for module in config.module_names]
+        if config.batch_transform:
+            transform = scheduler.add_task("transform",
+                                           functools.partial(run_transform_batch,
+                                                             fuzzers,
+                                                             config.working_dir,
+                                                             config.max_mutmut_time),
+                                           deps=pynguin_tasks.values())
+        for p in fuzzers:
+            if not config.batch_transform:
+                transform = scheduler.add_task(f"transform:{p.module}", p.run_transform,
+                                               deps=[pynguin_tasks[p.module]])
+            scheduler.add_task(f"schedule_fuzz:{p.module}",
+                               functools.partial(_schedule_fuzzing, scheduler, p, [transform]),
+                               deps=[transform],
+                               resumable=False)
+
+    await scheduler.run()  # Raises the first exception of any task
+    if not config.improve_with_fuzzing:
+        return 0
+
+    # Added once the fuzzing steps, which are scheduled while the pipeline runs, have finished.
+    _add_report_tasks(scheduler, config, "report2",
+                      [f'{config.working_dir}/tests/pynguin_results', f'{config.working_dir}/tests/finial_pynguin_results'],
+                      scheduler.tasks())
+    await scheduler.run()
+    logging.info("Finished creating reports")
     return 0
+
+
+def _add_report_tasks(scheduler: PipelineScheduler, config: Config, out_folder: str, paths_to_tests: typing.List[str],
+                      deps: typing.Iterable[PipelineTask]) -> PipelineTask:
+    """
+    Add the coverage report, the mutmut run of every module and the mutmut report of a test
+    suite as separate tasks, so a resumed run only repeats the modules mutmut had not finished.
+
+    Args:
+        scheduler (PipelineScheduler): Pipeline scheduler.
+        config (Config): Configuration object.
+        out_folder (str): Output folder of the reports, e.g. report1.
+        paths_to_tests (List[str]): Paths to the tests of the suite.
+        deps (Iterable[PipelineTask]): Tasks creating the tests.
+
+    Returns:
+        PipelineTask: The task writing the mutmut report.
+    """
+    timeout = config.max_mutmut_time + 300
+    coverage = scheduler.add_task(f"coverage:{out_folder}",
+                                  functools.partial(create_cov_report,
+                                                    config.working_dir,
+                                                    timeout,
+                                                    out_folder,
+                                                    paths_to_tests,
+                                                    config.coverage_shards),
+                                  deps=deps)
+    state_dir = _mutmut_state_dir(config)
+    mutmuts = [scheduler.add_task(f"mutmut:{module}:{out_folder}",
+                                  functools.partial(evaluate_with_mutmut,
+                                                    module,
+                                                    config.working_dir,
+                                                    timeout,
+                                                    out_folder,
+                                                    paths_to_tests,
+                                                    os.path.join(state_dir, out_folder, module) if state_dir else None,
+                                                    config.mutmut_skip_uncovered),
+                                  deps=[coverage])
+               for module in config.module_names]
+    return scheduler.add_task(out_folder,
+                              functools.partial(report_mutmut_results,
+                                                config.working_dir,
+                                                timeout,
+                                                config.module_names,
+                                                out_folder),
+                              deps=mutmuts)
+
+
+def _write_trace_report(trace_path: str) -> None:
+    """
+    Close the trace, export it for chrome://tracing or Perfetto and log its summary.
+    """
+    get_tracer().close()
+    set_tracer(None)
+    if not os.path.exists(trace_path):
+        return
+    export_chrome_trace(trace_path, trace_path[:-len('.jsonl')] + '.chrome.json')
+    logging.info("Trace summary:\n" + summarize(trace_path))
+
+
+def _mutmut_state_dir(config: Config) -> typing.Optional[str]:
+    """
+    Directory keeping the mutant verdicts between runs, next to the artifact cache.
+    """
+    if not config.artifact_cache_dir:
+        return None
+    return os.path.join(os.path.abspath(config.artifact_cache_dir), 'mutmut')
+
+
+async def _schedule_fuzzing(scheduler: PipelineScheduler, p: ImproveUseFuzzer,
+                      after: typing.Sequence[PipelineTask]=()) -> None:
+    """
+    Add the fuzz, recreation and second Pynguin steps of a module to the pipeline
+    once its transform step has finished.
+
+    Args:
+        scheduler (PipelineScheduler): Running pipeline scheduler.
+        p (ImproveUseFuzzer): Fuzzer of the module.
+        after (Sequence[PipelineTask], optional): Finished tasks the fuzz steps are recorded to
+            depend on in the trace. Defaults to ().
+    """
+    fuzzs = [scheduler.add_task(f"fuzz:{p.module}:{i}", f, deps=after)
+             for i, f in enumerate(p.create_fuzz_runner())]
+    recreation = scheduler.add_task(f"recreation:{p.module}", p.run_recreation_results, deps=fuzzs)
+    scheduler.add_task(f"final_pynguin:{p.module}", p.run_pynguin, deps=[recreation])
@@ -1,28 +1,120 @@
-import glob
+import hashlib
 import os
+import re
 import typing
 
+HASH_IGNORED_DIRS = {'.git', '__pycache__', '.mypy_cache', '.pytest_cache', '.tox'}
 
-def _module_find_all(PROJECT_ROOT: str, path_to_modules: str) -> typing.List[str]:
+
+GLOB_SPECIAL = set('*?[')
+
+
+def _glob_regex(pattern: str) -> str:
     """
-    Find all Python modules in the specified path.
+    Translate a recursive glob pattern relative to the project root into a regular expression.
+
+    Like `glob.glob(recursive=True)`, `**` as a whole component matches any number of
+    directories, `*`, `?` and `[...]` stay within one component, and wildcards do not
+    match names starting with a dot.
 
     Args:
-        PROJECT_ROOT (str): The root directory of the project.
-        path_to_modules (str): The glob pattern to find the modules.
+        pattern (str): Glob pattern with '/' separators.
 
     Returns:
-        List[str]: A sorted list of module names.
+        str: Regular expression matching the whole relative path.
     """
-    modules = []
-    for file in glob.glob(path_to_modules, recursive = True):
-        if not file.endswith(".py"):
+    parts = pattern.split('/')
+    regex = ''
+    for i, part in enumerate(parts):
+        last = i == len(parts) - 1
+        if part == '**':
+            regex += r'(?:(?!\.)[^/]+(?:/(?!\.)[^/]+)*)?' if last else r'(?:(?!\.)[^/]+/)*'
             continue
-        subpath = os.path.relpath(file, PROJECT_ROOT)
-        moduleName = subpath.replace("/", ".")[:-3]
-        if moduleName not in modules:
-            modules.append(moduleName)
-    modules = sorted(modules)
+        if not part.startswith('.'):
+            regex += r'(?!\.)'
+        j = 0
+        while j < len(part):
+            c = part[j]
+            if c == '*':
+                regex += '[^/]*'
+            elif c == '?':
+                regex += '[^/]'
+            elif c == '[':
+                # A ']' right after '[' or '[!' belongs to the set.
+                start = j + 1
+                if part[start:start + 1] == '!':
+                    start += 1
+                if part[start:start + 1] == ']':
+                    start += 1
+                end = part.find(']', start)
+                if end == -1:
+                    regex += re.escape(c)
+                else:
+                    body = part[j + 1:end].replace('\\', '\\\\')
+                    regex += '[^' + body[1:] + ']' if body.startswith('!') else '[' + body + ']'
+                    j = end
+            else:
+                regex += re.escape(c)
+            j += 1
+        if not last:
+            regex += '/'
+    return regex
+
+
+def _walk_roots(patterns: typing.List[str]) -> typing.List[str]:
+    """
+    Directories below which the patterns can match: the literal leading directories of
+    every pattern, leaving out directories below another root.
+    """
+    roots = set()
+    for pattern in patterns:
+        parts = pattern.split('/')[:-1]
+        literal = []
+        for part in parts:
+            if GLOB_SPECIAL & set(part):
+                break
+            literal.append(part)
+        roots.add('/'.join(literal))
+    result = []
+    for root in sorted(roots):
+        if not any(root == r or root.startswith(r + '/') or r == '' for r in result):
+            result.append(root)
+    return result
+
+
+def module_paths(PROJECT_ROOT: str, path_to_modules: typing.List[str], ignores: typing.List[str]=None) -> typing.Dict[str, str]:
+    """
+    Find the Python modules matching any of the glob patterns and none of the ignored patterns.
+
+    The project is walked once below the literal leading directories of the patterns, and
+    every file is matched against all patterns at once.
+
+    Args:
+        PROJECT_ROOT (str): The root directory of the project.
+        path_to_modules (List[str]): List of glob patterns to find the modules.
+        ignores (List[str], optional): List of glob patterns to ignore. Defaults to None.
+
+    Returns:
+        Dict[str, str]: Path to the file of every module name.
+    """
+    patterns = [os.path.relpath(p, PROJECT_ROOT).replace(os.sep, '/') for p in path_to_modules]
+    if not patterns:
+        return {}
+    includes = re.compile('|'.join(f'(?:{_glob_regex(p)})' for p in patterns) + r'\Z')
+    ignored = [os.path.relpath(p, PROJECT_ROOT).replace(os.sep, '/') for p in ignores or []]
+    excludes = re.compile('|'.join(f'(?:{_glob_regex(p)})' for p in ignored) + r'\Z') if ignored else None
+
+    modules = {}
+    for root in _walk_roots(patterns):
+        for dirpath, dirnames, filenames in os.walk(os.path.join(PROJECT_ROOT, root)):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            for filename in filenames:
+                if not filename.endswith('.py'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                subpath = os.path.relpath(path, PROJECT_ROOT).replace(os.sep, '/')
+                if includes.match(subpath) and not (excludes and excludes.match(subpath)):
+                    modules[subpath.replace("/", ".")[:-3]] = path
     return modules
 
 
@@ -36,13 +128,56 @@ def module_find(PROJECT_ROOT: str, path_to_modules: typing.List[str], ignores: t
         ignores (List[str], optional): List of glob patterns to ignore. Defaults to None.
 
     Returns:
-        List[str]: A list of module names that are not in the ignored paths.
-    """
-    modules = []
-    ignores_ = []
-    for path_to_module in path_to_modules:
-        modules += _module_find_all(PROJECT_ROOT, path_to_module)
-    if ignores:
-        for ignore in ignores:
-            ignores_ += _module_find_all(PROJECT_ROOT, ignore)
-    return [module for module in modules if module not in ignores_]
+        List[str]: A sorted list of module names that are not in the ignored paths.
+    """
+    return sorted(module_paths(PROJECT_ROOT, path_to_modules, ignores))
+
+
+def hash_tree(hasher, root: str) -> None:
+    """
+    Update a hash object with the relative paths and contents of every file below a directory.
+
+    Args:
+        hasher: Hash object from hashlib.
+        root (str): Directory to hash. A single file is hashed as well.
+    """
+    if os.path.isfile(root):
+        hash_file(hasher, root)
+        return
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in HASH_IGNORED_DIRS)
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            hasher.update(os.path.relpath(path, root).encode())
+            hash_file(hasher, path)
+
+
+def hash_file(hasher, path: str) -> None:
+    """
+    Update a hash object with the contents of a file.
+
+    Args:
+        hasher: Hash object from hashlib.
+        path (str): Path to the file.
+    """
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            hasher.update(block)
+
+
+def hash_paths(paths: typing.List[str]) -> str:
+    """
+    Compute the sha256 of several files or directories.
+
+    Args:
+        paths (List[str]): Files or directories to hash, missing paths are skipped.
+
+    Returns:
+        str: Hex digest.
+    """
+    hasher = hashlib.sha256()
+    for i, path in enumerate(paths):
+        hasher.update(f"\0{i}\0".encode())
+        if os.path.exists(path):
+            hash_tree(hasher, path)
+    return hasher.hexdigest()